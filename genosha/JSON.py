@@ -36,6 +36,10 @@ only a single object).  The JSON output contains a JSON-list with three elements
     2. a list of genosha-marshalled objects.
     3. the object reference of the 'root' object passed into the dump/dumps call.
 
+and, when the ``interned`` option is given, a fourth:
+
+    4. the string table: a list of the strings referred to by their index.
+
 The marshalled ``GenoshaObject``s provide the information necessary to reconstruct the
 object.  In JSON expression, this is represented as a dict with some specially-named keys
 (in order to be obvious in avoiding collisions with non-genosha JSON objects):
@@ -46,15 +50,38 @@ object.  In JSON expression, this is represented as a dict with some specially-n
     - ``@i`` indicates the "contents" of the object (list elements, dict entries, etc.)
     - ``@o`` is used for instance methods to indicate the reference ID of the bound instance
     - ``@a`` is used for to identify special attributes on an object (e.g. @classmethods)
+    - ``@c`` holds the field values of a columnar block of instances (written when the
+      ``columnar`` option is given), one list per field; ``@id`` is then the list of
+      the instances' reference numbers
 
 In JSON expressions, ``GenoshaReference``s are represented by special string values
 
     "<@``id``@>" where ``id`` is the locally-unique object identifier.
+
+and references to the strings in the string table (``GenoshaInterned``) by
+
+    "<#``index``#>" where ``index`` is the string's place in the table.
+
+(Strings of the marshalled objects that begin with "<" have another "<" added.)
+
+A ``GenoshaPacked`` run of primitives (the contents of an array or bytearray, or a list
+packed with the ``packed`` option) is a dict of ``@p``, the type and size of the values
+(e.g. "<f8"), and ``@b``, the packed bytes base64-encoded.
+
+``dump`` and ``dumps`` encode the records a batch at a time as the graph is walked, each
+turned into the dict of its JSON expression only as its batch is written (see
+``_json_record``), so the records still waiting are held as ``GenoshaObject``s (unless
+``cls`` or ``indent`` is given, or ``stats``, which encode each through the ``default``
+hook).
+
+``loads`` and ``load`` given ``compact`` add each object to a ``GenoshaTable`` as soon as
+it is read, rather than holding them all as ``GenoshaObject``s until the end.
 """
 try :
     import simplejson as json
 except :
     import json
+import base64
 
 from genosha import *
 
@@ -62,24 +89,28 @@ __version__ = "0.1"
 __author__ = "Shawn Sulma <genosha@470th.org>"
 __all__ = [ 'marshal', 'unmarshal', 'dumps', 'dump', 'loads', 'load' ]
 
-def marshal( o ) :
+def marshal( o, **options ) :
     r"""Prepares the passed object for expression as JSON output.  The ``string_hook``,
-    and ``reference_hook`` of ``GenoshaObject`` are used."""
-    return GenoshaEncoder( string_hook = _json_escape_string, reference_hook = _json_reference ).marshal( o )
+    and ``reference_hook`` of ``GenoshaObject`` are used; ``options`` are passed on to the
+    ``GenoshaEncoder``."""
+    return _encoder( **options ).marshal( o )
 
-def unmarshal( o ) :
+def unmarshal( o, stats = None, defaults = False, lazy = False, path = None, ordered = True ) :
     r"""Translates a reconstructed JSON object into a Genosha structure, making use of
-    GenoshaDecoder's ``string_hook``."""
-    return GenoshaDecoder( string_hook = _json_unescape_string ).unmarshal( o )
+    GenoshaDecoder's ``string_hook``.  ``stats``, ``defaults``, ``lazy`` and ``ordered`` are
+    passed on to the ``GenoshaDecoder``; given a ``path`` only the part of the graph there
+    is converted (see ``GenoshaDecoder.unmarshal``)."""
+    return GenoshaDecoder( string_hook = _json_unescape_string, stats = stats, defaults = defaults, lazy = lazy, ordered = ordered ).unmarshal( o, path )
 
 def dumps ( o, **kwargs ) :
     r"""Dump the passed object ``o`` (and its refererred object graph) as a JSON string which
     is returned.  The keyword arguments are the same as those accepted by the
     ``dumps`` function in :mod:`json` (or :mod:`simplejson`), with the exception of the
     ``default`` argument which is used to hook in conversion of GenoshaObject JSON
-    expressions back to GenoshaObjects.
+    expressions back to GenoshaObjects.  ``GenoshaEncoder`` options (e.g. ``columnar``)
+    may be given as well; with ``stats`` the sizes of the records' text are included.
     """
-    return json.dumps( marshal(o), default = _genosha_to_json, **kwargs )
+    return "".join( _iterdump( o, **kwargs ) )
 
 def dump ( o, f, **kwargs ) :
     r"""Dump the passed object ``o`` (and its refererred object graph) as a JSON expression
@@ -87,43 +118,134 @@ def dump ( o, f, **kwargs ) :
     keyword arguments are the same as those accepted by the ``dump`` function in
     :mod:`json` (or :mod:`simplejson`), with the exception of the
     ``default`` argument which is used to hook in conversion of GenoshaObject JSON
-    expressions back to GenoshaObjects."""
-    json.dump( marshal(o), f, default = _genosha_to_json, **kwargs )
+    expressions back to GenoshaObjects.  ``GenoshaEncoder`` options may be given as well.
+    The output is written as it is produced, a batch of objects at a time (unless ``indent``
+    is given, which lays the document out as a whole)."""
+    for chunk in _iterdump( o, **kwargs ) :
+        f.write( chunk )
 
-def loads ( s, **kwargs ) :
+def loads ( s, compact = False, stats = None, defaults = False, lazy = False, path = None, ordered = True, **kwargs ) :
     r"""Convert the passed JSON expression ``s`` back into Python objects with their
     cross references restored.  The keyword arguments accepted are the same as those
     accepted by the ``loads`` function in :mod:`json` (or :mod:`simplejson`) with the
     exception of ``object_hook`` which is used to convert the JSON expression of a
-    ``GenoshaObject`` back into a Python representational object."""
-    return unmarshal( json.loads( s, object_hook = _json_to_genosha, **kwargs ) )
+    ``GenoshaObject`` back into a Python representational object.  ``compact`` if true
+    gathers the objects into a ``GenoshaTable`` as they are read; ``stats``, ``defaults``,
+    ``lazy``, ``path`` and ``ordered`` are as for ``unmarshal``."""
+    return unmarshal( _load( json.loads, s, compact, kwargs ), stats, defaults, lazy, path, ordered )
 
-def load ( f, **kwargs ) :
+def load ( f, compact = False, stats = None, defaults = False, lazy = False, path = None, ordered = True, **kwargs ) :
     r"""Convert the passed JSON expression present in the file-like object ``f`` (which
     has a .read method) back into Python objects with their cross references restored.
     The keyword arguments accepted are the same as those accepted by the ``load``
     function in :mod:`json` (or :mod:`simplejson`) with the exception of ``object_hook``
     which is used to convert the JSON expression of a ``GenoshaObject`` back into a
-    Python representational object."""
-    return unmarshal( json.load( f, object_hook = _json_to_genosha, **kwargs ) )
+    Python representational object.  The other arguments are as for ``loads``."""
+    return unmarshal( _load( json.load, f, compact, kwargs ), stats, defaults, lazy, path, ordered )
 
-_jsonmap = ( ( 'type', "@t" ), ( 'oid', "@id" ), ( 'fields', "@f" ), ( 'items', "@i" ), ( 'instance', "@o" ), ( 'attribute', "@a" ) )
+def _load ( load, source, compact, kwargs ) :
+    # the Genosha structure read by ``load``; with ``compact`` each object (everything with an
+    # "@id") goes into a table as it is read, leaving ``_LISTED`` in its place in the list.
+    if not compact :
+        return load( source, object_hook = _json_to_genosha, **kwargs )
+    table = GenoshaTable()
+    def hook ( data ) :
+        obj = _json_to_genosha( data )
+        if type( obj ) is GenoshaObject and hasattr( obj, 'oid' ) :
+            table.append( obj )
+            return _LISTED
+        return obj
+    out = load( source, object_hook = hook, **kwargs )
+    try :
+        if len( out[1] ) != len( table ) or out[1].count( _LISTED ) != len( table ) :
+            raise ValueError, "Malformed input: objects outside the list of them."
+    except ( IndexError, TypeError ) :
+        raise ValueError, "Malformed input."
+    out[1] = table
+    return out
+
+def _encoder ( **options ) :
+    return GenoshaEncoder( string_hook = _json_escape_string, reference_hook = _json_reference, interned_hook = _json_interned, **options )
+
+def _iterdump ( o, cls = None, separators = None, **kwargs ) :
+    # the JSON text of ``o`` in pieces, each object encoded as soon as ``marshal_iter`` is done
+    # with it: with the default encoder, ``_BATCH`` of them at a time (unless their sizes are
+    # wanted for ``stats``).
+    options, kwargs = split_options( kwargs )
+    direct = cls is None and kwargs.get( 'indent' ) is None
+    encoder = _encoder( **options )
+    records = encoder.marshal_iter( o )
+    encode = ( cls or json.JSONEncoder )( default = _genosha_to_json, separators = separators, **kwargs ).encode
+    comma = separators[0] if separators else ", "
+    payload = records.next()
+    stats = encoder.stats
+    if kwargs.get( 'indent' ) is not None :
+        # laid out as a whole, as :mod:`json` lays out a document, so written at the end.
+        listed = []
+        for record in records :
+            if stats :
+                stats.add_size( record, len( encode( record ) ) )
+            listed.append( record )
+        document = [ SENTINEL, listed, payload ] + ( [ encoder.strings ] if encoder.interned else [] )
+        yield encode( document )
+        return
+    yield "[" + encode( SENTINEL ) + comma + "["
+    separator = ""
+    if direct and not stats :
+        batch = []
+        for record in records :
+            batch.append( _json_record( record ) )
+            if len( batch ) == _BATCH :
+                yield separator + encode( batch )[1:-1]
+                separator = comma
+                batch = []
+        if batch :
+            yield separator + encode( batch )[1:-1]
+            separator = comma
+    for record in records :
+        chunk = encode( record )
+        if stats :
+            stats.add_size( record, len( chunk ) )
+        yield separator + chunk
+        separator = comma
+    yield "]" + comma + encode( payload )
+    if encoder.interned :
+        yield comma + encode( encoder.strings )
+    yield "]"
+
+# the place of an object read into a ``GenoshaTable``.
+_LISTED = object()
+
+_jsonmap = ( ( 'type', "@t" ), ( 'oid', "@id" ), ( 'fields', "@f" ), ( 'items', "@i" ), ( 'instance', "@o" ), ( 'attribute', "@a" ), ( 'columns', "@c" ) )
 _jsonunmap = dict( ( e[1], e[0] ) for e in _jsonmap )
 
+# the number of records encoded together by ``dump`` and ``dumps``.
+_BATCH = 256
+
+def _json_record ( out ) :
+    # the JSON expression of the record ``out``.
+    d = {}
+    for name, key in _jsonmap :
+        if hasattr( out, name ) :
+            d[key] = getattr( out, name )
+    return d
+
 def _genosha_to_json( obj ) :
     if isinstance( obj, GenoshaObject ) :
-        d = {}
-        for fr, to in _jsonmap :
-            if hasattr( obj, fr ) :
-                d[to] = getattr( obj, fr )
-        return d
+        return _json_record( obj )
     if isinstance( obj, GenoshaReference ) :
         return str( obj )
+    if isinstance( obj, GenoshaPacked ) :
+        return { "@p" : obj.format, "@b" : base64.b64encode( obj.data ) }
+    if isinstance( obj, GenoshaTable ) :
+        return list( obj )
     raise TypeError, repr( obj.__class__ )
 
 def _json_to_genosha( data ) :
     if "@o" in data or "@t" in data :
         return GenoshaObject( **dict( ( _jsonunmap[k], v ) for k, v in data.items() ) )
+    if "@p" in data :
+        return GenoshaPacked( data["@p"], base64.b64decode( data["@b"] ) )
     return data # fall back to returning the dictionary.
 
 def _json_escape_string ( obj, root = False ) :
@@ -135,8 +257,13 @@ def _json_unescape_string ( self, obj ) :
     if len( obj ) and obj[0] == "<" :
         if obj[1] == "@" :
             return self._unmarshal( GenoshaReference( int( obj.split( '@' )[-2] ) ) )
+        if obj[1] == "#" :
+            return self._unmarshal( GenoshaInterned( int( obj[2:-2] ) ) )
         return obj[1:]
     return obj
 
 def _json_reference ( oid ) :
     return "<@%d@>" % oid
+
+def _json_interned ( index ) :
+    return "<#%d#>" % index
@@ -29,36 +29,49 @@ To be sure: this implementation is incredibly inefficient in its use of SQL; a r
 would combine inserts or selects for greater efficiency."""
 from __future__ import with_statement
 
-from genosha import GenoshaObject, GenoshaReference, GenoshaEncoder, GenoshaDecoder
+from genosha import GenoshaObject, GenoshaReference, GenoshaInterned, GenoshaPacked, GenoshaTable, GenoshaEncoder, GenoshaDecoder, SENTINEL
 
-import sqlite3
+import sqlite3, types
 
 __version__ = "0.1"
 __author__ = "Shawn Sulma <genosha@470th.org>"
 __all__ = [ 'marshal', 'unmarshal', 'dumpc', 'dump', 'loadc', 'load' ]
 
-def marshal ( obj, cursor ) :
-    _m = GenoshaEncoder().marshal( obj )
+def marshal ( obj, cursor, **options ) :
+    # objects are inserted as the encoder finishes with them rather than all at once.
+    if options.get( 'columnar' ) :
+        raise ValueError, "The columnar option is not supported by the SQL serialization."
+    encoder = GenoshaEncoder( **options )
+    records = encoder.marshal_iter( obj )
+    payload = records.next()
     ids = get_start_ids( cursor )
-    id = encode( _m, cursor, ids )
+    # the string table is complete by the time it is reached, after the records.
+    id = encode( [ SENTINEL, records, payload ] + ( [ encoder.strings ] if encoder.interned else [] ), cursor, ids )
     return id
 
-def unmarshal ( id, cursor ) :
-    _d = decode( cursor, id )
-    return GenoshaDecoder().unmarshal( _d )
+def unmarshal ( id, cursor, compact = False, stats = None, defaults = False, lazy = False, path = None, ordered = True ) :
+    if compact :
+        # the objects are gathered into a table as they are read.
+        parts = sequence_ids( cursor, id )
+        _d = [ decode( cursor, parts[0] ), decode_table( cursor, parts[1] ) ] + [ decode( cursor, part ) for part in parts[2:] ]
+    else :
+        _d = decode( cursor, id )
+    return GenoshaDecoder( stats = stats, defaults = defaults, lazy = lazy, ordered = ordered ).unmarshal( _d, path )
 
-def dump ( o, fn ) :
-    r"""Dump the passed object ``o`` (and its refererred object graph) to the sqlite db identified by ``fn``."""
+def dump ( o, fn, **options ) :
+    r"""Dump the passed object ``o`` (and its refererred object graph) to the sqlite db identified by ``fn``.
+    ``options`` are passed on to the ``GenoshaEncoder`` (except ``columnar``, which raises ValueError); packed
+    values are stored as BLOBs, and references to the string table as 'interned' items holding the index."""
     conn = sqlite3.connect( fn )
     try :
         with conn :
-            dumpc( o, conn )
+            dumpc( o, conn, **options )
     finally :
         conn.close()
 
-def dumpc ( o, conn ) :
+def dumpc ( o, conn, **options ) :
     r"""Dump the passed object ``o`` (and its refererred object graph) to the passed sqlite connection object.  It does not commit the transaction."""
-    return marshal( o, conn.cursor() )
+    return marshal( o, conn.cursor(), **options )
 
 def load ( i, fn ) :
     r"""Load the object graph stored in the database named by ``fn``, starting at the item id ``i``."""
@@ -69,9 +82,12 @@ def load ( i, fn ) :
     finally :
         conn.close()
 
-def loadc ( i, conn ) :
-    r"""Load the object graph stored in the database accessed through the ``conn`` connection object."""
-    return unmarshal( i, conn.cursor() )
+def loadc ( i, conn, compact = False, stats = None, defaults = False, lazy = False, path = None, ordered = True ) :
+    r"""Load the object graph stored in the database accessed through the ``conn`` connection object.
+    ``compact`` if true reads the objects into a ``GenoshaTable`` rather than a list of them; ``stats``,
+    ``defaults``, ``lazy`` and ``ordered`` are passed on to the ``GenoshaDecoder``, and given a ``path``
+    only the part of the graph there is loaded (see ``GenoshaDecoder.unmarshal``)."""
+    return unmarshal( i, conn.cursor(), compact, stats, defaults, lazy, path, ordered )
 
 
 def encode( data, cursor, ids ) :
@@ -132,7 +148,21 @@ def encode_reference ( data, cursor, ids ) :
     cursor.execute( "INSERT INTO ITEM ( item_id, type, data ) values ( ?, ?, ? )", [ item_id, 'reference', data.oid ] )
     return item_id
 
-encoders = { GenoshaObject : encode_object, GenoshaReference : encode_reference, list : encode_list, dict : encode_dict }
+def encode_interned ( data, cursor, ids ) :
+    ids[2] += 1
+    item_id = ids[2]
+    cursor.execute( "INSERT INTO ITEM ( item_id, type, data ) values ( ?, ?, ? )", [ item_id, 'interned', data.index ] )
+    return item_id
+
+def encode_packed ( data, cursor, ids ) :
+    # a single BLOB of the format, a space and the packed bytes.
+    ids[2] += 1
+    item_id = ids[2]
+    cursor.execute( "INSERT INTO ITEM ( item_id, type, data ) values ( ?, ?, ? )", [ item_id, 'packed', sqlite3.Binary( data.format + " " + str( data.data ) ) ] )
+    return item_id
+
+encoders = { GenoshaObject : encode_object, GenoshaReference : encode_reference, list : encode_list, dict : encode_dict
+    , types.GeneratorType : encode_list, GenoshaPacked : encode_packed, GenoshaInterned : encode_interned, GenoshaTable : encode_list }
 
 def decode ( cursor, item_id ) :
     item_id = int( item_id )
@@ -149,6 +179,16 @@ def decode_sequence ( cursor, seq_id ) :
         lst.append( decode( cursor, row[0] ) )
     return lst
 
+def sequence_ids ( cursor, item_id ) :
+    # the item ids of the sequence stored as ``item_id``, in order.
+    cursor.execute( "SELECT data from ITEM WHERE item_id = ?", ( int( item_id ), ) )
+    cursor.execute( "SELECT item_id from SEQUENCE_ITEM where seq_id = ? order by ordinal ", ( int( cursor.fetchone()[0] ), ) )
+    return [ row[0] for row in cursor.fetchall() ]
+
+def decode_table ( cursor, item_id ) :
+    # the sequence of objects stored as ``item_id`` as a ``GenoshaTable``, each added as it is decoded.
+    return GenoshaTable( decode( cursor, part ) for part in sequence_ids( cursor, item_id ) )
+
 def decode_map ( cursor, map_id ) :
     map_id = int( map_id )
     dct = {}
@@ -184,8 +224,10 @@ decoders = { 'int' : lambda c, d : int(d)
     , 'NoneType' : lambda c,d : None
     , 'object' : decode_object
     , 'reference' : decode_reference
+    , 'interned' : lambda c, d : GenoshaInterned( int( d ) )
     , 'sequence' : decode_sequence
-    , 'map' : decode_map }
+    , 'map' : decode_map
+    , 'packed' : lambda c,d : GenoshaPacked( *str(d).split( " ", 1 ) ) }
 
 def create_tables ( cursor ) :
     cursor.execute( '''create table object_item ( item_id integer, obj_id integer, type text, instance_id integer, attribute text, fields_id integer, items_id integer )''' )
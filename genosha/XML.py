@@ -25,29 +25,40 @@ output may be significantly larger than a corresponding pickle.
 The XML elements used in the representation are:
 
     <genosha type='...'>...</genosha> - the genosha-marshalled data.  the ``type`` attribute identifies the genosha version.
-        contains <object>, <reference> or <primitive> children.
+        contains <object>, <reference> or <primitive> children.  With the ``interned`` option
+        a last <list> child holds the string table.
 
     <object type='...' oid='...' attribute='...'>...</object> - a GenoshaObject.
         ``type`` - the object type information (module/scopes.to.typename)
-        ``oid`` - the object's locally-unique reference id
+        ``oid`` - the object's locally-unique reference id (for a columnar block, the
+            space-separated ids of the instances in it)
         ``attribute`` - used for to identify special attributes on an object (e.g. @classmethods)
-        contains <instance>, <items>, <fields> children
+        contains <instance>, <items>, <fields>, <columns> children
 
     <reference oid='...'/>  - a GenoshaReference pointing to the `oid` locally-unique reference number
 
+    <string index='...'/>  - a GenoshaInterned: the string at ``index`` in the string table
+
     <primitive type='...'>...</primitive> - represents a primitive type
         ``type`` is one of 'int', 'str', 'unicode', 'float', 'long', 'bool', or 'NoneType'
         contains the string representation of the object.
 
+    <packed format='...'>...</packed> - a GenoshaPacked run of primitives (the contents of an array or bytearray, or a packed list).
+        ``format`` - the type and size of the values (e.g. '<f8')
+        contains the packed bytes, base64-encoded.
+
     <instance>...</instance> - used for instance methods to indicate the reference ID of the bound instance.
         contains a <reference/> child.
 
     <items>...</items> - the "contents" of the object (list elements, dict entries, etc.) which may be passed to the object's constructor.
-        contains one child of <list>, <map>, or <primitive>.
+        contains one child of <list>, <map>, <packed> or <primitive>.
 
     <fields>...</field> - denotes the fields of the objects (attributes or contents of the object's __dict__ or slots).
         contains a single <map> child.
 
+    <columns>...</columns> - the fields of the instances in a columnar block (written when the ``columnar`` option is given).
+        contains a single <map> child, mapping each field name to a <list> of the instances' values.
+
     <list>...</list> - represents a simple sequence.
         contains zero or more <item> children.
 
@@ -59,47 +70,89 @@ The XML elements used in the representation are:
 
     <entry><key>...</key><value>...</value></entry> - represents an entry in the map.
         each of key and value may contain a single child of <object>, <reference/>, <primitive>, <list> or <map>.
+
+A ``GenoshaTable`` (from the ``compact`` option) is written as the <list> of its objects;
+``loads``, ``load`` and ``unmarshal`` given ``compact`` read them into one.
 """
 import xml.etree.ElementTree as ET
+import base64
+
+from xml.sax.saxutils import quoteattr
 
-from genosha import GenoshaObject, GenoshaReference, GenoshaEncoder, GenoshaDecoder
+from genosha import GenoshaObject, GenoshaReference, GenoshaInterned, GenoshaPacked, GenoshaTable, GenoshaEncoder, GenoshaDecoder, SENTINEL
 
 __version__ = "0.1"
 __author__ = "Shawn Sulma <genosha@470th.org>"
 __all__ = [ 'marshal', 'unmarshal', 'dumps', 'dump', 'loads', 'load' ]
 
-def marshal ( obj ) :
-    r"""Prepares the passed object ``obj`` for expression as XML output."""
-    _m = GenoshaEncoder().marshal( obj )
+def marshal ( obj, **options ) :
+    r"""Prepares the passed object ``obj`` for expression as XML output.  ``options`` are
+    passed on to the ``GenoshaEncoder``."""
+    _m = GenoshaEncoder( **options ).marshal( obj )
     root = ET.Element( "genosha" )
     root.set( 'type', _m[0] )
     for item in _m[1:] :
         encode_element( root, item )
     return ET.ElementTree( root )
 
-def unmarshal ( xmldoc ) :
-    r"""Translates the passed XML etree ``xmldoc`` into a Genosha structure."""
-    return GenoshaDecoder().unmarshal( decode( xmldoc ) )
+def unmarshal ( xmldoc, compact = False, stats = None, defaults = False, lazy = False, path = None, ordered = True ) :
+    r"""Translates the passed XML etree ``xmldoc`` into a Genosha structure, its objects
+    gathered into a ``GenoshaTable`` if ``compact`` is true.  ``stats``, ``defaults``,
+    ``lazy`` and ``ordered`` are passed on to the ``GenoshaDecoder``; given a ``path`` only
+    the part of the graph there is converted (see ``GenoshaDecoder.unmarshal``)."""
+    return GenoshaDecoder( stats = stats, defaults = defaults, lazy = lazy, ordered = ordered ).unmarshal( decode( xmldoc, compact ), path )
 
-def dumps ( o ) :
+def dumps ( o, **options ) :
     r"""Dump the passed object ``o`` (and its refererred object graph) as XML which
-    is returned as a string."""
-    return ET.tostring( marshal( o ).getroot() )
+    is returned as a string.  ``options`` are passed on to the ``GenoshaEncoder``."""
+    return "".join( _iterdump( o, **options ) )
 
-def dump ( o, f ) :
+def dump ( o, f, **options ) :
     r"""Dump the passed object ``o`` (and its refererred object graph) as XML which
-    is written to the file-like object ``f`` (which has a .write method)."""
-    marshal( o ).write( f )
+    is written to the file-like object ``f`` (which has a .write method).  The output is
+    written as it is produced, one object at a time.  ``options`` are passed on to the
+    ``GenoshaEncoder``; with ``stats`` the sizes of the records' text are included."""
+    for chunk in _iterdump( o, **options ) :
+        f.write( chunk )
 
-def loads ( s ) :
+def loads ( s, compact = False, stats = None, defaults = False, lazy = False, path = None, ordered = True ) :
     r"""Convert the passed XML string ``s`` back into Python objects with their
-    cross references restored."""
-    return unmarshal( ET.fromstring( s ) )
+    cross references restored.  The other arguments are as for ``unmarshal``."""
+    return unmarshal( ET.fromstring( s ), compact, stats, defaults, lazy, path, ordered )
 
-def load ( f ) :
+def load ( f, compact = False, stats = None, defaults = False, lazy = False, path = None, ordered = True ) :
     r"""Read an XML document from the file-like object ``f`` and converts it back into
-    Python objects with their cross references restored."""
-    return unmarshal( ET.parse( f ) )
+    Python objects with their cross references restored.  The other arguments are as for
+    ``unmarshal``."""
+    return unmarshal( ET.parse( f ), compact, stats, defaults, lazy, path, ordered )
+
+def _iterdump ( o, **options ) :
+    # the XML text of ``o`` in pieces, each object encoded as soon as ``marshal_iter`` is done with it.
+    encoder = GenoshaEncoder( **options )
+    records = encoder.marshal_iter( o )
+    payload = records.next()
+    scratch = ET.Element( "genosha" )
+    yield "<genosha type=%s>" % quoteattr( SENTINEL )
+    empty = True
+    stats = encoder.stats
+    for record in records :
+        if empty :
+            yield "<list>"
+            empty = False
+        encode_element( ET.SubElement( scratch, "item" ), record )
+        chunk = ET.tostring( scratch[0] )
+        if stats :
+            stats.add_size( record, len( chunk ) )
+        yield chunk
+        scratch.clear()
+    yield "<list />" if empty else "</list>"
+    encode_element( scratch, payload )
+    yield ET.tostring( scratch[0] )
+    if encoder.interned :
+        scratch.clear()
+        encode_element( scratch, encoder.strings )
+        yield ET.tostring( scratch[0] )
+    yield "</genosha>"
 
 primitives = { 'int' : int, 'str' : str, 'unicode' : unicode, 'float' : float, 'long' : long, 'bool' : bool, 'NoneType' : lambda x : None }
 
@@ -116,16 +169,28 @@ def encode_object ( parent, data ) :
     for attrib in ( 'oid', 'type', 'attribute' ) :
         if hasattr( data, attrib ) :
             e.set( attrib, str( getattr( data, attrib ) ) )
+    if hasattr( data, 'columns' ) :
+        e.set( 'oid', " ".join( str( oid ) for oid in data.oid ) )
     if hasattr( data, 'instance' ) :
         encode_element( ET.SubElement( e, 'instance' ), data.instance )
     if hasattr( data, 'items' ) :
         encode_element( ET.SubElement( e, 'items' ), data.items )
     if hasattr( data, 'fields' ) :
         encode_element( ET.SubElement( e, 'fields' ), data.fields )
+    if hasattr( data, 'columns' ) :
+        encode_element( ET.SubElement( e, 'columns' ), data.columns )
 
 def encode_reference ( parent, data ) :
     ET.SubElement( parent, 'reference' ).set( 'oid', str( data.oid ) )
 
+def encode_interned ( parent, data ) :
+    ET.SubElement( parent, 'string' ).set( 'index', str( data.index ) )
+
+def encode_packed ( parent, data ) :
+    e = ET.SubElement( parent, 'packed' )
+    e.set( 'format', data.format )
+    e.text = base64.b64encode( data.data )
+
 def encode_list ( parent, data ) :
     e = ET.SubElement( parent, 'list' )
     for item in data :
@@ -138,14 +203,18 @@ def encode_map ( parent, data ) :
         encode_element( ET.SubElement( i, 'key' ), key )
         encode_element( ET.SubElement( i, 'value' ), value )
 
-encoders = { GenoshaObject : encode_object, GenoshaReference : encode_reference, list : encode_list, dict : encode_map }
+encoders = { GenoshaObject : encode_object, GenoshaReference : encode_reference, list : encode_list, dict : encode_map
+        , GenoshaPacked : encode_packed, GenoshaInterned : encode_interned, GenoshaTable : encode_list }
 
-def decode ( root ) :
+def decode ( root, compact = False ) :
     if root.tag != 'genosha' :
         raise ValueError, "not a genosha XML document"
     res = [ root.get( 'type' ) ]
     for element in root :
-        res.append( decode_element( element ) )
+        if compact and len( res ) == 1 :
+            res.append( decode_table( element ) )
+        else :
+            res.append( decode_element( element ) )
     return res
 
 def decode_element ( element ) :
@@ -159,7 +228,9 @@ def decode_object ( element ) :
     keys = element.keys()
     for numattr in ( 'reference', 'oid' ) :
         if numattr in keys :
-            setattr( obj, numattr, int( element.get( numattr ) ) )
+            value = element.get( numattr )
+            # a columnar block lists the oids of all of its instances.
+            setattr( obj, numattr, [ int( v ) for v in value.split() ] if " " in value else int( value ) )
     for child in element :
         try :
             setattr( obj, child.tag, decode_element( child ) )
@@ -170,9 +241,21 @@ def decode_object ( element ) :
 def decode_reference ( element ) :
     return GenoshaReference( int( element.get( 'oid' ) ) )
 
+def decode_interned ( element ) :
+    return GenoshaInterned( int( element.get( 'index' ) ) )
+
+def decode_packed ( element ) :
+    return GenoshaPacked( element.get( 'format' ), base64.b64decode( element.text or '' ) )
+
 def decode_list ( element ) :
     return [ decode_element( i ) for i in element.findall( 'item' ) ]
 
+def decode_table ( element ) :
+    # the <list> of objects as a ``GenoshaTable``, each added as it is decoded.
+    if element.tag != 'list' :
+        raise ValueError, "expected the <list> of objects, not: %s" % element.tag
+    return GenoshaTable( decode_element( i ) for i in element.findall( 'item' ) )
+
 def decode_map ( element ) :
     return dict( decode_element( entry ) for entry in element.findall( 'entry' ) )
 
@@ -183,8 +266,8 @@ def decode_child ( element ) :
     return decode_element( element[0] )
 
 decoders = { 'object' : decode_object, 'list' : decode_list, 'primitive' : decode_primitive
-        , 'map' : decode_map, 'reference' : decode_reference
-        , 'fields' : decode_child, 'items' : decode_child, 'item' : decode_child
+        , 'map' : decode_map, 'reference' : decode_reference, 'packed' : decode_packed, 'string' : decode_interned
+        , 'fields' : decode_child, 'items' : decode_child, 'item' : decode_child, 'columns' : decode_child
         , 'key' : decode_child, 'value' : decode_child, 'instance' : decode_child
         , 'entry' : lambda e : ( decode_element( e.find( 'key' ) ), decode_element( e.find( 'value' ) ) )
     }
@@ -39,8 +39,39 @@ types of objects cannot be marshalled using Genosha (not comprehensive, but illu
 GenoshaObjects and GenoshaReferences contain the information necessary to reconstruct
 the original objects (including references and cycles of references as necessary).
 
-The creation of the serialization structures is performed in memory; the output is not
-streamable.
+Strings that recur may be stored once, in a table following the payload, and referred to
+by their place in it (see the ``interned`` option of ``GenoshaEncoder``).
+
+Types that are better marshalled by a compact state than field by field (and those, like
+``datetime``, that cannot be made empty and filled in) may be given a reducer and a
+restorer, with ``register`` or by the ``__genosha_reduce__``/``__genosha_restore__``
+protocol.  ``datetime``'s types, ``Decimal`` and ``UUID`` are registered already.
+
+Only some of the fields of a class's instances may be marshalled, leaving out caches and
+what can be derived again: see ``project`` (or the ``__genosha_fields__`` and
+``__genosha_exclude__`` class attributes).  The decoder can give them defaults instead.
+
+If numpy is available, its arrays are marshalled by their dtype, shape and strides with
+their contents as the raw bytes of their buffer (see ``GenoshaEncoder.marshal_ndarray``).
+
+The creation of the serialization structures is performed in memory.  ``marshal_iter``
+produces the same structure a piece at a time, handing out each object as soon as it is
+complete, so that a serializer can write output as it goes rather than holding all of it.
+``estimate`` walks a graph as ``marshal`` would and estimates the size of the output for
+each serialization, without producing any, and ``fingerprint`` hashes its content.
+``clone`` copies a graph by the same rules, making each copy as it walks the graph.
+
+With the ``compact`` option the objects are listed in a ``GenoshaTable`` instead, which
+holds their records as parallel arrays rather than as a ``GenoshaObject`` apiece; the
+decoder, and the wrappers' loaders (given ``compact``), read it as readily.
+
+A large graph of which little is needed can be unmarshalled with ``lazy``, making each
+object only once it is used, or given a ``path``, making only the part of it found there
+(see ``GenoshaDecoder``).
+
+A graph that is marshalled again and again as it changes can be marshalled as deltas
+instead, holding only the objects that are new or have changed since the last time (see
+``GenoshaEncoder.marshal_delta`` and ``GenoshaDecoder.apply_delta``).
 
 There are two serialization modules provided.  genosha.JSON provides JSON
 serialization/deserialization.  genosha.XML provides and XML implementation using ElementTree.
@@ -67,12 +98,20 @@ serializations.  The syntax for those is much the same as for pickle:
     >>> obj_again = genosha.XML.loads( xml_string )
 
 """
+from array import array
 from collections import defaultdict, deque
-import sys, types, inspect
+from itertools import chain, izip, imap
+from timeit import default_timer as _timer
+import sys, os, types, inspect, struct, tempfile, threading, hashlib
+import datetime, decimal, uuid
 try :
     import gc
 except : # some python implementations (jython?, pypy?, etc) may not have gc module.  This is okay.
     gc = None
+try :
+    import numpy
+except ImportError : # numpy arrays are supported only if it is installed.
+    numpy = None
 
 __version__ = "0.1"
 __author__ = "Shawn Sulma <genosha@470th.org>"
@@ -80,21 +119,377 @@ __author__ = "Shawn Sulma <genosha@470th.org>"
 # special value to indicate the version of genosha object structure used.
 SENTINEL = "@genosha:1@"
 
-def marshal ( obj ) :
+# the same, for deltas (see ``GenoshaEncoder.marshal_delta``).
+DELTA_SENTINEL = "@genosha-delta:1@"
+
+# how the results of an encoder frame are stored on the object being populated.
+_SEQUENCE, _MAPPING, _FIELDS = range( 3 )
+
+# what a decoder frame makes of its results.
+_LIST, _DICT, _METHOD, _IMMUTABLE, _POPULATE = range( 5 )
+
+# returned when a decoder frame has been pushed and the value is not yet available.
+_PENDING = object()
+
+# the bits of a ``GenoshaTable`` mask telling which parts a record has.
+_HAS_FIELDS, _HAS_ITEMS = 1, 2
+
+# the type name ``GenoshaStats`` gives the records of methods, which have none.
+_METHOD_TYPE = "__builtin__/instancemethod"
+
+# packed formats are written as numpy does: '<' (little-endian), the kind of value ('i'
+# signed, 'u' unsigned, 'f' floating point, 'b' boolean, 'S' byte character, 'U' unicode
+# character) and its size in bytes.  These are their :mod:`struct` codes ...
+_STRUCT_CODES = { '<i1' : 'b', '<u1' : 'B', '<b1' : '?', '<S1' : 'c', '<i2' : 'h', '<u2' : 'H'
+    , '<i4' : 'i', '<u4' : 'I', '<i8' : 'q', '<u8' : 'Q', '<f4' : 'f', '<f8' : 'd' }
+
+# ... and the :mod:`array` typecodes of the same size here, where there are any.
+_TYPECODES = { '<S1' : 'c' }
+for _code in 'bBhHiIlLfd' :
+    _TYPECODES.setdefault( '<%s%d' % ( 'f' if _code in 'fd' else 'u' if _code.isupper() else 'i', array( _code ).itemsize ), _code )
+del _code
+
+# whether the native byte order has to be swapped to (and from) the packed one.
+_SWAP = sys.byteorder != 'little'
+
+# what encoders and decoders work out about types and names, shared process-wide (see
+# ``_cache`` and ``clear_caches``).  Each cache is keyed by its name and the encoder or
+# decoder class it is for.  Every thread works out the same entries, so they are simply
+# added as they are found; making a cache, and clearing them all, is done under the lock.
+_caches = {}
+_cache_lock = threading.Lock()
+
+_STRINGS = frozenset( [ str, unicode, basestring ] )
+
+# the limit of a budget that is not given.
+_UNLIMITED = float( 'inf' )
+
+def _cache ( key, make = dict ) :
+    # the shared cache for ``key``, made by ``make`` the first time it is needed.
+    cache = _caches.get( key )
+    if cache is None :
+        _cache_lock.acquire()
+        try :
+            cache = _caches.get( key )
+            if cache is None :
+                cache = _caches[key] = make()
+        finally :
+            _cache_lock.release()
+    return cache
+
+def clear_caches () :
+    r"""Forget what encoders and decoders have worked out about types and names (how each
+    type is marshalled, the scoped names of classes and functions, where instances keep
+    their fields, which class a name resolves to, ...).  These are shared process-wide so
+    that each new encoder or decoder need not work them out again; clear them after
+    redefining (e.g. reloading) classes that have already been handled, or after changing
+    the class attributes of an encoder or decoder that decide how types are handled.
+    Encoders and decoders already in use keep what they have."""
+    _cache_lock.acquire()
+    try :
+        _caches.clear()
+    finally :
+        _cache_lock.release()
+
+# the reducers and restorers given to ``register``, by type.
+_reducers = {}
+
+def register ( kind, reduce, restore ) :
+    r"""Marshal instances of ``kind`` (and its subclasses) by their state, rather than by
+    their fields: ``reduce( obj )`` returns the state of ``obj`` and ``restore( kind,
+    state )`` makes an instance of ``kind`` from it again.  The state may hold anything
+    that can be marshalled; a list (or tuple) or dict is restored as a list or dict, whose
+    contents may not be complete yet if they refer back to objects that are still being
+    restored.  Objects made this way are complete when made, as immutables are.
+
+    A class may instead define ``__genosha_reduce__( self )`` and the classmethod
+    ``__genosha_restore__( cls, state )``; ``register`` takes precedence for the class it is
+    given.  Registering clears the caches (see ``clear_caches``)."""
+    _cache_lock.acquire()
+    try :
+        _reducers[kind] = ( reduce, restore )
+        _caches.clear()
+    finally :
+        _cache_lock.release()
+
+# the projections given to ``project``, by type.
+_projections = {}
+
+def project ( kind, include = None, exclude = (), defaults = None ) :
+    r"""Marshal only some of the fields of instances of ``kind`` (and its subclasses): those
+    named in ``include``, if it is given, and none of those named in ``exclude``; the rest
+    are never looked at.  ``defaults`` maps the names of fields left out to the values a
+    decoder with ``defaults`` gives the instances it unmarshals (a callable is called for
+    a new value each time), such as an empty cache.
+
+    A class may instead define ``__genosha_fields__`` (the names included),
+    ``__genosha_exclude__`` and ``__genosha_defaults__``; ``project`` takes precedence for
+    the class it is given.  Projecting clears the caches (see ``clear_caches``)."""
+    _cache_lock.acquire()
+    try :
+        _projections[kind] = ( include, exclude, defaults )
+        _caches.clear()
+    finally :
+        _cache_lock.release()
+
+_PROJECTING = ( '__genosha_fields__', '__genosha_exclude__', '__genosha_defaults__' )
+
+def _projection ( kind ) :
+    # the names of the fields of instances of ``kind`` included (None for all), excluded
+    # and the defaults: as given to ``project`` for the nearest class along its MRO, unless
+    # one nearer has the class attributes.
+    for base in kind.__mro__ :
+        if base in _projections :
+            include, exclude, defaults = _projections[base]
+            break
+        if any( name in base.__dict__ for name in _PROJECTING ) :
+            include, exclude, defaults = ( getattr( kind, name, None ) for name in _PROJECTING )
+            break
+    else :
+        return None, frozenset(), ()
+    return None if include is None else tuple( include ), frozenset( exclude or () ), tuple( ( defaults or {} ).items() )
+
+def _flatten ( mapping ) :
+    # values are converted ahead of their keys, as ``d[key] = value`` does.
+    return chain.from_iterable( izip( mapping.itervalues(), mapping.iterkeys() ) )
+
+def _slots ( kind ) :
+    # the slots of ``kind`` and its bases that hold fields (``__dict__``, ``__weakref__`` and
+    # the like do not), most derived first.
+    slots = []
+    for base in kind.__mro__ :
+        names = base.__dict__.get( '__slots__', () )
+        if isinstance( names, basestring ) :
+            names = ( names, )
+        for name in names :
+            if not name.startswith( '__' ) and name not in slots :
+                slots.append( name )
+    return tuple( slots )
+
+def _pack ( format, values ) :
+    # the bytes of ``values`` in ``format``.
+    code = _TYPECODES.get( format )
+    if code is None :
+        return struct.pack( '<%d%s' % ( len( values ), _STRUCT_CODES[format] ), *values )
+    packed = array( code, values )
+    if _SWAP :
+        packed.byteswap()
+    return packed.tostring()
+
+def _pack_list ( obj ) :
+    # ``obj`` packed if it holds ints, floats or bools and nothing else, otherwise None.
+    kinds = set( imap( type, obj ) )
+    if len( kinds ) != 1 :
+        return None
+    kind = kinds.pop()
+    if kind is float :
+        format = '<f8'
+    elif kind is int :
+        format = '<i4' if -2 ** 31 <= min( obj ) and max( obj ) < 2 ** 31 else '<i8'
+    elif kind is bool :
+        format = '<b1'
+    else :
+        return None
+    return GenoshaPacked( format, _pack( format, obj ) )
+
+def _pack_array ( obj ) :
+    if obj.typecode == 'u' :
+        return GenoshaPacked( '<U4', obj.tounicode().encode( 'utf-32-le' ) )
+    if obj.typecode == 'c' :
+        return GenoshaPacked( '<S1', obj.tostring() )
+    format = '<%s%d' % ( 'f' if obj.typecode in 'fd' else 'u' if obj.typecode.isupper() else 'i', obj.itemsize )
+    if _SWAP and obj.itemsize > 1 :
+        obj = array( obj.typecode, obj )
+        obj.byteswap()
+    return GenoshaPacked( format, obj.tostring() )
+
+def _pack_bytearray ( obj ) :
+    return GenoshaPacked( '<u1', str( obj ) )
+
+def _new_array ( kind, packed ) :
+    if packed.format == '<U4' :
+        obj = kind.__new__( kind, 'u' )
+        obj.fromunicode( packed.data.decode( 'utf-32-le' ) )
+        return obj
+    if packed.format not in _TYPECODES :
+        raise ValueError, "Packed format %s has no array typecode here." % packed.format
+    obj = kind.__new__( kind, _TYPECODES[packed.format] )
+    obj.fromstring( packed.data )
+    if _SWAP :
+        obj.byteswap()
+    return obj
+
+def _new_bytearray ( kind, packed ) :
+    obj = kind.__new__( kind )
+    obj[:] = packed.data
+    return obj
+
+def _listed ( descr ) :
+    # a structured dtype's ``descr`` with its tuples as lists, which any serialization keeps.
+    return [ [ _listed( part ) if type( part ) is list else list( part ) if type( part ) is tuple else part for part in field ] for field in descr ]
+
+def _descr ( descr ) :
+    # the ``descr`` again from its ``_listed`` form; nested fields are lists of lists, shapes lists of ints.
+    return [ tuple( ( _descr( part ) if part and type( part[0] ) is list else tuple( part ) ) if type( part ) is list else part for part in field ) for field in descr ]
+
+def _new_ndarray ( kind, items ) :
+    if type( items ) is list : # an array of objects: its shape and then its values
+        obj = numpy.ndarray.__new__( kind, tuple( items[0] ), object )
+        flat = obj.flat
+        for index, value in enumerate( items[1:] ) :
+            flat[index] = value
+        return obj
+    if 'file' in items :
+        obj = numpy.load( items['file'], mmap_mode = 'c' )
+        return obj if kind is numpy.ndarray else obj.view( kind )
+    packed = items['data']
+    dtype = numpy.dtype( _descr( items['dtype'] ) if 'dtype' in items else packed.format )
+    return numpy.ndarray.__new__( kind, tuple( items['shape'] ), dtype, bytearray( packed.data ), 0, tuple( items['strides'] ) )
+
+def _merge_frame ( value ) :
+    # the parts of a mergeable value and its key so far (a complex is taken whole).
+    if type( value ) is complex :
+        return ( value, iter( () ), [ str( value ) ] )
+    return ( value, iter( value ), [] )
+
+def _fingerprint ( out, files = None ) :
+    # a digest of the parts of the record ``out`` (but its oid), including the bytes of any
+    # packed items (which the repr of a ``GenoshaPacked`` leaves out) and, for an array
+    # saved to a side file, the digest of its contents in ``files`` (by the file's name).
+    items = getattr( out, 'items', None )
+    parts = [ getattr( out, 'type', None ), getattr( out, 'fields', None ), items, getattr( out, 'attribute', None ), getattr( out, 'instance', None ) ]
+    digest = hashlib.sha1()
+    for value in items.itervalues() if type( items ) is dict else ( items, ) :
+        if type( value ) is GenoshaPacked :
+            digest.update( value.data )
+    if files and type( items ) is dict and items.get( 'file' ) in files :
+        parts[2] = dict( items, file = files[items['file']] )
+    digest.update( repr( parts ) )
+    return digest.digest()
+
+def _array_digest ( obj ) :
+    # a digest of the dtype, shape and contents of the numpy array ``obj``.
+    digest = hashlib.sha1( repr( ( obj.dtype.descr, obj.shape ) ) )
+    digest.update( buffer( obj if obj.flags.c_contiguous else numpy.ascontiguousarray( obj ) ) )
+    return digest.hexdigest()
+
+def _type_name ( kind, names ) :
+    # the name of ``kind`` for ``GenoshaStats``: its scoped name if ``names`` has it.
+    return names.get( kind ) or "%s/%s" % ( kind.__module__, kind.__name__ )
+
+def _record_type ( data ) :
+    # the type name of a record for ``GenoshaStats``.
+    return getattr( data, 'type', None ) or _METHOD_TYPE
+
+def _stats_done ( stats, hook, started ) :
+    # finish ``stats``, begun at ``started``, and hand them to ``hook`` if it is callable.
+    stats.elapsed = _timer() - started
+    if hasattr( hook, '__call__' ) :
+        hook( stats )
+
+def _lazy_getattribute ( self, name ) :
+    # the attribute access of the subclasses made by ``GenoshaDecoder._lazy_class``; while
+    # the decoder populates the instance it is accessed as an instance of its own class.
+    lazy = type( self )
+    if lazy._genosha_decoder._materialize( self ) :
+        return getattr( self, name )
+    if name == '__class__' :
+        return lazy.__bases__[0]
+    return lazy.__bases__[0].__getattribute__( self, name )
+
+def _lazy_setattr ( self, name, value ) :
+    lazy = type( self )
+    if lazy._genosha_decoder._materialize( self ) :
+        setattr( self, name, value )
+    else :
+        lazy.__bases__[0].__setattr__( self, name, value )
+
+def _lazy_delattr ( self, name ) :
+    lazy = type( self )
+    if lazy._genosha_decoder._materialize( self ) :
+        delattr( self, name )
+    else :
+        lazy.__bases__[0].__delattr__( self, name )
+
+def _new ( kind, items ) :
+    return kind.__new__( kind, items )
+
+def _restore ( kind, state ) :
+    return kind.__genosha_restore__( state )
+
+def _construct ( kind, state ) :
+    return kind( *state )
+
+def _with_tzinfo ( obj, state ) :
+    # the state of a datetime or time, followed by its tzinfo if it has one.
+    if obj.tzinfo is not None :
+        state.append( obj.tzinfo )
+    return state
+
+register( datetime.datetime, lambda obj : _with_tzinfo( obj, [ obj.year, obj.month, obj.day, obj.hour, obj.minute, obj.second, obj.microsecond ] ), _construct )
+register( datetime.date, lambda obj : [ obj.year, obj.month, obj.day ], _construct )
+register( datetime.time, lambda obj : _with_tzinfo( obj, [ obj.hour, obj.minute, obj.second, obj.microsecond ] ), _construct )
+register( datetime.timedelta, lambda obj : [ obj.days, obj.seconds, obj.microseconds ], _construct )
+register( decimal.Decimal, str, lambda kind, state : kind( state ) )
+register( uuid.UUID, lambda obj : obj.hex, lambda kind, state : kind( hex = state ) )
+
+def marshal ( obj, **options ) :
     r"""Generate a representation of ``obj`` as a list of GenoshaObjects, GenoshaReferences
     and primitives.  The resulting list object will have no cycles in object references and
-    can be serialized in whatever manner is appropriate."""
-    return GenoshaEncoder().marshal( obj )
+    can be serialized in whatever manner is appropriate.  ``options`` are passed on to the
+    ``GenoshaEncoder``."""
+    return GenoshaEncoder( **options ).marshal( obj )
+
+def estimate ( obj, format = 'json', **options ) :
+    r"""Estimate what marshalling ``obj`` and serializing it as ``format`` ('json', 'xml' or
+    'sql') would produce, without producing it: a ``GenoshaEstimate`` of the number of
+    objects and references, the count and size of the values of each type and the size in
+    all.  The graph is walked by the encoder's rules, so what cannot be marshalled raises
+    the same errors; ``options`` are passed on to the ``GenoshaEstimator``."""
+    return GenoshaEstimator( **options ).estimate( obj, format )
+
+def marshal_iter ( obj, **options ) :
+    r"""Generate the same representation of ``obj`` as ``marshal``, a piece at a time.  The
+    first value produced is the payload (the last element of ``marshal``'s result); the
+    objects making up the second element follow in order, each as soon as it is complete.
+    The string table of the ``interned`` option is complete only once everything has been
+    produced, so to use it create the ``GenoshaEncoder`` and read its ``strings`` then."""
+    return GenoshaEncoder( **options ).marshal_iter( obj )
 
-def unmarshal ( input ) :
+def fingerprint ( obj, oids = False ) :
+    r"""A hash of the content of ``obj`` and the graph it refers to (a hex string), the same
+    for any graph of equal content however it is numbered, in whatever order its dicts and
+    sets hold their entries, and whatever cycles it has.  With ``oids`` a dict of the hash
+    of each object by its oid (as ``marshal`` would number it) is returned as well, which
+    differs only where something that object leads to differs.  See
+    ``GenoshaFingerprinter``."""
+    return GenoshaFingerprinter().fingerprint( obj, oids )
+
+def clone ( obj, defaults = False, **options ) :
+    r"""Copy ``obj`` and the graph it refers to by the same rules as marshalling it and
+    unmarshalling the result, but without making either: each copy is made as the graph is
+    walked (see ``GenoshaCloner``).  ``defaults`` and ``options`` are passed on to the
+    ``GenoshaCloner``."""
+    return GenoshaCloner( defaults = defaults, **options ).clone( obj )
+
+def split_options ( kwargs ) :
+    r"""Separate the keyword arguments in ``kwargs`` that are ``GenoshaEncoder`` options (see
+    ``GenoshaEncoder.options``) from the rest, returning both.  This lets serialization
+    wrappers accept encoder options alongside their own keyword arguments."""
+    options = dict( ( key, value ) for key, value in kwargs.items() if key in GenoshaEncoder.options )
+    return options, dict( ( key, value ) for key, value in kwargs.items() if key not in options )
+
+def unmarshal ( input, defaults = False, lazy = False, path = None, ordered = True ) :
     r"""Convert a representation generated by ``marshal`` back into proper Python objects
-    with their references restored.  It assumes that there are no forward-pointing
-    GenoshaReferences (i.e. any references will be to objects that have been already
-    specified previously in the ``input``."""
-    return GenoshaDecoder().unmarshal( input )
+    with their references restored.  Unless ``ordered`` is false it assumes that there are
+    no forward-pointing GenoshaReferences (i.e. any references will be to objects that have
+    been already specified previously in the ``input``.  ``defaults``, ``lazy`` and
+    ``ordered`` are passed on to the ``GenoshaDecoder``; given a ``path`` only the part of
+    the graph there is converted (see ``GenoshaDecoder.unmarshal``)."""
+    return GenoshaDecoder( defaults = defaults, lazy = lazy, ordered = ordered ).unmarshal( input, path )
 
 class GenoshaObject ( object ) :
-    __slots__ = ( 'type', 'oid', 'fields', 'items', 'attribute', 'instance' )
+    __slots__ = ( 'type', 'oid', 'fields', 'items', 'attribute', 'instance', 'columns' )
     def __init__ ( self, **kwargs ) :
         for k, v in kwargs.items() :
             setattr( self, k, v )
@@ -108,6 +503,194 @@ class GenoshaReference ( object ) :
     def __repr__ ( self ) :
         return "<GenoshaReference: oid=%d>" % self.oid
 
+class GenoshaInterned ( object ) :
+    r"""A string stored in the string table (see the ``interned`` option of ``GenoshaEncoder``),
+    referred to by its ``index`` there."""
+    __slots__ = ( 'index', )
+    def __init__ ( self, index ) :
+        self.index = int( index )
+    def __repr__ ( self ) :
+        return "<GenoshaInterned: index=%d>" % self.index
+
+class GenoshaPacked ( object ) :
+    r"""A run of primitive values of one type, packed into a string of bytes.  ``format`` is
+    the type and size of the values, written as numpy does (e.g. '<f8' for little-endian
+    8-byte floats, '<i4' for 4-byte signed ints; the contents of a numpy array may be in
+    any format numpy has); ``data`` holds the bytes.  Iterating over it produces the values."""
+    __slots__ = ( 'format', 'data' )
+    def __init__ ( self, format, data ) :
+        self.format = str( format )
+        self.data = data
+    def __iter__ ( self ) :
+        return iter( self.values() )
+    def values ( self ) :
+        if self.format == '<U4' :
+            return list( self.data.decode( 'utf-32-le' ) )
+        if self.format not in _STRUCT_CODES :
+            raise ValueError, "Unknown packed format: %s" % self.format
+        code = _TYPECODES.get( self.format )
+        if code is None :
+            code = _STRUCT_CODES[self.format]
+            return list( struct.unpack( '<%d%s' % ( len( self.data ) // struct.calcsize( '<' + code ), code ), self.data ) )
+        values = array( code, self.data )
+        if _SWAP :
+            values.byteswap()
+        return values.tolist()
+    def __repr__ ( self ) :
+        return "<GenoshaPacked: format=%s, %d bytes>" % ( self.format, len( self.data ) )
+
+class GenoshaSnapshot ( object ) :
+    r"""What ``GenoshaEncoder.marshal_delta`` knows of the graph it marshalled: the oid of
+    each object (``oids``, by its id), the objects themselves (``objects``, kept so that
+    their ids are not reused), a fingerprint of each object's record (``fingerprints``, by
+    oid), the side files numpy arrays were saved to (``files``, by the digest of their
+    contents) and the next oid to assign."""
+    __slots__ = ( 'oids', 'objects', 'fingerprints', 'files', 'next_oid' )
+    def __init__ ( self, next_oid = 0 ) :
+        self.oids = {}
+        self.objects = []
+        self.fingerprints = {}
+        self.files = {}
+        self.next_oid = next_oid
+    def __repr__ ( self ) :
+        return "<GenoshaSnapshot: %d objects, next_oid=%d>" % ( len( self.fingerprints ), self.next_oid )
+
+class GenoshaTable ( object ) :
+    r"""Object records (the second element of ``marshal``'s result) held compactly: as
+    parallel arrays with an entry per record, in order, rather than as a ``GenoshaObject``
+    apiece with a dict of its fields.  A record's type is the index of its name in
+    ``types``; its fields are the run of ``values`` starting at its place in ``starts``,
+    named by the tuple in ``layouts`` that every record with the same field names shares;
+    its items (or None) are in ``items``, and which of the two it has is in ``masks``.
+    Records of any other shape (columnar blocks and methods) are kept whole in ``extras``
+    by their place.
+
+    ``append`` adds a record and ``record`` makes the ``GenoshaObject`` again; iterating
+    produces them all in order, so a table may be used wherever the list of records is."""
+    __slots__ = ( 'types', 'type_index', 'layouts', 'layout_index', 'masks', 'oids', 'kinds', 'shapes', 'starts', 'values', 'items', 'extras' )
+    def __init__ ( self, records = () ) :
+        self.types = []
+        self.type_index = {}
+        self.layouts = []
+        self.layout_index = {}
+        self.masks = array( 'B' )
+        self.oids = array( 'l' )
+        self.kinds = array( 'i' )
+        self.shapes = array( 'i' )
+        self.starts = array( 'l' )
+        self.values = []
+        self.items = []
+        self.extras = {}
+        for out in records :
+            self.append( out )
+
+    def append ( self, out ) :
+        if hasattr( out, 'columns' ) or hasattr( out, 'attribute' ) or not hasattr( out, 'type' ) or not hasattr( out, 'oid' ) :
+            self.extras[len( self.masks )] = out
+            kind, oid, shape, items, mask = -1, -1, -1, None, 0
+        else :
+            kind = self.type_index.get( out.type )
+            if kind is None :
+                kind = self.type_index[out.type] = len( self.types )
+                self.types.append( out.type )
+            oid, shape, items, mask = int( out.oid ), -1, None, 0
+            if hasattr( out, 'fields' ) :
+                names = tuple( out.fields )
+                shape = self.layout_index.get( names )
+                if shape is None :
+                    shape = self.layout_index[names] = len( self.layouts )
+                    self.layouts.append( names )
+                mask = _HAS_FIELDS
+            if hasattr( out, 'items' ) :
+                items = out.items
+                mask |= _HAS_ITEMS
+        self.masks.append( mask )
+        self.oids.append( oid )
+        self.kinds.append( kind )
+        self.shapes.append( shape )
+        self.starts.append( len( self.values ) )
+        if mask & _HAS_FIELDS :
+            self.values.extend( out.fields.itervalues() )
+        self.items.append( items )
+
+    def fields ( self, index ) :
+        r"""The names and the marshalled values of the fields of the record at ``index``."""
+        names = self.layouts[self.shapes[index]]
+        start = self.starts[index]
+        return names, self.values[start:start + len( names )]
+
+    def record ( self, index ) :
+        r"""The ``GenoshaObject`` for the record at ``index``."""
+        if index in self.extras :
+            return self.extras[index]
+        out = GenoshaObject( type = self.types[self.kinds[index]], oid = self.oids[index] )
+        mask = self.masks[index]
+        if mask & _HAS_FIELDS :
+            out.fields = dict( izip( *self.fields( index ) ) )
+        if mask & _HAS_ITEMS :
+            out.items = self.items[index]
+        return out
+
+    def __len__ ( self ) :
+        return len( self.masks )
+    def __iter__ ( self ) :
+        return imap( self.record, xrange( len( self.masks ) ) )
+    def __repr__ ( self ) :
+        return "<GenoshaTable: %d records, %d types>" % ( len( self.masks ), len( self.types ) )
+
+class GenoshaStats ( object ) :
+    r"""What an encoder or decoder given ``stats`` did, by the type names of the values
+    (as their records have them, module/scoped.Name):
+
+    ``counts`` the number of values of each type (references are not counted);
+    ``times`` the seconds spent on them, each value's own time (not that of the values
+    within it), including populating it;
+    ``sizes`` the bytes of output for their records, filled in by the serialization
+    wrappers that produce text;
+    ``lookups`` the lookups of types (or their names) in the shared caches and ``misses``
+    those that had to be worked out (see ``hit_rate``);
+    ``max_deferred`` the most objects waiting at once to be populated (by the encoder);
+    ``elapsed`` the seconds the whole took."""
+    __slots__ = ( 'counts', 'times', 'sizes', 'lookups', 'misses', 'max_deferred', 'elapsed' )
+    def __init__ ( self ) :
+        self.counts = defaultdict( int )
+        self.times = defaultdict( float )
+        self.sizes = defaultdict( int )
+        self.lookups = self.misses = self.max_deferred = 0
+        self.elapsed = 0.0
+
+    def hit_rate ( self ) :
+        return 1.0 - float( self.misses ) / self.lookups if self.lookups else 1.0
+
+    def add_size ( self, out, size ) :
+        r"""Count ``size`` bytes of output for the record ``out``."""
+        self.sizes[_record_type( out )] += size
+
+    def summary ( self, limit = 10 ) :
+        r"""The ``limit`` types that took the most time, a line apiece, and the totals."""
+        lines = [ "%-48s %9s %10s %10s" % ( "type", "count", "seconds", "bytes" ) ]
+        for name in sorted( self.times, key = self.times.get, reverse = True )[:limit] :
+            lines.append( "%-48s %9d %10.4f %10d" % ( name, self.counts.get( name, 0 ), self.times[name], self.sizes.get( name, 0 ) ) )
+        lines.append( "%d values in %.4fs; %d lookups, %.1f%% cached; at most %d deferred" % ( sum( self.counts.itervalues() ), self.elapsed
+                , self.lookups, self.hit_rate() * 100, self.max_deferred ) )
+        return "\n".join( lines )
+
+    def __repr__ ( self ) :
+        return "<GenoshaStats: %d values of %d types, %.4fs>" % ( sum( self.counts.itervalues() ), len( self.counts ), self.elapsed )
+
+class GenoshaBudgetExceeded ( RuntimeError ) :
+    r"""Raised when marshalling goes over one of the budgets given to ``GenoshaEncoder``:
+    ``budget`` is its name ('max_objects', 'max_bytes', 'max_depth' or 'deadline') and
+    ``limit`` its value, ``kind`` the type name of the value being marshalled when it went
+    over and ``path`` the type names of the objects holding it, from the root down."""
+    def __init__ ( self, budget, limit, kind, path ) :
+        shown = path if len( path ) <= 8 else path[:3] + [ "..." ] + path[-4:]
+        RuntimeError.__init__( self, "%s of %s exceeded marshalling %s (in %s)" % ( budget, limit, kind, " > ".join( shown ) or "the root" ) )
+        self.budget = budget
+        self.limit = limit
+        self.kind = kind
+        self.path = path
+
 class GenoshaEncoder ( object ) :
     r"""The workhorse for converting an object (and its references) into a serially-marshallable
     structure.  In most cases you will wish to use ``marshal`` above, or one of the
@@ -126,80 +709,462 @@ class GenoshaEncoder ( object ) :
     ``string_hook`` allows you to specify a string-like-object processor.  If specified
     it should accept the string types (str, unicode) and SHOULD return the same type.
     This is useful for escaping (see the JSON implementation for an example).
+
+    ``columnar`` if true gathers runs of instances of the same class with the same fields
+    into columnar blocks (see ``_columnar``), which are smaller and quicker to handle than
+    an object apiece.  ``object_hook`` must then also accept 'columns'.
+
+    ``packed`` if true packs the items of lists of at least ``min_packed`` ints, floats or
+    bools (and nothing else) into a ``GenoshaPacked`` string of bytes, which is far quicker
+    to produce and to read than the values one at a time.  The contents of ``array.array``s
+    and ``bytearray``s are always packed.
+
+    ``sidefiles`` names a directory into which numpy arrays of at least ``min_sidefile``
+    bytes are saved (as .npy files) instead of being included in the output; they are
+    memory-mapped when unmarshalled.
+
+    ``interned`` if true stores each string of at least ``min_interned`` characters that
+    occurs ``min_occurrences`` times once, in a table (``strings``) which follows the
+    payload as a fourth element of the output.  That occurrence and any later ones are
+    replaced by the callable ``interned_hook`` called with the string's index in the table
+    (a ``GenoshaInterned`` by default); the earlier ones are left as they are, so that the
+    output can still be produced a piece at a time.  The decoder makes every reference to
+    a string the one same string object.
+
+    ``merged`` if true marshals equal tuples, frozensets and complex numbers (holding only
+    primitives and each other, of the same types all the way down) as one object, however
+    many there are; the unmarshalled graph then shares that one value too.
+
+    ``compact`` if true has ``marshal`` (and ``marshal_delta``) list the objects in a
+    ``GenoshaTable`` instead of a list, each record added to it as it is completed.
+
+    ``stats`` if true gathers statistics of each marshalling into ``self.stats``, a
+    ``GenoshaStats``; if it is callable, it is called with them once marshalling is done.
+    Timing each value slows marshalling down, so this is best kept for investigations.
+
+    ``max_objects``, ``max_bytes``, ``max_depth`` and ``deadline`` are budgets: marshalling
+    is abandoned with ``GenoshaBudgetExceeded`` once it has made more than ``max_objects``
+    records, has produced (by a rough count of ``value_bytes`` per value, a byte per character
+    of a string or of packed contents and ``object_bytes`` per record) more than ``max_bytes`` of output, has met an object more
+    than ``max_depth`` objects away from the root, or has taken more than ``deadline``
+    seconds (checked every ``deadline_every`` values).  Without any, nothing is checked.
     """
-    def __init__ ( self, object_hook = GenoshaObject, reference_hook = GenoshaReference, string_hook = None ) :
+    # the keyword arguments that select how the output is produced (see ``split_options``).
+    options = ( 'columnar', 'packed', 'sidefiles', 'interned', 'merged', 'compact', 'stats'
+            , 'max_objects', 'max_bytes', 'max_depth', 'deadline' )
+
+    def __init__ ( self, object_hook = GenoshaObject, reference_hook = GenoshaReference, string_hook = None, columnar = False, packed = False, sidefiles = None
+            , interned = False, interned_hook = GenoshaInterned, merged = False, compact = False, stats = None
+            , max_objects = None, max_bytes = None, max_depth = None, deadline = None ) :
         self.object_hook = object_hook
         self.reference_hook = reference_hook
-        if string_hook :
-            self.marshal_str = self.marshal_unicode = self.marshal_basestring = string_hook
-            self.primitives -= set( [ str, unicode, basestring ] )
-            self.builtin_types |= set( [ str, unicode, basestring ] )
-        self.dispatch = dict( ( typ, self.idem ) for typ in self.primitives )
-        self.dispatch.update( ( typ, self.unknown ) for typ in self.unsupported )
-        self.dispatch.update( ( typ, getattr( self, "marshal_" + typ.__name__ ) ) for typ in self.builtin_types )
-        self.scoped_names = {}
-        self.builders = { list : lambda obj : self._sequence( obj, list.__iter__ )
-                , tuple : lambda obj : self._sequence( obj, tuple.__iter__ )
-                , dict : lambda obj : self._map( obj, dict.items )
-                , set : lambda obj : self._sequence( obj, set.__iter__ )
-                , frozenset : lambda obj : self._sequence( obj, frozenset.__iter__ )
-                , defaultdict : lambda obj : self._map( obj, defaultdict.items )
-                , deque : lambda obj : self._sequence( obj, deque.__iter__ )
-                }
+        self.interned_hook = interned_hook
+        self.columnar = columnar
+        self.packed = packed
+        self.sidefiles = sidefiles
+        self.interned = interned
+        self.merged = merged
+        self.compact = compact
+        self.string_hook = string_hook
+        kind = self.__class__
+        self.dispatch = _cache( ( 'dispatch', kind, bool( string_hook ), bool( interned ), bool( merged ) ), self._dispatch )
+        self.scoped_names = _cache( ( 'scoped_names', kind ) )
+        self.scope_index = _cache( ( 'scope_index', kind ) )
+        self.reducers = _cache( ( 'reducers', kind ) )
+        self.plans = _cache( ( 'plans', kind ) )
+        budgets = ( max_objects, max_bytes, max_depth, deadline )
+        self.budgeted = budgets != ( None, ) * len( budgets )
+        self.max_objects, self.max_bytes, self.max_depth, self.deadline = ( _UNLIMITED if limit is None else limit for limit in budgets )
+        if self.budgeted :
+            self._marshal = self._budgeted_marshal
+            self._object = self._budgeted_object
+            self._step = self._budgeted_step
+        self.measured = stats
+        self.stats = None
+        # the snapshots a delta is marshalled against and into (see ``marshal_delta``).
+        self.previous = self.current = None
+        if stats : # measuring whatever marshals (and populates) the values, budgeted or not.
+            self._unmeasured_marshal, self._unmeasured_object = self._marshal, self._object
+            self._marshal = self._measured_marshal
+            self._object = self._measured_object
+            self.find_scoped_name = self._measured_find_scoped_name
+
+    builders = { list : ( list.__iter__, _SEQUENCE )
+            , tuple : ( tuple.__iter__, _SEQUENCE )
+            , dict : ( dict.iteritems, _MAPPING )
+            , set : ( set.__iter__, _SEQUENCE )
+            , frozenset : ( frozenset.__iter__, _SEQUENCE )
+            , defaultdict : ( dict.iteritems, _MAPPING )
+            , deque : ( deque.__iter__, _SEQUENCE )
+            }
+
+    # how deeply immutables are populated recursively before the explicit stack takes over.
+    max_nesting = 32
+
+    # the shortest list packed when ``packed`` is given.
+    min_packed = 8
+
+    # the smallest numpy array (in bytes) saved to a side file when ``sidefiles`` is given.
+    min_sidefile = 1 << 20
+
+    # the bytes of output counted against ``max_bytes`` for each value (besides the
+    # characters of a string) and each record, and how many values are marshalled between checks of
+    # the ``deadline``.
+    value_bytes = 8
+    object_bytes = 32
+    deadline_every = 256
+
+    # the shortest string, and the number of times it must occur, to be put in the string
+    # table when ``interned`` is given.
+    min_interned = 8
+    min_occurrences = 2
+
+    # the types of the values merged with ``merged``, and the primitives they may hold.
+    mergeable = frozenset( [ tuple, frozenset, complex ] )
+    plain = frozenset( [ int, long, float, bool, types.NoneType, str, unicode ] )
 
     unsupported = set( [ types.GeneratorType, types.InstanceType ] )
     primitives = set( [ int, long, float, bool, types.NoneType, unicode, str, basestring ] )
     builtin_types = set( [ list, tuple, set, frozenset, dict, defaultdict, deque, object, type
-        , types.FunctionType, types.MethodType, types.ModuleType, complex ] )
+        , types.FunctionType, types.MethodType, types.ModuleType, complex, array, bytearray ] )
+    # field values of these types are never callable, so need not be checked.
+    inert = frozenset( [ int, long, float, bool, types.NoneType, unicode, str
+        , list, tuple, set, frozenset, dict, defaultdict, deque, complex, array, bytearray ]
+        + ( [ numpy.ndarray ] if numpy else [] ) )
+    if numpy :
+        builtin_types.add( numpy.ndarray )
+
+    def _dispatch ( self ) :
+        r"""The table of the functions that marshal each type (called with the encoder and
+        the value), shared by all encoders of this class with the same ``string_hook``,
+        ``interned`` and ``merged`` (or lack of them).  Types met that are not in it are
+        added as they are resolved through their MRO."""
+        kind = self.__class__
+        primitives, builtin_types = self.primitives, self.builtin_types
+        if self.string_hook :
+            primitives, builtin_types = primitives - _STRINGS, builtin_types | _STRINGS
+        dispatch = dict( ( typ, kind.idem.im_func ) for typ in primitives )
+        dispatch.update( ( typ, kind.unknown.im_func ) for typ in self.unsupported )
+        dispatch.update( ( typ, getattr( kind, "marshal_" + typ.__name__ ).im_func ) for typ in builtin_types )
+        dispatch.update( ( typ, kind.marshal_reduced.im_func ) for typ in _reducers )
+        if self.interned :
+            dispatch[str] = dispatch[unicode] = kind.intern_string.im_func
+        if self.merged :
+            dispatch.update( ( typ, kind.merge_value.im_func ) for typ in self.mergeable )
+        return dispatch
 
     def marshal ( self, obj ) :
-        self.objects = []
+        records = self.marshal_iter( obj )
+        payload = records.next()
+        out = [ SENTINEL, GenoshaTable( records ) if self.compact else list( records ), payload ]
+        if self.interned :
+            out.append( self.strings )
+        return out
+
+    def marshal_delta ( self, obj, snapshot = None ) :
+        r"""Marshal ``obj`` as a delta against ``snapshot``, the ``GenoshaSnapshot`` an
+        earlier ``marshal_delta`` left in ``self.snapshot`` (with none, everything is new).
+        Objects keep the oids they had then, and only the records of those that are new or
+        whose record has changed are listed.  The result is ``[ DELTA_SENTINEL, records,
+        payload, deleted ]`` (and the string table, with ``interned``) where ``deleted`` lists
+        the oids of the objects no longer reached; ``GenoshaDecoder.apply_delta`` patches the
+        graph loaded from the earlier ones with it.  ``columnar`` is not used.
+
+        Every object is still marshalled, to find those that changed, but only those are
+        handed on.  The snapshot holds on to every object in the graph until it is replaced."""
+        previous = snapshot or GenoshaSnapshot()
+        current = GenoshaSnapshot( previous.next_oid )
+        records = self._iterate( obj, previous, current )
+        payload = records.next()
+        current.oids = self.python_ids
+        current.files = self.saved
+        changed = GenoshaTable() if self.compact else []
+        for out in records :
+            fingerprint = current.fingerprints[out.oid] = _fingerprint( out, self.digests )
+            if previous.fingerprints.get( out.oid ) != fingerprint :
+                changed.append( out )
+        self.snapshot = current
+        out = [ DELTA_SENTINEL, changed, payload, sorted( oid for oid in previous.fingerprints if oid not in current.fingerprints ) ]
+        if self.interned :
+            out.append( self.strings )
+        return out
+
+    def marshal_iter ( self, obj ) :
+        r"""Generate the representation of ``obj`` a piece at a time: first the payload,
+        then each of the objects in turn.  An object is produced once it is complete and
+        everything listed ahead of it has been; only those still waiting are held on to.
+        With ``interned`` the string table is left in ``strings`` once all are produced."""
+        return self._iterate( obj )
+
+    def _iterate ( self, obj, previous = None, current = None ) :
+        r"""``marshal_iter``; given the snapshots ``previous`` and ``current``, for a delta
+        (see ``marshal_delta``), which is never columnar."""
+        self.previous, self.current = previous, current
+        self.objects = deque()
         self.python_ids = {}
+        self.strings = []
+        # the index in ``strings`` of each string put there, and how often each of the rest
+        # has occurred; by type, so that equal str and unicode values are kept apart.
+        self.string_indexes = { str : {}, unicode : {} }
+        self.string_counts = { str : {}, unicode : {} }
+        # with ``merged``: each value's class of equal values (by its id, keeping the value
+        # so the id is not reused), the class of each key and the oid of each class.
+        self.value_classes = {}
+        self.value_keys = {}
+        self.merged_ids = {}
+        # the side files arrays were saved to, by the digest of their contents, and the
+        # digests by the names of the files.
+        self.saved = {}
+        self.digests = {}
+        # values made along the way (reduced states), kept until the end so that the ids
+        # of what they hold are not reused by other objects.
+        self.kept = []
         self.deferred = deque()
+        self.stack = []
+        self.nesting = 0
         self.gc = gc and gc.isenabled()
+        if self.measured :
+            self.stats, self.nested, started = GenoshaStats(), 0.0, _timer()
+        if self.budgeted :
+            self._budget()
         gc and gc.disable()
         try :
-            payload = self._marshal( obj )
-            while len( self.deferred ) > 0 :
-                self._object( *self.deferred.popleft() )
-            return [ SENTINEL, self.objects, payload ]
+            yield self._marshal( obj )
+            for out in self._columnar( self._walk() ) if self.columnar and previous is None else self._walk() :
+                yield out
+            if self.measured :
+                _stats_done( self.stats, self.measured, started )
         finally :
+            self.kept = []
+            self.previous = self.current = None
             self.gc and gc.enable()
 
     def _id ( self, obj ) :
-        return self.python_ids.setdefault( id( obj ), len( self.python_ids ) )
+        ids = self.python_ids
+        if self.previous is None :
+            return ids.setdefault( id( obj ), len( ids ) )
+        # in a delta: the oid ``obj`` had in ``previous``, or a new one.
+        if id( obj ) not in ids :
+            oid = self.previous.oids.get( id( obj ) )
+            if oid is None :
+                oid = self.current.next_oid
+                self.current.next_oid += 1
+            ids[id( obj )] = oid
+            self.current.objects.append( obj )
+        return ids[id( obj )]
 
-    def _sequence ( self, obj, iterator ) :
-        _marshal = self._marshal
-        return [ _marshal( item ) for item in iterator( obj ) ]
+    def _plan ( self, obj ) :
+        r"""Work out (once per class) where the fields of ``obj`` and others like it are
+        found: the slots along its MRO that are marshalled, whether it has a ``__dict__``,
+        and, if its class is projected (see ``project``), the names of the other fields
+        included or those excluded."""
+        kind = obj.__class__
+        include, exclude, defaults = _projection( kind )
+        slots = tuple( slot for slot in _slots( kind ) if slot not in exclude and ( include is None or slot in include ) )
+        if include is not None :
+            include = tuple( name for name in include if name not in slots and name not in exclude )
+        plan = self.plans[kind] = ( slots, hasattr( obj, '__dict__' ), include, exclude )
+        return plan
 
-    def _map ( self, obj, iterator ) :
-        d = {}
-        _marshal = self._marshal
-        for key, value in iterator( obj ) :
-            d[_marshal( key )] = _marshal( value )
-        return d
+    def _fields ( self, obj, attributes ) :
+        slots, has_dict, include, exclude = self.plans.get( obj.__class__ ) or self._plan( obj )
+        inert = self.inert
+        if has_dict and include is not None :
+            mapping = obj.__dict__
+            fields = [ ( key, mapping[key] ) for key in include
+                    if key in mapping and ( type( mapping[key] ) in inert or not hasattr( mapping[key], '__call__' ) ) ]
+        elif has_dict and exclude :
+            fields = [ ( key, value ) for key, value in obj.__dict__.iteritems()
+                    if key[:2] != '__' and key not in exclude and ( type( value ) in inert or not hasattr( value, '__call__' ) ) ]
+        elif has_dict :
+            fields = [ ( key, value ) for key, value in obj.__dict__.iteritems()
+                    if key[:2] != '__' and ( type( value ) in inert or not hasattr( value, '__call__' ) ) ]
+        else :
+            fields = []
+        for slot in slots :
+            try :
+                value = getattr( obj, slot )
+            except AttributeError : # an empty slot
+                continue
+            if type( value ) in inert or not hasattr( value, '__call__' ) :
+                fields.append( ( slot, value ) )
+        if attributes :
+            fields.extend( attributes.items() )
+        return fields
+
+    def _object ( self, obj, out, items, attributes, is_instance, immutable = False ) :
+        r"""Populate ``out`` with the marshalled items and fields of ``obj``.
 
-    def _object ( self, obj, out, items, attributes, is_instance ) :
+        Children are marshalled directly, nesting as immutables (which must be complete
+        before they are listed) are met, until ``max_nesting`` is reached.  Past that the
+        work is left on ``stack`` as frames instead; every object between there and the
+        top of the walk notices the stack has grown and suspends itself beneath, and
+        ``_walk`` finishes the job without recursion.  Either way oids are assigned and
+        objects listed in exactly the same order, so graphs of any depth can be marshalled
+        and the output does not depend on how deep they are."""
+        stack = self.stack
+        depth = len( stack )
+        if self.nesting >= self.max_nesting :
+            return self._suspend( obj, out, items, None, attributes, is_instance, immutable, depth )
+        self.nesting += 1
+        _marshal = self._marshal
         if items is not None :
-            out.items = items( obj )
+            if type( items ) is tuple :
+                iterator, mode = items
+                iterator = iterator( obj )
+                if mode is _MAPPING :
+                    results = {}
+                    for key, value in iterator :
+                        # the value is marshalled ahead of its key, as ``d[key] = value`` does.
+                        value = _marshal( value )
+                        if len( stack ) != depth :
+                            self.nesting -= 1
+                            return self._suspend( obj, out, ( iterator, mode ), results, attributes, is_instance, immutable, depth, ( key, value ) )
+                        results[_marshal( key )] = value
+                        if len( stack ) != depth :
+                            self.nesting -= 1
+                            return self._suspend( obj, out, ( iterator, mode ), results, attributes, is_instance, immutable, depth )
+                else :
+                    results = []
+                    append = results.append
+                    for value in iterator :
+                        append( _marshal( value ) )
+                        if len( stack ) != depth :
+                            self.nesting -= 1
+                            return self._suspend( obj, out, ( iterator, mode ), results, attributes, is_instance, immutable, depth )
+                out.items = results
+            else :
+                out.items = items( obj )
+                if len( stack ) != depth :
+                    # the callable left immutables of its own on the stack; they come first.
+                    self.nesting -= 1
+                    return self._suspend( obj, out, None, None, attributes, is_instance, immutable, depth )
         if is_instance :
             fields = {}
-            _marshal = self._marshal
-            if hasattr( obj, '__dict__' ) :
-                for key, value in obj.__dict__.items() :
-                    if ( not key.startswith( '__' ) ) and ( not hasattr( value, '__call__' ) ) :
-                        fields[key] = _marshal( value )
-            elif hasattr( obj, '__slots__' ) :
-                for slot in obj.__slots__ :
-                    if ( not slot.startswith('__') ) and hasattr( obj, slot ) and not hasattr( getattr( obj, slot ), '__call__' ) :
-                        fields[slot] = _marshal( getattr( obj, slot ) )
-            if attributes :
-                for key, value in attributes.items() :
-                    fields[key] = _marshal( value )
+            iterator = iter( self._fields( obj, attributes ) )
+            for key, value in iterator :
+                fields[key] = _marshal( value )
+                if len( stack ) != depth :
+                    self.nesting -= 1
+                    stack.insert( depth, [ iterator, fields, out, _FIELDS, immutable, None ] )
+                    return out
             out.fields = fields
+        if immutable :
+            self.objects.append( out )
+        self.nesting -= 1
+        return out
+
+    def _suspend ( self, obj, out, items, results, attributes, is_instance, immutable, depth, pending = None ) :
+        r"""Leave what remains of populating ``out`` on the stack, below anything pushed
+        since ``depth``.  A frame is ``[ iterator, target, out, mode, append, pending ]``:
+        each child the iterator produces is marshalled into ``target`` (``pending`` holds a
+        key whose value is already done) and, once it is exhausted, ``target`` is stored on
+        ``out`` according to ``mode``.  ``append`` marks the last frame of an immutable,
+        which is listed in ``objects`` once it is finished."""
+        frames = []
+        if items is not None :
+            if type( items ) is tuple :
+                iterator, mode = items
+                if results is None :
+                    iterator, results = iterator( obj ), ( {} if mode is _MAPPING else [] )
+                frames.append( [ iterator, results, out, mode, False, pending ] )
+            else :
+                out.items = items( obj )
+        if is_instance :
+            frames.append( [ iter( self._fields( obj, attributes ) ), {}, out, _FIELDS, False, None ] )
+        if not frames :
+            frames.append( [ iter( () ), None, out, None, False, None ] )
+        frames[-1][4] = immutable
+        self.stack[depth:depth] = reversed( frames )
         return out
 
+    def _step ( self, frame ) :
+        r"""Advance a suspended frame; returns False if it was suspended again."""
+        stack = self.stack
+        depth = len( stack )
+        _marshal = self._marshal
+        iterator, target, out, mode, append, pending = frame
+        if mode is _FIELDS :
+            for key, value in iterator :
+                target[key] = _marshal( value )
+                if len( stack ) != depth :
+                    return False
+            out.fields = target
+        elif mode is _MAPPING :
+            if pending is not None :
+                frame[5] = None
+                target[_marshal( pending[0] )] = pending[1]
+                if len( stack ) != depth :
+                    return False
+            for key, value in iterator :
+                value = _marshal( value )
+                if len( stack ) != depth :
+                    frame[5] = ( key, value )
+                    return False
+                target[_marshal( key )] = value
+                if len( stack ) != depth :
+                    return False
+            out.items = target
+        elif mode is not None :
+            add = target.append
+            for value in iterator :
+                add( _marshal( value ) )
+                if len( stack ) != depth :
+                    return False
+            out.items = target
+        if append :
+            self.objects.append( out )
+        return True
+
+    def _walk ( self ) :
+        r"""Finish the frames left on the stack, then populate the deferred (mutable)
+        objects in the order they were found, until there is nothing left to do.  Whenever
+        the stack is empty everything listed ahead of the next deferred object is complete,
+        and is handed out."""
+        stack = self.stack
+        deferred = self.deferred
+        objects = self.objects
+        _step = self._step
+        _object = self._object
+        while True :
+            if stack :
+                if _step( stack[-1] ) :
+                    stack.pop()
+                continue
+            waiting = deferred[0][1] if deferred else None
+            while objects and objects[0] is not waiting :
+                yield objects.popleft()
+            if not deferred :
+                return
+            _object( *deferred.popleft() )
+
+    def _columnar ( self, records ) :
+        r"""Gather runs of ``records`` for instances of the same class, that have fields and
+        nothing else and the same field names, into columnar blocks.  A block is a single
+        object whose ``oid`` is the list of the instances' oids and whose ``columns`` map
+        each field name to the list of their values for it, in the same order."""
+        run = []
+        for out in records :
+            if hasattr( out, 'fields' ) and not hasattr( out, 'items' ) :
+                if run and ( out.type != run[0].type or out.fields.viewkeys() != run[0].fields.viewkeys() ) :
+                    for block in self._block( run ) :
+                        yield block
+                    run = []
+                run.append( out )
+            else :
+                for block in self._block( run ) :
+                    yield block
+                run = []
+                yield out
+        for block in self._block( run ) :
+            yield block
+
+    def _block ( self, run ) :
+        if len( run ) > 1 :
+            columns = dict( ( name, [ out.fields[name] for out in run ] ) for name in run[0].fields )
+            return [ self.object_hook( type = run[0].type, oid = [ out.oid for out in run ], columns = columns ) ]
+        return run
+
     def marshal_object ( self, obj, items = None, immutable = False, kind = None, attributes = None ) :
         is_instance = not kind
         if is_instance :
@@ -207,13 +1172,44 @@ class GenoshaEncoder ( object ) :
         oid = self._id( obj )
         out = self.object_hook( type = kind, oid = oid )
         if immutable :
-            self._object( obj, out, items, attributes, is_instance )
+            self._object( obj, out, items, attributes, is_instance, True )
         else :
             self.deferred.append( ( obj, out, items, attributes, is_instance ) )
-        self.objects.append( out )
+            self.objects.append( out )
         return self.reference_hook( oid )
 
+    def marshal_reduced ( self, obj ) :
+        r"""Marshal ``obj`` by the state its reducer gives (see ``register``): a list (or
+        tuple) or dict as the items, anything else marshalled as the items."""
+        reduce = self.reducers.get( obj.__class__ ) or self._reducer( obj.__class__ )
+        state = reduce( obj )
+        self.kept.append( state )
+        if type( state ) in ( list, tuple ) :
+            items = ( lambda o : iter( state ), _SEQUENCE )
+        elif type( state ) is dict :
+            items = ( lambda o : state.iteritems(), _MAPPING )
+        else :
+            items = lambda o : self._marshal( state )
+        return self.marshal_object( obj, items = items, immutable = True, kind = self.find_scoped_name( obj.__class__ ) )
+
+    def _reducer ( self, kind ) :
+        for base in kind.__mro__ :
+            if base in _reducers :
+                reduce = _reducers[base][0]
+                break
+            if '__genosha_reduce__' in base.__dict__ :
+                reduce = base.__genosha_reduce__
+                break
+        self.reducers[kind] = reduce
+        return reduce
+
     def marshal_list ( self, obj ) :
+        if self.packed and len( obj ) >= self.min_packed :
+            packed = _pack_list( obj )
+            if packed is not None :
+                if self.budgeted :
+                    self.spent += len( packed.data )
+                return self.marshal_object( obj, items = lambda o : packed )
         return self.marshal_object( obj, items = self.builders[list] )
 
     def marshal_tuple ( self, obj ) :
@@ -236,8 +1232,13 @@ class GenoshaEncoder ( object ) :
 
     def marshal_instancemethod ( self, obj ) :
         oid = self._id( obj )
-        out = self.object_hook( oid = oid, instance = self._marshal( obj.im_self ), attribute = obj.im_func.func_name )
-        self.objects.append( out )
+        out = self.object_hook( oid = oid, attribute = obj.im_func.func_name )
+        depth = len( self.stack )
+        out.instance = self._marshal( obj.im_self )
+        if len( self.stack ) != depth :
+            self.stack.insert( depth, [ iter( () ), None, out, None, True, None ] )
+        else :
+            self.objects.append( out )
         return self.reference_hook( oid )
 
     def marshal_function ( self, obj ) :
@@ -264,6 +1265,143 @@ class GenoshaEncoder ( object ) :
     def marshal_complex ( self, obj ) :
         return self.marshal_object( obj, items = ( lambda o : str( o )[1:-1] ), immutable = True )
 
+    def marshal_array ( self, obj ) :
+        if self.budgeted :
+            self.spent += len( obj ) * obj.itemsize
+        return self.marshal_object( obj, items = _pack_array )
+
+    def marshal_bytearray ( self, obj ) :
+        if self.budgeted :
+            self.spent += len( obj )
+        return self.marshal_object( obj, items = _pack_bytearray )
+
+    def marshal_ndarray ( self, obj ) :
+        r"""A numpy array is made, complete, from its items (so is treated as an immutable).
+        Subclasses keep their class but not their fields; a memmap is marshalled as the
+        ndarray it maps."""
+        if obj.dtype.hasobject and obj.dtype != object :
+            self.unknown( obj )
+        kind = self.find_scoped_name( numpy.ndarray if isinstance( obj, numpy.memmap ) else obj.__class__ )
+        if obj.dtype == object :
+            # the shape is a new tuple, kept so that its id is not reused by another's.
+            shape = obj.shape
+            self.kept.append( shape )
+            items = ( lambda o : chain( ( shape, ), o.ravel() ), _SEQUENCE )
+        else :
+            items = self._ndarray
+            if self.budgeted :
+                self.spent += obj.nbytes
+        return self.marshal_object( obj, items = items, immutable = True, kind = kind )
+
+    def _ndarray ( self, obj ) :
+        r"""The items of a numpy array: its shape with either the name of the side file it
+        was saved to or the strides and contents of its buffer, exported without copying
+        (the packed format is the dtype string, and a structured dtype is given as well)."""
+        items = { 'shape' : list( obj.shape ) }
+        if self.sidefiles and obj.nbytes >= self.min_sidefile :
+            digest = _array_digest( obj )
+            # in a delta, an array whose contents have not changed keeps its side file.
+            name = self.saved.get( digest ) or ( self.previous.files.get( digest ) if self.previous else None )
+            if name is None or not os.path.exists( name ) :
+                handle, name = tempfile.mkstemp( prefix = 'genosha-', suffix = '.npy', dir = self.sidefiles )
+                f = os.fdopen( handle, 'wb' )
+                try :
+                    numpy.save( f, obj )
+                finally :
+                    f.close()
+            self.saved[digest] = name
+            self.digests[name] = digest
+            items['file'] = self._marshal( name )
+            return items
+        if obj.flags.c_contiguous :
+            data = buffer( obj )
+        elif obj.flags.f_contiguous :
+            data = buffer( obj.T )
+        else :
+            obj = numpy.ascontiguousarray( obj )
+            data = buffer( obj )
+        items['strides'] = list( obj.strides )
+        items['data'] = GenoshaPacked( obj.dtype.str, data )
+        if obj.dtype.fields is not None :
+            items['dtype'] = _listed( obj.dtype.descr )
+        return items
+
+    def marshal_str ( self, obj ) :
+        return self.string_hook( obj )
+    marshal_unicode = marshal_basestring = marshal_str
+
+    def intern_string ( self, obj ) :
+        r"""Marshal a string with ``interned``: from its ``min_occurrences``th occurrence on,
+        a long enough one is referred to by its index in the string table."""
+        if len( obj ) >= self.min_interned :
+            indexes = self.string_indexes.get( type( obj ) ) # not subclasses, which are left as they are
+            if indexes is not None :
+                index = indexes.get( obj )
+                if index is not None :
+                    return self.interned_hook( index )
+                counts = self.string_counts[type( obj )]
+                count = counts.get( obj, 0 ) + 1
+                if count >= self.min_occurrences :
+                    counts.pop( obj, None )
+                    index = indexes[obj] = len( self.strings )
+                    self.strings.append( self.string_hook( obj ) if self.string_hook else obj )
+                    return self.interned_hook( index )
+                counts[obj] = count
+        return self.string_hook( obj ) if self.string_hook else obj
+
+    def merge_value ( self, obj ) :
+        r"""Marshal a tuple, frozenset or complex with ``merged``: one equal to a value
+        already marshalled is a reference to that instead."""
+        kind = type( obj )
+        if kind in self.mergeable :
+            value = self._value_class( obj )
+            if value is not None :
+                oid = self.merged_ids.get( value )
+                if oid is not None :
+                    return self.reference_hook( oid )
+                out = getattr( self, "marshal_" + kind.__name__ )( obj )
+                self.merged_ids[value] = self.python_ids[id( obj )]
+                return out
+        else : # a subclass, which is marshalled as its base is but never merged.
+            kind = ( base for base in kind.__mro__ if base in self.mergeable ).next()
+        return getattr( self, "marshal_" + kind.__name__ )( obj )
+
+    def _value_class ( self, obj ) :
+        r"""The number of the class of values equal to ``obj`` (of the same types all the way
+        down), or None if it holds anything that is not mergeable.  The class is found from
+        a key of the type and the parts: primitives by their type and value (zeros by their
+        sign as well), the rest by their own class; so it is worked out once for each value,
+        without recursion, however deeply they nest."""
+        known = self.value_classes
+        entry = known.get( id( obj ) )
+        if entry is not None :
+            return entry[1]
+        mergeable, plain, keys = self.mergeable, self.plain, self.value_keys
+        stack = [ _merge_frame( obj ) ]
+        while stack :
+            value, parts, key = stack[-1]
+            for part in parts :
+                kind = type( part )
+                if kind in plain :
+                    key.append( ( kind, part, part == 0 and str( part ) ) if kind is float else ( kind, part ) )
+                    continue
+                entry = known.get( id( part ) ) if kind in mergeable else ( None, None )
+                if entry is None : # its class is added once it is worked out.
+                    stack.append( _merge_frame( part ) )
+                    break
+                if entry[1] is None : # and so neither is anything holding it.
+                    for value, parts, key in stack :
+                        known[id( value )] = ( value, None )
+                    return None
+                key.append( entry[1] )
+            else :
+                stack.pop()
+                key = ( type( value ), frozenset( key ) if type( value ) is frozenset else tuple( key ) )
+                known[id( value )] = ( value, keys.setdefault( key, len( keys ) ) )
+                if stack :
+                    stack[-1][2].append( known[id( value )][1] )
+        return known[id( obj )][1]
+
     def idem ( self, obj ) :
         return obj
 
@@ -276,36 +1414,685 @@ class GenoshaEncoder ( object ) :
         typ = type( obj )
         dispatch = self.dispatch
         if typ in dispatch :
-            return dispatch[typ]( obj )
+            return dispatch[typ]( self, obj )
+        return self._handler( typ )( self, obj )
+
+    def _handler ( self, typ ) :
+        r"""The function marshalling values of ``typ``, which is not in ``dispatch`` yet: that
+        of the first of its bases that is (unless it reduces itself), or ``marshal_object``.
+        It is added to ``dispatch``, unless ``typ`` is the lazy subclass a decoder made (see
+        ``GenoshaDecoder._lazy_class``), which is handled as its class is but not kept: it
+        would keep the decoder, and all it made, alive."""
+        dispatch = self.dispatch
+        if '_genosha_decoder' in typ.__dict__ :
+            kind = typ.__bases__[0]
+            return dispatch.get( kind ) or self._handler( kind )
+        if hasattr( typ, '__genosha_reduce__' ) :
+            f = dispatch[typ] = self.__class__.marshal_reduced.im_func
+            return f
         for kind in typ.__mro__ :
             if kind in dispatch :
-                f = dispatch[kind]
-                dispatch[typ] = f
-                return f( obj )
-        dispatch[typ] = self.marshal_object
-        return self.marshal_object( obj )
+                f = dispatch[typ] = dispatch[kind]
+                return f
+        f = dispatch[typ] = self.__class__.marshal_object.im_func
+        return f
+
+    def _budget ( self ) :
+        r"""Start charging marshalling to the budgets.  Each object met is noted in
+        ``lineage`` with the object holding it (its ``parent``) and its depth, and the
+        object populating each record in ``holders``, so that the values met populating it
+        are charged to it; ``parent`` and ``depth`` are those of the object populated."""
+        self.lineage = {}
+        self.holders = {}
+        self.parent, self.depth = None, -1
+        self.spent = self.values = 0
+        self.expires = _timer() + self.deadline
+
+    def _budgeted_marshal ( self, obj ) :
+        r"""``_marshal``, charging the value to the budgets."""
+        python_ids = self.python_ids
+        if id( obj ) in python_ids :
+            return self.reference_hook( python_ids[ id( obj ) ] )
+        typ = type( obj )
+        self.spent += self.value_bytes + ( len( obj ) if typ is str or typ is unicode else 0 )
+        if typ not in self.primitives :
+            depth = self.depth + 1
+            self.lineage[id( obj )] = ( self.parent, depth )
+            if depth > self.max_depth :
+                self._exceeded( 'max_depth', obj )
+        known = len( python_ids )
+        out = self.__class__._marshal( self, obj )
+        if len( python_ids ) != known :
+            self.spent += self.object_bytes
+            if len( python_ids ) > self.max_objects :
+                self._exceeded( 'max_objects', obj )
+        if self.spent > self.max_bytes :
+            self._exceeded( 'max_bytes', obj )
+        self.values += 1
+        if not self.values % self.deadline_every and _timer() > self.expires :
+            self._exceeded( 'deadline', obj )
+        return out
+
+    def _budgeted_object ( self, obj, out, *args ) :
+        # ``_object``, charging the values met populating ``out`` to ``obj``.
+        outer = self.parent, self.depth
+        entry = self.lineage.get( id( obj ) )
+        self.parent, self.depth = obj, entry[1] if entry else self.depth + 1
+        self.holders[id( out )] = obj
+        try :
+            return self.__class__._object( self, obj, out, *args )
+        finally :
+            self.parent, self.depth = outer
+
+    def _budgeted_step ( self, frame ) :
+        # ``_step``, charging the values met to the object the frame populates.
+        outer = self.parent, self.depth
+        holder = self.holders.get( id( frame[2] ) )
+        if holder is not None :
+            self.parent, self.depth = holder, self.lineage[id( holder )][1]
+        try :
+            return self.__class__._step( self, frame )
+        finally :
+            self.parent, self.depth = outer
+
+    def _exceeded ( self, budget, obj ) :
+        # raise ``GenoshaBudgetExceeded`` for ``budget``, going over it marshalling ``obj``.
+        lineage, path = self.lineage, []
+        holder = ( lineage.get( id( obj ) ) or ( self.parent, ) )[0]
+        while holder is not None and len( path ) <= len( lineage ) :
+            path.append( holder )
+            holder = lineage[id( holder )][0] if id( holder ) in lineage else None
+        names = self.scoped_names
+        raise GenoshaBudgetExceeded( budget, getattr( self, budget ), _type_name( type( obj ), names )
+                , [ _type_name( type( holder ), names ) for holder in reversed( path ) ] )
+
+    def _measured_marshal ( self, obj ) :
+        r"""``_marshal``, counting and timing the value for ``stats``.  Each value is
+        charged its own time: that of the values within it (``nested``) is taken off."""
+        if id( obj ) in self.python_ids :
+            return self.reference_hook( self.python_ids[ id( obj ) ] )
+        stats, outer, started = self.stats, self.nested, _timer()
+        self.nested = 0.0
+        try :
+            return self._unmeasured_marshal( obj )
+        finally :
+            elapsed = _timer() - started
+            name = _type_name( type( obj ), self.scoped_names )
+            stats.counts[name] += 1
+            stats.times[name] += elapsed - self.nested
+            stats.max_deferred = max( stats.max_deferred, len( self.deferred ) )
+            self.nested = outer + elapsed
+
+    def _measured_object ( self, obj, *args ) :
+        # ``_object``, timed as ``_measured_marshal`` does (populating deferred objects included).
+        stats, outer, started = self.stats, self.nested, _timer()
+        self.nested = 0.0
+        try :
+            return self._unmeasured_object( obj, *args )
+        finally :
+            elapsed = _timer() - started
+            stats.times[_type_name( type( obj ), self.scoped_names )] += elapsed - self.nested
+            self.nested = outer + elapsed
+
+    def _measured_find_scoped_name ( self, obj ) :
+        self.stats.lookups += 1
+        if obj not in self.scoped_names :
+            self.stats.misses += 1
+        return self.__class__.find_scoped_name( self, obj )
 
     scoping_types = set( [ types.TypeType, types.FunctionType ] )
     def find_scoped_name ( self, obj ) :
         if obj in self.scoped_names :
             return self.scoped_names[obj]
-        scopes = deque()
-        seen = set()
-        name = obj.__name__
-        scopes.append( ( [], sys.modules[obj.__module__] ) )
-        while len( scopes ) > 0 :
+        module = sys.modules[obj.__module__]
+        if getattr( module, obj.__name__, None ) is obj :
+            sn = self.scoped_names[ obj ] = "%s/%s" % ( module.__name__, obj.__name__ )
+            return sn
+        index = self.scope_index.get( module.__name__ )
+        if index is None or index[0] is not module or not self._located( obj, index[1] ) :
+            # new, replaced or changed since it was indexed.
+            index = self.scope_index[module.__name__] = ( module, self._index( module ) )
+        if not self._located( obj, index[1] ) :
+            raise TypeError, "%s.%s cannot be located in any nested scope. This type is not supported." % ( obj.__module__, obj.__name__ )
+        sn = index[1][id( obj )][1]
+        self.scoped_names[ obj ] = sn
+        return sn
+
+    def _index ( self, module ) :
+        r"""Index the classes and functions found in ``module`` (or, breadth-first, in the
+        classes and functions within it) under their own names: the id of each maps to the
+        object, its scoped name and the path of names leading to it.  Building it costs a
+        scan of the module, after which every lookup in it is immediate."""
+        index = {}
+        scopes = deque( [ ( (), module ) ] )
+        seen = set( [ id( module ) ] )
+        prefix = module.__name__ + "/"
+        while scopes :
             path, scope = scopes.popleft()
-            if getattr( scope, name, None ) is obj :
-                path.append( scope.__name__ )
-                path.append( name )
-                sn = "%s/%s" % ( path[0], ".".join( path[1:] ) )
-                self.scoped_names[ obj ] = sn
-                return sn
-            seen.add( id( scope ) )
-            for child in scope.__dict__.values() :
+            for key, child in scope.__dict__.items() :
+                if type( child ) is staticmethod :
+                    child = child.__get__( None, scope )
+                if isinstance( child, ( type, types.FunctionType ) ) and child.__name__ == key and id( child ) not in index :
+                    index[id( child )] = ( child, prefix + ".".join( path + ( key, ) ), path + ( key, ) )
                 if type( child ) in self.scoping_types and id( child ) not in seen :
-                    scopes.append( ( path + [ scope.__name__ ], child ) )
-        raise TypeError, "%s.%s cannot be located in any nested scope. This type is not supported." % ( obj.__module__, obj.__name__ )
+                    seen.add( id( child ) )
+                    scopes.append( ( path + ( child.__name__, ), child ) )
+        return index
+
+    def _located ( self, obj, index ) :
+        # whether ``index`` has ``obj``, still found where it was when it was indexed.
+        entry = index.get( id( obj ) )
+        if entry is None or entry[0] is not obj :
+            return False
+        scope = sys.modules[obj.__module__]
+        for name in entry[2] :
+            scope = getattr( scope, name, None )
+        return scope is obj
+
+class GenoshaEstimate ( object ) :
+    r"""What ``estimate`` found: the number of ``objects`` (each a record of the output),
+    of ``references`` to them and of primitive ``values``; by type name (as in
+    ``GenoshaStats``), the ``counts`` of values of each type and the estimated bytes of
+    output for them (``sizes``); and ``size``, the estimate for the whole."""
+    __slots__ = ( 'format', 'objects', 'references', 'values', 'counts', 'sizes', 'size' )
+    def __init__ ( self, format ) :
+        self.format = format
+        self.objects = self.references = self.values = self.size = 0
+        self.counts = defaultdict( int )
+        self.sizes = defaultdict( int )
+    def __repr__ ( self ) :
+        return "<GenoshaEstimate: %d objects, %d references, %d values, about %d bytes of %s>" % ( self.objects, self.references, self.values, self.size, self.format )
+
+class GenoshaEstimator ( GenoshaEncoder ) :
+    r"""Walks a graph as the encoder would, finding the types of its values and the fields
+    of its objects in the same way and rejecting the same ones, but makes no records of
+    it; instead the size of the output is estimated from ``costs``.  ``packed`` is taken
+    into account; the savings of ``interned``, ``merged`` and ``columnar`` are not, so the
+    estimate for them is an upper bound.  The sizes are of the text written, for JSON and
+    XML (with the default separators, and no escaping), and of the data stored, for SQL
+    (not the size of the database file)."""
+
+    # the bytes of output for each part of a record, by format: ``record`` (plus the type
+    # name and oid), ``method`` (plus the attribute name), ``fields`` and ``items`` when
+    # there are any, ``field`` (plus the name), ``item`` and ``entry`` (of a mapping) each,
+    # ``reference`` (plus the oid), ``string`` and ``number`` around a primitive (``typed``
+    # adds the name of its type), ``packed`` plus ``ratio`` per byte, and the ``document``.
+    costs = { 'json' : { 'record' : 21, 'method' : 24, 'fields' : 10, 'items' : 10, 'field' : 6, 'item' : 2, 'entry' : 4
+                , 'reference' : 8, 'string' : 2, 'number' : 0, 'typed' : False, 'packed' : 25, 'ratio' : 4 / 3.0, 'document' : 24 }
+            , 'xml' : { 'record' : 44, 'method' : 60, 'fields' : 28, 'items' : 28, 'field' : 76, 'item' : 13, 'entry' : 44
+                , 'reference' : 19, 'string' : 31, 'number' : 31, 'typed' : True, 'packed' : 36, 'ratio' : 4 / 3.0, 'document' : 50 }
+            , 'sql' : { 'record' : 40, 'method' : 44, 'fields' : 13, 'items' : 18, 'field' : 20, 'item' : 11, 'entry' : 14
+                , 'reference' : 12, 'string' : 5, 'number' : 5, 'typed' : True, 'packed' : 16, 'ratio' : 1, 'document' : 30 } }
+
+    # how the values each marshalling function handles are walked.
+    _LEAF, _CALL, _SEQUENCE, _MAPPING, _FIELDS, _COMPLEX, _PACKED, _NDARRAY, _REDUCED, _METHOD, _MERGED = range( 11 )
+    walks = { GenoshaEncoder.idem.im_func : _LEAF, GenoshaEncoder.marshal_str.im_func : _LEAF, GenoshaEncoder.intern_string.im_func : _LEAF
+            , GenoshaEncoder.unknown.im_func : _CALL, GenoshaEncoder.marshal_function.im_func : _CALL
+            , GenoshaEncoder.marshal_type.im_func : _CALL, GenoshaEncoder.marshal_module.im_func : _CALL
+            , GenoshaEncoder.marshal_list.im_func : _SEQUENCE, GenoshaEncoder.marshal_tuple.im_func : _SEQUENCE
+            , GenoshaEncoder.marshal_set.im_func : _SEQUENCE, GenoshaEncoder.marshal_frozenset.im_func : _SEQUENCE
+            , GenoshaEncoder.marshal_deque.im_func : _SEQUENCE, GenoshaEncoder.marshal_dict.im_func : _MAPPING
+            , GenoshaEncoder.marshal_defaultdict.im_func : _MAPPING, GenoshaEncoder.marshal_object.im_func : _FIELDS
+            , GenoshaEncoder.marshal_complex.im_func : _COMPLEX, GenoshaEncoder.marshal_array.im_func : _PACKED
+            , GenoshaEncoder.marshal_bytearray.im_func : _PACKED, GenoshaEncoder.marshal_ndarray.im_func : _NDARRAY
+            , GenoshaEncoder.marshal_reduced.im_func : _REDUCED, GenoshaEncoder.marshal_instancemethod.im_func : _METHOD
+            , GenoshaEncoder.merge_value.im_func : _MERGED }
+
+    def estimate ( self, obj, format = 'json' ) :
+        if format not in self.costs :
+            raise ValueError, "Unknown format: %s" % format
+        cost = self.cost = self.costs[format]
+        result = GenoshaEstimate( format )
+        # what the functions marshalling functions, types and modules use.
+        self.objects, self.python_ids, self.deferred, self.stack, self.nesting = deque(), {}, deque(), [], 0
+        dispatch, walks, python_ids = self.dispatch, self.walks, self.python_ids
+        walk_leaf, walk_fields = self._LEAF, self._FIELDS
+        # the types of primitives (subclasses are added as they are met), and the number of
+        # them and of their characters met, by type.
+        self.leaves = set( typ for typ, f in dispatch.items() if walks.get( f ) is walk_leaf )
+        self.counts, self.lengths = defaultdict( int ), defaultdict( int )
+        # values made along the way (reduced states) are kept so that their ids are not reused.
+        self.kept = []
+        # by type, how values of it are walked; by class, the size of a record but for its parts.
+        kinds, self.heads = {}, {}
+        pending = self.pending = []
+        self._values( ( obj, ) )
+        result.size = cost['document']
+        counts, sizes = result.counts, result.sizes
+        names = {}
+        while pending :
+            value = pending.pop()
+            typ = type( value )
+            walk = kinds.get( typ )
+            if walk is None :
+                walk = kinds[typ] = walks.get( dispatch.get( typ ) or self._handler( typ ), walk_fields )
+            if walk is walk_leaf : # a subclass of a primitive type
+                self.leaves.add( typ )
+                self._values( ( value, ) )
+                continue
+            # an object: referred to wherever it occurs, and a record the first time.
+            result.references += 1
+            oid = python_ids.get( id( value ) )
+            if oid is not None :
+                size = cost['reference'] + len( str( oid ) )
+            else :
+                oid = python_ids[id( value )] = len( python_ids )
+                size = cost['reference'] + 2 * len( str( oid ) ) + self._record( value, typ, walk, cost )
+                result.objects += 1
+            # named once a record has found the scoped name of the type, if it has one.
+            name = names.get( typ ) or names.setdefault( typ, _type_name( typ, self.scoped_names ) )
+            counts[name] += 1
+            sizes[name] += size
+            result.size += size
+        for typ, count in self.counts.iteritems() :
+            name = _type_name( typ, self.scoped_names )
+            size = self.lengths[typ] + count * ( cost['string' if typ in _STRINGS else 'number'] + ( len( typ.__name__ ) if cost['typed'] else 0 ) )
+            counts[name] += count
+            sizes[name] += size
+            result.values += count
+            result.size += size
+        del self.objects, self.deferred, self.stack, self.pending, self.kept, self.heads
+        return result
+
+    def _values ( self, values ) :
+        # tally the primitives among ``values`` by type (they are sized at the end), and leave
+        # the objects among them in ``pending``.
+        leaves, counts, lengths, pending = self.leaves, self.counts, self.lengths, self.pending
+        for value in values :
+            typ = type( value )
+            if typ in leaves :
+                counts[typ] += 1
+                lengths[typ] += len( value ) if typ is str or typ is unicode else len( repr( value ) if typ is float else str( value ) )
+            else :
+                pending.append( value )
+
+    def _record ( self, obj, typ, walk, cost ) :
+        r"""The estimated size of the record of ``obj`` (but for its oid and the primitives in
+        it); the objects in it are left in ``pending``."""
+        if walk is self._METHOD :
+            self.pending.append( obj.im_self )
+            return cost['method'] + len( obj.im_func.func_name )
+        size = cost['record']
+        if walk is self._CALL :
+            # these raise what the encoder would, or make a record with no parts.
+            self.dispatch[typ]( self, obj )
+            self.objects.clear()
+            return size + len( self.scoped_names.get( obj ) or obj.__name__ )
+        if walk is self._MERGED :
+            walk = self._COMPLEX if isinstance( obj, complex ) else self._SEQUENCE
+        size = self.heads.get( obj.__class__ ) or self.heads.setdefault( obj.__class__, size + len( self.find_scoped_name( obj.__class__ ) ) )
+        attributes = None
+        if walk is self._SEQUENCE :
+            packed = self.packed and type( obj ) is list and len( obj ) >= self.min_packed and _pack_list( obj )
+            if packed :
+                size += cost['packed'] + int( len( packed.data ) * cost['ratio'] )
+            else :
+                size += cost['items'] + cost['item'] * len( obj )
+                self._values( obj )
+        elif walk is self._MAPPING :
+            size += cost['items'] + cost['entry'] * len( obj )
+            self._values( chain.from_iterable( obj.iteritems() ) )
+            if isinstance( obj, defaultdict ) :
+                attributes = { 'default_factory' : obj.default_factory }
+        elif walk is self._COMPLEX :
+            size += cost['items'] + len( str( obj ) )
+        elif walk is self._PACKED :
+            size += cost['packed'] + int( len( obj ) * getattr( obj, 'itemsize', 1 ) * cost['ratio'] )
+        elif walk is self._NDARRAY or walk is self._REDUCED :
+            # made from their items alone, with no fields.
+            if walk is self._REDUCED :
+                state = ( self.reducers.get( obj.__class__ ) or self._reducer( obj.__class__ ) )( obj )
+            elif obj.dtype.hasobject :
+                state = list( obj.ravel() )
+            else :
+                return size + cost['packed'] + int( obj.nbytes * cost['ratio'] )
+            self.kept.append( state )
+            if type( state ) in ( list, tuple ) :
+                size += cost['items'] + cost['item'] * len( state )
+                self._values( state )
+            elif type( state ) is dict :
+                size += cost['items'] + cost['entry'] * len( state )
+                self._values( chain.from_iterable( state.iteritems() ) )
+            else :
+                size += cost['items']
+                self._values( ( state, ) )
+            return size
+        slots, has_dict = ( self.plans.get( obj.__class__ ) or self._plan( obj ) )[:2]
+        fields = ( slots or has_dict or attributes ) and self._fields( obj, attributes )
+        if fields :
+            size += cost['fields'] + cost['field'] * len( fields )
+            values = []
+            for key, value in fields :
+                size += len( key )
+                values.append( value )
+            self._values( values )
+        return size
+
+class GenoshaFingerprinter ( GenoshaEncoder ) :
+    r"""Marshals a graph as the encoder would and hashes the records, bottom up: each object
+    is hashed from its record with every reference replaced by the hash of the object it
+    refers to, so that neither oids nor the order of the objects count.  The entries of
+    dicts and sets are taken in the order of their hashes.
+
+    The objects of a cycle (a strongly connected component of the graph, found without
+    recursion) cannot be hashed after each other.  Each is first hashed with the references
+    within the cycle left out, then again with those references replaced by those first
+    hashes; the cycle's hash is that of all of these, and each object's is that of the
+    cycle with its own.  Objects of a cycle that are alike but for which of the others they
+    refer to may therefore be exchanged without changing the hashes."""
+
+    def marshal_set ( self, obj ) :
+        self.unordered.add( self._id( obj ) )
+        return GenoshaEncoder.marshal_set( self, obj )
+
+    def marshal_frozenset ( self, obj ) :
+        self.unordered.add( self._id( obj ) )
+        return GenoshaEncoder.marshal_frozenset( self, obj )
+
+    def fingerprint ( self, obj, oids = False ) :
+        self.unordered = set()
+        records = self.marshal_iter( obj )
+        payload = records.next()
+        records = dict( ( out.oid, out ) for out in records )
+        references = dict( ( oid, self._references( out ) ) for oid, out in records.iteritems() )
+        hashes = {}
+        for component in self._components( references ) :
+            if len( component ) == 1 and component[0] not in references[component[0]] :
+                oid = component[0]
+                hashes[oid] = self._hash( records[oid], hashes )
+                continue
+            within = set( component )
+            first = dict( ( oid, self._hash( records[oid], hashes, within ) ) for oid in component )
+            second = dict( ( oid, self._hash( records[oid], hashes, within, first ) ) for oid in component )
+            cycle = hashlib.sha1( "".join( sorted( second.itervalues() ) ) ).hexdigest()
+            hashes.update( ( oid, hashlib.sha1( cycle + second[oid] ).hexdigest() ) for oid in component )
+        result = hashlib.sha1( self._canonical( payload, hashes ) ).hexdigest()
+        return ( result, hashes ) if oids else result
+
+    def _references ( self, out ) :
+        # the oids referred to by the record ``out``.
+        found = set()
+        pending = [ getattr( out, 'items', None ), getattr( out, 'instance', None ) ]
+        if hasattr( out, 'fields' ) :
+            pending.extend( out.fields.itervalues() )
+        while pending :
+            value = pending.pop()
+            kind = type( value )
+            if kind is GenoshaReference :
+                found.add( value.oid )
+            elif kind is list :
+                pending.extend( value )
+            elif kind is dict :
+                pending.extend( value.iterkeys() )
+                pending.extend( value.itervalues() )
+        return found
+
+    def _components ( self, references ) :
+        r"""The strongly connected components (lists of oids) of the graph given by the
+        ``references`` of each oid, each after every one it refers to (Tarjan's algorithm,
+        with an explicit stack)."""
+        index, low, stack, on_stack = {}, {}, [], set()
+        for start in references :
+            if start in index :
+                continue
+            frames = [ ( start, iter( references[start] ) ) ]
+            index[start] = low[start] = len( index )
+            stack.append( start )
+            on_stack.add( start )
+            while frames :
+                oid, children = frames[-1]
+                for child in children :
+                    if child not in index :
+                        index[child] = low[child] = len( index )
+                        stack.append( child )
+                        on_stack.add( child )
+                        frames.append( ( child, iter( references[child] ) ) )
+                        break
+                    if child in on_stack :
+                        low[oid] = min( low[oid], index[child] )
+                else :
+                    frames.pop()
+                    if frames :
+                        parent = frames[-1][0]
+                        low[parent] = min( low[parent], low[oid] )
+                    if low[oid] == index[oid] :
+                        component = []
+                        while True :
+                            member = stack.pop()
+                            on_stack.discard( member )
+                            component.append( member )
+                            if member == oid :
+                                break
+                        yield component
+
+    def _hash ( self, out, hashes, within = (), first = None ) :
+        # the hash of the record ``out``, its references to objects ``within`` its cycle
+        # replaced by their ``first`` hashes (or left out).
+        unordered = out.oid in self.unordered
+        parts = [ repr( getattr( out, 'type', None ) ), repr( getattr( out, 'attribute', None ) ) ]
+        for name in ( 'instance', 'items', 'fields' ) :
+            if hasattr( out, name ) :
+                parts.append( name + self._canonical( getattr( out, name ), hashes, within, first, unordered and name == 'items' ) )
+        return hashlib.sha1( "\0".join( parts ) ).hexdigest()
+
+    def _canonical ( self, value, hashes, within = (), first = None, unordered = False ) :
+        # the text hashed for the marshalled ``value``.
+        kind = type( value )
+        if kind is GenoshaReference :
+            if value.oid in within :
+                return "@" + ( first[value.oid] if first else "" )
+            return "#" + hashes[value.oid]
+        if kind is list :
+            parts = [ self._canonical( item, hashes, within, first ) for item in value ]
+            return "[%s]" % ",".join( sorted( parts ) if unordered else parts )
+        if kind is dict :
+            return "{%s}" % ",".join( sorted( "%s:%s" % ( self._canonical( key, hashes, within, first ), self._canonical( item, hashes, within, first ) )
+                    for key, item in value.iteritems() ) )
+        if kind is GenoshaPacked :
+            return "<%s:%s>" % ( value.format, hashlib.sha1( value.data ).hexdigest() )
+        return "%s:%r" % ( kind.__name__, value )
+
+class GenoshaCloner ( GenoshaEncoder ) :
+    r"""Copies a graph by the rules of marshalling it and unmarshalling the result, but makes
+    no records: the graph is walked as the encoder walks it (finding the types of its values
+    and the fields of its objects in the same way, and rejecting the same ones) and each
+    copy is made as the decoder would make it from the record (see ``decoder``, a
+    ``GenoshaDecoder`` given ``defaults``).  Objects made empty and populated are made as
+    they are met and populated afterwards in the order they were met; those made complete
+    (tuples, frozensets, reduced objects, methods, ...) are made once what they hold is,
+    without recursion however deeply they nest.  Functions, types and modules are shared.
+
+    ``merged`` shares one copy among equal immutables, as the unmarshalled graph would; the
+    other options only shape a serialized form, and are not used (budgets and ``stats``
+    are not supported)."""
+
+    # values are walked as ``GenoshaEstimator`` walks them.
+    walks = GenoshaEstimator.walks
+    _LEAF, _CALL, _SEQUENCE, _MAPPING, _FIELDS, _COMPLEX, _PACKED, _NDARRAY, _REDUCED, _METHOD, _MERGED = tuple( getattr( GenoshaEstimator, name )
+            for name in ( '_LEAF', '_CALL', '_SEQUENCE', '_MAPPING', '_FIELDS', '_COMPLEX', '_PACKED', '_NDARRAY', '_REDUCED', '_METHOD', '_MERGED' ) )
+
+    def __init__ ( self, defaults = False, **options ) :
+        GenoshaEncoder.__init__( self, **options )
+        if self.budgeted or self.measured :
+            raise ValueError, "Budgets and statistics are not supported when cloning."
+        self.sidefiles = None
+        self.decoder = GenoshaDecoder( defaults = defaults )
+        walk_leaf = self._LEAF
+        self.leaves = frozenset( typ for typ, f in self.dispatch.iteritems() if self.walks.get( f ) is walk_leaf )
+
+    def clone ( self, obj ) :
+        r"""Copy ``obj`` (and its graph), returning the copy."""
+        # the copy of each object met, by id; the objects made empty, with their copies, to be
+        # populated; the frames of those being made complete (see ``_run``) and their ids.
+        self.copies, self.filling, self.frames, self.making = {}, deque(), [], set()
+        self.kept = []
+        # with ``merged``: the copy made for each class of equal values.
+        self.merged_copies, self.value_classes, self.value_keys = {}, {}, {}
+        # what the functions marshalling functions, types and modules use.
+        self.objects, self.python_ids, self.deferred, self.stack, self.nesting = deque(), {}, deque(), [], 0
+        decoder, filling, _fill = self.decoder, self.filling, self._fill
+        self.gc = gc and gc.isenabled()
+        gc and gc.disable()
+        try :
+            copy = obj if type( obj ) in self.leaves else self._copy( obj )
+            filled = []
+            while filling :
+                value, shell, walk = filling.popleft()
+                _fill( value, shell, walk )
+                filled.append( ( shell, None ) )
+            if decoder.defaults :
+                decoder._default( filled )
+            return copy
+        finally :
+            del self.copies, self.filling, self.frames, self.making, self.kept, self.merged_copies, self.value_classes, self.value_keys
+            del self.objects, self.python_ids, self.deferred, self.stack
+            self.gc and gc.enable()
+
+    def _copy ( self, value ) :
+        # the copy of ``value``, which has not been met yet.
+        copy = self._begin( value )
+        return self._run() if copy is _PENDING else copy
+
+    def _begin ( self, value ) :
+        r"""Begin copying ``value``: what is made at once (or made empty, to be populated) is
+        returned, otherwise a frame ``[ parts, results, value, kind, mode, key ]`` is pushed
+        for the parts it is made from and ``_PENDING`` returned."""
+        typ = type( value )
+        f = self.dispatch.get( typ ) or self._handler( typ )
+        walk = self.walks.get( f, self._FIELDS )
+        copies = self.copies
+        if walk is self._LEAF : # a subclass of a primitive type
+            return value
+        if walk is self._CALL :
+            # these raise what the encoder would, or are the same object once unmarshalled.
+            f( self, value )
+            self.objects.clear()
+            copies[id( value )] = value
+            return value
+        if walk is self._METHOD :
+            return self._push( value, None, iter( ( value.im_self, ) ), self._METHOD, None )
+        key = None
+        if walk is self._MERGED :
+            if typ in self.mergeable :
+                key = self._value_class( value )
+                if key in self.merged_copies :
+                    copy = copies[id( value )] = self.merged_copies[key]
+                    return copy
+            walk = self._COMPLEX if isinstance( value, complex ) else self._SEQUENCE
+        kind = numpy.ndarray if walk is self._NDARRAY and isinstance( value, numpy.memmap ) else value.__class__
+        if kind not in self.scoped_names :
+            self.find_scoped_name( kind )
+        mutability = self.decoder.mutability
+        if kind not in mutability :
+            mutability[kind] = self.decoder._constructor( kind )
+        make = mutability[kind]
+        if walk is self._FIELDS or not make and ( walk is self._SEQUENCE or walk is self._MAPPING ) :
+            shell = copies[id( value )] = kind.__new__( kind )
+            self.filling.append( ( value, shell, walk ) )
+            return shell
+        if walk is self._SEQUENCE :
+            return self._push( value, kind, iter( value ), self._SEQUENCE, key )
+        if walk is self._MAPPING :
+            return self._push( value, kind, _flatten( value ), self._MAPPING, key )
+        if walk is self._REDUCED :
+            state = ( self.reducers.get( kind ) or self._reducer( kind ) )( value )
+            self.kept.append( state )
+            if type( state ) in ( list, tuple ) :
+                return self._push( value, kind, iter( state ), self._SEQUENCE, key )
+            if type( state ) is dict :
+                return self._push( value, kind, _flatten( state ), self._MAPPING, key )
+            return self._push( value, kind, iter( ( state, ) ), None, key )
+        if walk is self._NDARRAY :
+            if value.dtype.hasobject and value.dtype != object :
+                self.unknown( value )
+            if value.dtype == object :
+                # the shape is a new tuple, kept so that its id is not reused by another's.
+                shape = value.shape
+                self.kept.append( shape )
+                return self._push( value, kind, chain( ( shape, ), value.ravel() ), self._SEQUENCE, key )
+            copy = make( kind, self._ndarray( value ) )
+        elif walk is self._COMPLEX :
+            copy = make( kind, str( value )[1:-1] )
+        else : # packed
+            copy = make( kind, ( _pack_array if isinstance( value, array ) else _pack_bytearray )( value ) )
+        copies[id( value )] = copy
+        if key is not None :
+            self.merged_copies[key] = copy
+        return copy
+
+    def _push ( self, value, kind, parts, mode, key ) :
+        if id( value ) in self.making :
+            raise ValueError, "'%s' refers to itself before it can be made." % type( value ).__name__
+        self.making.add( id( value ) )
+        self.frames.append( [ parts, [], value, kind, mode, key ] )
+        return _PENDING
+
+    def _run ( self ) :
+        r"""Make the values whose frames are on the stack, returning the first of them.  Each
+        part produced by the iterator ``parts`` is copied and appended to ``results``; one
+        that is made complete pushes a frame of its own and this one waits until it is done.
+        Once ``parts`` is exhausted the value is made from its results (a list, a dict or
+        the one value, as ``mode`` says) and handed to the frame beneath."""
+        frames, copies, leaves, _begin = self.frames, self.copies, self.leaves, self._begin
+        mutability = self.decoder.mutability
+        while True :
+            frame = frames[-1]
+            add = frame[1].append
+            for part in frame[0] :
+                if type( part ) in leaves :
+                    add( part )
+                elif id( part ) in copies :
+                    add( copies[id( part )] )
+                else :
+                    copy = _begin( part )
+                    if copy is _PENDING :
+                        break
+                    add( copy )
+            else :
+                frames.pop()
+                parts, results, value, kind, mode, key = frame
+                if mode is self._METHOD :
+                    copy = getattr( results[0], value.im_func.func_name )
+                elif mode is self._SEQUENCE :
+                    copy = mutability[kind]( kind, results )
+                elif mode is self._MAPPING :
+                    copy = mutability[kind]( kind, dict( izip( results[1::2], results[::2] ) ) )
+                else :
+                    copy = mutability[kind]( kind, results[0] )
+                copies[id( value )] = copy
+                self.making.discard( id( value ) )
+                if key is not None :
+                    self.merged_copies[key] = copy
+                if not frames :
+                    return copy
+                frames[-1][1].append( copy )
+
+    def _fill ( self, value, shell, walk ) :
+        r"""Populate ``shell``, the copy of ``value`` made empty, with copies of its items and
+        fields, as ``GenoshaDecoder.populate_object`` populates it from its record."""
+        copies, leaves, _copy = self.copies, self.leaves, self._copy
+        kind = shell.__class__
+        builder, direct = self.decoder.plans.get( kind ) or self.decoder._plan( kind )
+        attributes = None
+        if walk is self._SEQUENCE :
+            items = [ part if type( part ) in leaves else copies[id( part )] if id( part ) in copies else _copy( part ) for part in value ]
+            builder( shell, items )
+        elif walk is self._MAPPING :
+            items = {}
+            for key, part in value.iteritems() :
+                # the value is copied ahead of its key, as it is marshalled.
+                part = part if type( part ) in leaves else copies[id( part )] if id( part ) in copies else _copy( part )
+                items[key if type( key ) in leaves else copies[id( key )] if id( key ) in copies else _copy( key )] = part
+            builder( shell, items )
+            if isinstance( value, defaultdict ) :
+                attributes = { 'default_factory' : value.default_factory }
+        fields = [ ( name, part if type( part ) in leaves else copies[id( part )] if id( part ) in copies else _copy( part ) )
+                for name, part in self._fields( value, attributes ) ]
+        if direct :
+            shell.__dict__.update( fields )
+        else :  # __slots__ or descriptor based
+            for name, part in fields :
+                setattr( shell, name, part )
 
 class GenoshaDecoder ( object ) :
     r"""Provides the mechanics of converting a genosha-marshalled structure back into
@@ -316,33 +2103,256 @@ class GenoshaDecoder ( object ) :
     ``string_hook`` if specified should identify a callable used to "unescape" any special
     string handling performed during the encode (using ``GenoshaDecode``'s ``string_hook``
     parameter).  See the JSON deserializer for an example of this.
+
+    ``stats`` is as for ``GenoshaEncoder``: statistics of each ``unmarshal`` (or
+    ``apply_delta``) are gathered into ``self.stats``, and handed to it if it is callable.
+
+    ``defaults`` if true gives each instance unmarshalled the defaults for the fields its
+    class leaves out (see ``project``) that it does not have.
+
+    ``ordered`` if false accepts the records of the objects in any order: a reference to an
+    object whose record comes later (a forward reference) makes it from its record there
+    and then.  An object that is made complete (a tuple, a frozenset, ...) is made after
+    whatever it refers to, which is found without recursion.
+
+    ``lazy`` if true has ``unmarshal`` make each object only once something in use refers
+    to it, and populate an instance only when it is used itself: until then it belongs to
+    a subclass of its class (see ``_lazy_class``) whose attribute access populates it from
+    its record and gives it back its own class.  Identity and cycles are kept as ever, and
+    the work (and memory) spent is on what is used.  Only instances with fields alone wait
+    to be used; anything else is populated once it is made.  Instances are populated one
+    at a time under the decoder's ``lock`` and get their own class back only once
+    complete, so the graph may be used by several threads.  Deltas cannot be applied to
+    a graph unmarshalled lazily.
     """
-    def __init__ ( self, string_hook = None ) :
+    def __init__ ( self, string_hook = None, stats = None, defaults = False, lazy = False, ordered = True ) :
+        kind = self.__class__
+        # types whose values are used as they are.
+        self.leaves = _cache( ( 'leaves', kind ), lambda : frozenset( typ for typ, handler in self.dispatch.iteritems() if handler is kind._primitive.im_func ) )
         if string_hook :
+            self.dispatch = dict( self.dispatch )
             self.dispatch[str] = string_hook
             self.dispatch[unicode] = string_hook
-        self.mutability = {}
-        self.kinds = {}
+            self.leaves = self.leaves - _STRINGS
+        self.mutability = _cache( ( 'mutability', kind ) )
+        self.kinds = _cache( ( 'kinds', kind ) )
+        self.plans = _cache( ( 'plans', kind ) )
+        self.defaults = defaults
+        self.fillers = _cache( ( 'fillers', kind ) )
+        self.lazy = lazy
+        self.ordered = ordered
+        if lazy :
+            self.dispatch = dict( self.dispatch )
+            self.dispatch[GenoshaReference] = kind._lazy_reference.im_func
+        # the lazy subclass of each class (None if it cannot have one), the objects
+        # waiting to be used, by id, with their records, and the ids of those being
+        # populated (by the thread holding ``lock``).
+        self.lazy_classes = {}
+        self.waiting = {}
+        self.populating = set()
+        self.lock = threading.RLock()
+        # where ``_needed`` collects the oids referred to, while it is looking.
+        self.needed = None
+        self.measured = stats
+        self.stats = None
+        if stats :
+            self._unmarshal = self._measured_unmarshal
+            self.populate_object = self._measured_populate( kind.populate_object.im_func, lambda obj, data : _record_type( data ) )
+            self.populate_columns = self._measured_populate( kind.populate_columns.im_func, lambda objs, data : data.type )
+            self.populate_row = self._measured_populate( kind.populate_row.im_func, lambda obj, table, index : table.types[table.kinds[index]] )
+            self.resolve_type = self._measured_resolve_type
 
-    def unmarshal ( self, obj ) :
+    def unmarshal ( self, obj, path = None ) :
+        r"""Convert ``obj``, as made by ``marshal``, back into the objects it represents,
+        returning its payload.  Given a ``path``, only the value found there (and what it
+        refers to) is made: the path is an oid, or the steps (names of fields, keys and
+        indexes) leading from the payload to the value, either as a sequence or as a
+        string of them separated by dots, such as "config.limits".  No other object is
+        made, nor its type resolved."""
         self.objects = {}
         self.to_populate = []
+        self.nesting = 0
         try :
             if obj[0] != SENTINEL :
                 raise ValueError, "Malfomed input."
         except IndexError :
             raise ValueError, "Malformed input."
-        self._unmarshal( obj[1:-1] ) # load the referenced objects
-        payload = self._unmarshal( obj[-1] )
-        for obj in self.to_populate :
-            self.populate_object( *obj )
-        del self.to_populate
+        if self.measured :
+            self.stats, self.nested, started = GenoshaStats(), 0.0, _timer()
+        # the string table, if there is one, is needed by everything else.
+        self.strings = self._strings( obj[3] ) if len( obj ) > 3 else []
+        dispatch = self.dispatch
+        if ( path is not None or not self.ordered ) and not self.lazy : # made from their records as they are needed
+            self.dispatch = dict( dispatch )
+            self.dispatch[GenoshaReference] = self.__class__._lazy_reference.im_func
+        try :
+            if path is not None :
+                payload = self._part( obj[1], obj[2], path )
+            elif self.lazy :
+                self._index( obj[1] ) # the referenced objects are made as they are needed
+                payload = self._unmarshal( obj[2] )
+            elif not self.ordered :
+                # each object is made in turn, unless something before it has needed it.
+                for oid in self._index( obj[1] ) :
+                    if oid in self.records :
+                        self._unmarshal( GenoshaReference( oid ) )
+                payload = self._unmarshal( obj[2] )
+            else :
+                self._unmarshal( obj[1] ) # load the referenced objects
+                payload = self._unmarshal( obj[2] )
+            self._populate()
+        finally :
+            self.dispatch = dispatch
+        if self.measured :
+            _stats_done( self.stats, self.measured, started )
+        return payload
+
+    def apply_delta ( self, delta ) :
+        r"""Patch the graph loaded by ``unmarshal`` (or by earlier deltas; the first delta may
+        be applied by a new decoder) with ``delta``, from ``GenoshaEncoder.marshal_delta``, and
+        return its payload.  Changed objects that are populated (instances, lists, dicts,
+        sets, ...) are emptied and populated again in place, as are arrays and bytearrays (and
+        numpy arrays, if their shape and dtype are the same); anything else that changed is
+        replaced, and only objects that refer to it anew have the new one."""
+        try :
+            if delta[0] != DELTA_SENTINEL :
+                raise ValueError, "Malformed delta."
+        except IndexError :
+            raise ValueError, "Malformed delta."
+        if self.lazy :
+            raise ValueError, "Deltas cannot be applied to a graph unmarshalled lazily."
+        if not hasattr( self, 'objects' ) :
+            self.objects = {}
+        objects = self.objects
+        self.to_populate = []
+        self.nesting = 0
+        if self.measured :
+            self.stats, self.nested, started = GenoshaStats(), 0.0, _timer()
+        self.strings = self._strings( delta[4] ) if len( delta ) > 4 else []
+        for data in delta[1] :
+            oid = int( data.oid )
+            if oid in objects :
+                obj = objects[oid]
+                if not self._empty( obj, data ) :
+                    objects[oid] = self._patch( obj, self._unmarshal( data ) )
+            else :
+                self._unmarshal( data )
+        payload = self._unmarshal( delta[2] )
+        self._populate()
+        for oid in delta[3] :
+            objects.pop( oid, None )
+        if self.measured :
+            _stats_done( self.stats, self.measured, started )
         return payload
 
+    def _strings ( self, table ) :
+        # the strings of a string table, str ones interned.
+        return [ intern( s ) if type( s ) is str else s for s in self._unmarshal( table ) ]
+
+    def _populate ( self ) :
+        for obj, data in self.to_populate :
+            if type( data ) is tuple : # the table and place of the record
+                self.populate_row( obj, *data )
+            elif hasattr( data, 'columns' ) :
+                self.populate_columns( obj, data )
+            else :
+                self.populate_object( obj, data )
+        if self.defaults :
+            self._default( self.to_populate )
+        del self.to_populate
+
+    def _default ( self, populated ) :
+        r"""Give the instances ``populated`` (as listed in ``to_populate``) the defaults of
+        their class for the fields they do not have."""
+        fillers = self.fillers
+        for obj, data in populated :
+            for obj in obj if hasattr( data, 'columns' ) else ( obj, ) :
+                kind = obj.__class__
+                defaults = fillers.get( kind )
+                if defaults is None :
+                    defaults = fillers[kind] = _projection( kind )[2]
+                for name, value in defaults :
+                    if not hasattr( obj, name ) :
+                        setattr( obj, name, value() if hasattr( value, '__call__' ) else value )
+
+    def _empty ( self, obj, data ) :
+        r"""Empty ``obj`` of its items and of the fields it no longer has, and populate it
+        from ``data`` (the changed record for it) with the objects that are made empty and
+        populated afterwards; False if it is not that kind of object."""
+        if hasattr( data, 'attribute' ) or not ( hasattr( data, 'items' ) or hasattr( data, 'fields' ) ) :
+            return False
+        if data.type in self.kinds :
+            kind = self.kinds[data.type]
+        else :
+            kind = self.resolve_type( data.type )
+            self.kinds[data.type] = kind
+        if type( obj ) is not kind :
+            return False
+        if kind not in self.mutability :
+            self.mutability[kind] = self._constructor( kind )
+        if self.mutability[kind] and hasattr( data, 'items' ) :
+            return False
+        for base in kind.__mro__ :
+            if base in self.emptiers :
+                self.emptiers[base]( obj )
+                break
+        fields = getattr( data, 'fields', {} )
+        if hasattr( obj, '__dict__' ) :
+            for key, value in obj.__dict__.items() :
+                if key[:2] != '__' and key not in fields and not hasattr( value, '__call__' ) :
+                    del obj.__dict__[key]
+        for slot in _slots( kind ) :
+            if slot not in fields and hasattr( obj, slot ) and not hasattr( getattr( obj, slot ), '__call__' ) :
+                delattr( obj, slot )
+        self.to_populate.append( ( obj, data ) )
+        return True
+
+    def _patch ( self, obj, new ) :
+        # copy ``new`` into ``obj``, which it changes, if that can be done; returns the one kept.
+        if type( new ) is type( obj ) :
+            if type( obj ) is bytearray or isinstance( obj, array ) and obj.typecode == new.typecode :
+                obj[:] = new
+                return obj
+            if numpy and isinstance( obj, numpy.ndarray ) and obj.shape == new.shape and obj.dtype == new.dtype and obj.flags.writeable :
+                obj[...] = new
+                return obj
+        return new
+
     builders = { list : list.extend, set : set.update, dict : dict.update, defaultdict : dict.update, deque : deque.extend }
+    # how the objects ``builders`` fill are emptied, for ``apply_delta``.
+    emptiers = { list : lambda obj : obj.__delslice__( 0, len( obj ) ), set : set.clear, dict : dict.clear, defaultdict : dict.clear, deque : deque.clear }
     immutables = set( [ tuple, frozenset, complex ] )
+    # how instances of these types are made, complete, from their (packed) items.
+    constructors = { array : _new_array, bytearray : _new_bytearray }
+    if numpy :
+        constructors[numpy.ndarray] = _new_ndarray
+
+    def _constructor ( self, kind ) :
+        r"""How instances of ``kind`` are made, complete, from their items; None if they are
+        made empty and populated afterwards instead.  A record with no items (as earlier
+        versions wrote the types that are now registered, such as ``decimal.Decimal``) is
+        made empty and populated whatever its type."""
+        for base in kind.__mro__ :
+            if base in _reducers :
+                return _reducers[base][1]
+            if '__genosha_restore__' in base.__dict__ :
+                return _restore
+            if base in self.constructors :
+                return self.constructors[base]
+            if base in self.immutables :
+                return _new
+        return None
+
+    # how deeply input is converted recursively before the explicit stack takes over.
+    max_nesting = 32
 
     def _object ( self, data ) :
+        if hasattr( data, 'columns' ) :
+            return self._block( data )
+        nesting = self.nesting
+        if nesting >= self.max_nesting :
+            return self._iterate( data )
+        self.nesting = nesting + 1
         immediate = not hasattr( data, 'oid' )
         if hasattr( data, 'attribute' ) :
             obj = getattr( self._unmarshal( data.instance ), data.attribute )
@@ -356,9 +2366,9 @@ class GenoshaDecoder ( object ) :
                 obj = kind # raw type
             else :
                 if kind not in self.mutability :
-                    self.mutability[kind] = self.immutables & set ( kind.__mro__ ) and True or False
-                if self.mutability[kind] :
-                    obj = kind.__new__( kind, self._unmarshal( data.items ) )
+                    self.mutability[kind] = self._constructor( kind )
+                if self.mutability[kind] and hasattr( data, 'items' ) :
+                    obj = self.mutability[kind]( kind, self._unmarshal( data.items ) )
                 else :
                     obj = kind.__new__( kind )
                     if immediate :
@@ -367,52 +2377,512 @@ class GenoshaDecoder ( object ) :
                         self.to_populate.append( ( obj, data ) )
         if not immediate :
             self.objects[int(data.oid)] = obj
+        self.nesting = nesting
+        return obj
+
+    def _block ( self, data ) :
+        r"""Create the instances making up the columnar block ``data``; like any other object
+        with an oid their fields are filled in later (by ``populate_columns``)."""
+        if data.type in self.kinds :
+            kind = self.kinds[data.type]
+        else :
+            kind = self.resolve_type( data.type )
+            self.kinds[data.type] = kind
+        objs = [ kind.__new__( kind ) for oid in data.oid ]
+        self.objects.update( izip( [ int( oid ) for oid in data.oid ], objs ) )
+        self.to_populate.append( ( objs, data ) )
+        return objs
+
+    def _table ( self, table ) :
+        r"""Create the objects of the records in ``table``, a ``GenoshaTable``, reading its
+        arrays directly; those populated afterwards are noted by their place in it (see
+        ``populate_row``), so that no record is made for them."""
+        objects, mutability, extras = self.objects, self.mutability, table.extras
+        classes = []
+        for name in table.types :
+            if name not in self.kinds :
+                self.kinds[name] = self.resolve_type( name )
+            classes.append( self.kinds[name] )
+        for index, ( mask, oid, kind ) in enumerate( izip( table.masks, table.oids, table.kinds ) ) :
+            if index in extras :
+                self._unmarshal( extras[index] )
+                continue
+            kind = classes[kind]
+            if not mask :
+                obj = kind # raw type
+            else :
+                if kind not in mutability :
+                    mutability[kind] = self._constructor( kind )
+                if mutability[kind] and mask & _HAS_ITEMS :
+                    obj = mutability[kind]( kind, self._unmarshal( table.items[index] ) )
+                else :
+                    obj = kind.__new__( kind )
+                    self.to_populate.append( ( obj, ( table, index ) ) )
+            objects[oid] = obj
+        return table
+
+    def populate_row ( self, obj, table, index ) :
+        r"""``populate_object`` from the record at ``index`` in ``table``."""
+        _unmarshal = self._unmarshal
+        builder, direct = self.plans.get( obj.__class__ ) or self._plan( obj.__class__ )
+        mask = table.masks[index]
+        if mask & _HAS_ITEMS and builder :
+            builder( obj, _unmarshal( table.items[index] ) )
+        if mask & _HAS_FIELDS :
+            names, values = table.fields( index )
+            leaves = self.leaves
+            values = [ value if type( value ) in leaves else _unmarshal( value ) for value in values ]
+            if direct :
+                obj.__dict__.update( izip( names, values ) )
+            else :  # __slots__ or descriptor based
+                for key, value in izip( names, values ) :
+                    setattr( obj, key, value )
         return obj
 
+    def populate_columns ( self, objs, data ) :
+        _unmarshal = self._unmarshal
+        names = data.columns.keys()
+        rows = izip( *[ _unmarshal( data.columns[name] ) for name in names ] )
+        if objs and ( self.plans.get( objs[0].__class__ ) or self._plan( objs[0].__class__ ) )[1] :
+            for obj, row in izip( objs, rows ) :
+                obj.__dict__.update( izip( names, row ) )
+        else :
+            for obj, row in izip( objs, rows ) :
+                for name, value in izip( names, row ) :
+                    setattr( obj, name, value )
+        return objs
+
+    def _plan ( self, kind ) :
+        r"""Work out (once per class) how instances of ``kind`` are populated: the builder
+        that adds their items (None if they have none), and whether their fields can all
+        be put straight into their ``__dict__`` at once; if they have slots (which have to
+        be set as attributes even when there is a ``__dict__`` as well), or no ``__dict__``,
+        each is set in turn instead."""
+        builder = None
+        for base in kind.__mro__ :
+            if base in self.builders :
+                builder = self.builders[base]
+                break
+        plan = self.plans[kind] = ( builder, kind.__dictoffset__ != 0 and not _slots( kind ) )
+        return plan
+
     def populate_object ( self, obj, data ) :
         _unmarshal = self._unmarshal
-        if hasattr( data, 'items' ) :
-            builders = self.builders
-            for base in obj.__class__.__mro__ :
-                if base in builders :
-                    builders[ base ]( obj, _unmarshal( data.items ) )
-                    break
+        builder, direct = self.plans.get( obj.__class__ ) or self._plan( obj.__class__ )
+        if builder and hasattr( data, 'items' ) :
+            builder( obj, _unmarshal( data.items ) )
         if hasattr( data, 'fields' ) :
-            if hasattr( obj, '__dict__' ) :
-                for key, value in data.fields.items() :
-                    obj.__dict__[key] = _unmarshal( value )
+            leaves = self.leaves
+            fields = [ ( key, value if type( value ) in leaves else _unmarshal( value ) ) for key, value in data.fields.iteritems() ]
+            if direct :
+                obj.__dict__.update( fields )
             else :  # __slots__ or descriptor based
-                for key, value in data.fields.items() :
-                    setattr( obj, key, _unmarshal( value ) )
+                for key, value in fields :
+                    setattr( obj, key, value )
         return obj
 
     def _list ( self, data ) :
+        nesting = self.nesting
+        if nesting >= self.max_nesting :
+            return self._iterate( data )
+        self.nesting = nesting + 1
         _unmarshal = self._unmarshal
-        return [ _unmarshal( item ) for item in data ]
+        leaves = self.leaves
+        result = [ item if type( item ) in leaves else _unmarshal( item ) for item in data ]
+        self.nesting = nesting
+        return result
 
     def _dict ( self, data ) :
+        nesting = self.nesting
+        if nesting >= self.max_nesting :
+            return self._iterate( data )
+        self.nesting = nesting + 1
         d = {}
         _unmarshal = self._unmarshal
         for key, value in data.items() :
             d[ _unmarshal( key ) ] = _unmarshal( value )
+        self.nesting = nesting
         return d
 
+    def _index ( self, records ) :
+        r"""Note the records of the objects (a list or ``GenoshaTable`` of them) by oid, to
+        be made from as they are needed: a record, a columnar block and the place of the
+        oid in it, or a table and the place of the record in it.  Returns the oids in the
+        order of their records."""
+        index = self.records = {}
+        order = []
+        if type( records ) is GenoshaTable :
+            extras = records.extras
+            records = [ extras[place] if place in extras else ( records, place ) for place in xrange( len( records ) ) ]
+        for data in records :
+            if type( data ) is tuple :
+                oids = [ data[0].oids[data[1]] ]
+                index[oids[0]] = data
+            elif hasattr( data, 'columns' ) :
+                oids = [ int( oid ) for oid in data.oid ]
+                index.update( ( oid, ( data, place ) ) for place, oid in enumerate( oids ) )
+            else :
+                oids = [ int( data.oid ) ]
+                index[oids[0]] = data
+            order.extend( oids )
+        return order
+
+    def _lazy_reference ( self, data ) :
+        r"""``_reference`` for ``lazy``: the object is made from its record the first time.
+        An object made complete (an immutable or a method) needs those it refers to made
+        first; they are made (and those they need, and so on) deepest first, without
+        recursion."""
+        oid, objects, records = data.oid, self.objects, self.records
+        if self.needed is not None :
+            self.needed.append( oid )
+            return None
+        if oid in objects :
+            return objects[oid]
+        data = self._record( oid )
+        if not self._complete( data ) :
+            return self._make( data )
+        stack = [ ( data, iter( self._needed( data ) ) ) ]
+        while stack :
+            data, needed = stack[-1]
+            for oid in needed :
+                if oid in objects or oid not in records :
+                    continue
+                child = self._record( oid )
+                if self._complete( child ) :
+                    stack.append( ( child, iter( self._needed( child ) ) ) )
+                    break
+                self._make( child )
+            else :
+                stack.pop()
+                obj = self._make( data )
+        return obj
+
+    def _record ( self, oid, take = True ) :
+        # the record of the object ``oid``, taken from ``records`` (or only looked at).
+        try :
+            data = self.records.pop( oid ) if take else self.records[oid]
+        except KeyError :
+            raise ValueError, "Reference to an unknown object: " + str( oid )
+        if type( data ) is tuple :
+            source, place = data
+            if type( source ) is GenoshaTable :
+                return source.record( place )
+            # a row of a columnar block
+            return GenoshaObject( type = source.type, oid = oid, fields = dict( ( name, column[place] ) for name, column in source.columns.iteritems() ) )
+        return data
+
+    def _part ( self, records, payload, path ) :
+        r"""Make the value at ``path`` (see ``unmarshal``), following it through the
+        marshalled ``payload`` and ``records`` without making anything along the way."""
+        self._index( records )
+        if type( path ) in ( int, long ) :
+            return self._unmarshal( GenoshaReference( path ) )
+        value = payload
+        for step in path.split( '.' ) if isinstance( path, basestring ) else path :
+            oid = self._oid( value )
+            data = value if oid is None else self._record( oid, False )
+            if type( data ) is GenoshaObject :
+                if hasattr( data, 'fields' ) and step in data.fields :
+                    value = data.fields[step]
+                    continue
+                data = getattr( data, 'items', None )
+            if type( data ) is list :
+                try :
+                    value = data[int( step )]
+                    continue
+                except ( ValueError, IndexError ) :
+                    pass
+            elif type( data ) is dict :
+                found = [ item for key, item in data.iteritems() if self._oid( key ) is None and self._unmarshal( key ) == step ]
+                if found :
+                    value = found[0]
+                    continue
+            raise ValueError, "Nothing found at %r of the path %r." % ( step, path )
+        return self._unmarshal( value )
+
+    def _oid ( self, value ) :
+        # the oid ``value`` refers to, if it is a reference (whatever the serialization made of it).
+        kind = type( value )
+        if kind is GenoshaReference :
+            return value.oid
+        if kind in self.leaves or kind is list or kind is dict or kind is GenoshaObject :
+            return None
+        self.needed = []
+        try :
+            self.dispatch[kind]( self, value )
+            return self.needed[0] if self.needed else None
+        finally :
+            self.needed = None
+
+    def _complete ( self, data ) :
+        # whether the object of the record ``data`` is made complete, rather than populated.
+        if hasattr( data, 'attribute' ) :
+            return True
+        if not hasattr( data, 'items' ) and not hasattr( data, 'fields' ) :
+            return False
+        if data.type in self.kinds :
+            kind = self.kinds[data.type]
+        else :
+            kind = self.resolve_type( data.type )
+            self.kinds[data.type] = kind
+        if kind not in self.mutability :
+            self.mutability[kind] = self._constructor( kind )
+        return bool( self.mutability[kind] ) and hasattr( data, 'items' )
+
+    def _needed ( self, data ) :
+        r"""The oids of the objects the record ``data`` refers to, however deeply.  Anything
+        that may be a reference (whatever the serialization made of them) is converted,
+        with ``_lazy_reference`` collecting the oids instead of making the objects."""
+        oids = self.needed = []
+        dispatch, leaves = self.dispatch, self.leaves
+        parts = self._parts( data ) + ( [ data.instance ] if hasattr( data, 'attribute' ) else [] )
+        try :
+            while parts :
+                part = parts.pop()
+                kind = type( part )
+                if kind is list :
+                    parts.extend( part )
+                elif kind is dict :
+                    parts.extend( part.iterkeys() )
+                    parts.extend( part.itervalues() )
+                elif kind is GenoshaObject :
+                    parts.extend( self._parts( part ) + ( [ part.instance ] if hasattr( part, 'attribute' ) else [] ) )
+                elif kind not in leaves :
+                    dispatch[kind]( self, part )
+        finally :
+            self.needed = None
+        return oids
+
+    def _make ( self, data ) :
+        r"""Make the object of the record ``data``; an instance that is populated with its
+        fields alone is left to wait until it is used."""
+        populate = self.to_populate
+        pending = len( populate )
+        obj = self._object( data )
+        if self.lazy and len( populate ) > pending and populate[-1][0] is obj and not hasattr( data, 'items' ) :
+            lazy = self.lazy_classes.get( type( obj ), False )
+            if lazy is False :
+                lazy = self.lazy_classes[type( obj )] = self._lazy_class( type( obj ) )
+            if lazy is not None :
+                self.waiting[id( obj )] = populate.pop()
+                object.__setattr__( obj, '__class__', lazy )
+        return obj
+
+    def _lazy_class ( self, kind ) :
+        r"""A subclass of ``kind`` (with the same layout, so that instances can change
+        between the two) that populates its instances as soon as any of their attributes
+        is read, set or deleted; None if ``kind`` cannot have one."""
+        if any( base in self.builders for base in kind.__mro__ ) :
+            return None
+        namespace = { '__slots__' : (), '__module__' : kind.__module__, '_genosha_decoder' : self
+                , '__getattribute__' : _lazy_getattribute, '__setattr__' : _lazy_setattr, '__delattr__' : _lazy_delattr }
+        try :
+            return type( kind )( kind.__name__, ( kind, ), namespace )
+        except TypeError : # it cannot be subclassed
+            return None
+
+    def _materialize ( self, obj ) :
+        r"""Populate ``obj``, made by ``lazy`` and now in use, giving it its own class back
+        once it is complete; False if it is being populated (and so is to be accessed as it
+        is).  One thread populates at a time: another using ``obj`` meanwhile waits for it,
+        and if populating fails ``obj`` is left waiting, to be populated when next used."""
+        self.lock.acquire()
+        try :
+            key = id( obj )
+            if key in self.populating :
+                return False
+            if key not in self.waiting :
+                return True # populated meanwhile
+            obj, data = self.waiting[key]
+            outer = self.__dict__.get( 'to_populate' )
+            self.populating.add( key )
+            self.to_populate = [ ( obj, data ) ]
+            try :
+                self._populate()
+            finally :
+                self.populating.discard( key )
+                if outer is not None :
+                    self.to_populate = outer
+                else :
+                    self.__dict__.pop( 'to_populate', None )
+            del self.waiting[key]
+            object.__setattr__( obj, '__class__', type( obj ).__bases__[0] )
+            return True
+        finally :
+            self.lock.release()
+
     def _reference ( self, data ) :
         try :
             return self.objects[ data.oid ]
         except KeyError :
             raise ValueError, "Forward-references to objects not allowed: " + str( data.oid ) + " (" + str( type( data.oid ) ) + ")"
 
+    def _interned ( self, data ) :
+        try :
+            return self.strings[ data.index ]
+        except IndexError :
+            raise ValueError, "No string in the string table at: " + str( data.index )
+
     def _primitive ( self, data ) :
         return data
 
-    dispatch = { list : _list, dict : _dict, GenoshaObject : _object, GenoshaReference : _reference
+    dispatch = { list : _list, dict : _dict, GenoshaObject : _object, GenoshaReference : _reference, GenoshaInterned : _interned, GenoshaTable : _table
         , int : _primitive, long : _primitive, float : _primitive, bool : _primitive, types.NoneType : _primitive
-        , str : _primitive, unicode : _primitive }
+        , str : _primitive, unicode : _primitive, GenoshaPacked : _primitive }
 
     def _unmarshal ( self, data ) :
         return self.dispatch[type(data)]( self, data )
 
+    def _measured_unmarshal ( self, data ) :
+        r"""``_unmarshal``, counting and timing the value for ``stats`` as the encoder's
+        ``_measured_marshal`` does.  The rows of a table are counted once it is done."""
+        kind = type( data )
+        if kind is GenoshaReference or kind is GenoshaInterned :
+            return self.dispatch[kind]( self, data )
+        stats, outer, started = self.stats, self.nested, _timer()
+        self.nested = 0.0
+        if kind is GenoshaObject and hasattr( data, 'type' ) :
+            stats.lookups += 1
+        try :
+            return self.dispatch[kind]( self, data )
+        finally :
+            elapsed = _timer() - started
+            name = _record_type( data ) if kind is GenoshaObject else _type_name( kind, {} )
+            stats.counts[name] += len( data.oid ) if hasattr( data, 'columns' ) else 1
+            stats.times[name] += elapsed - self.nested
+            self.nested = outer + elapsed
+            if kind is GenoshaTable :
+                stats.lookups += len( data.types )
+                for index in data.kinds :
+                    if index >= 0 :
+                        stats.counts[data.types[index]] += 1
+
+    def _measured_populate ( self, populate, name ) :
+        # ``populate`` timed for ``stats``, charged to the type ``name`` gives for its arguments.
+        def measured ( *args ) :
+            stats, outer, started = self.stats, self.nested, _timer()
+            self.nested = 0.0
+            try :
+                return populate( self, *args )
+            finally :
+                elapsed = _timer() - started
+                stats.times[name( *args )] += elapsed - self.nested
+                self.nested = outer + elapsed
+        return measured
+
+    def _measured_resolve_type ( self, kind ) :
+        self.stats.misses += 1
+        return self.__class__.resolve_type( self, kind )
+
+    def _iterate ( self, data ) :
+        r"""Convert ``data`` without recursion, however deeply it nests.
+
+        Input is converted recursively until ``max_nesting`` is reached; anything deeper is
+        converted here with an explicit stack of frames ``( parts, results, kind, data, obj )``.
+        Each part produced by the iterator ``parts`` is converted and appended to ``results``;
+        lists, dicts and objects among them push a frame of their own and this one waits (the
+        iterator keeps its position) until they are done.  Once ``parts`` is exhausted
+        ``_finish`` makes the frame's value from its results, and that is handed to the
+        frame beneath."""
+        dispatch = self.dispatch
+        leaves = self.leaves
+        stack = [ ( iter( ( data, ) ), [], _LIST, None, None ) ]
+        while True :
+            frame = stack[-1]
+            add = frame[1].append
+            for data in frame[0] :
+                kind = type( data )
+                if kind in leaves :
+                    add( data )
+                elif kind is list :
+                    stack.append( ( iter( data ), [], _LIST, data, None ) )
+                    break
+                elif kind is dict :
+                    stack.append( ( _flatten( data ), [], _DICT, data, None ) )
+                    break
+                elif kind is GenoshaObject :
+                    value = self._start( data, stack )
+                    if value is _PENDING :
+                        break
+                    add( value )
+                else :
+                    add( dispatch[kind]( self, data ) )
+            else :
+                stack.pop()
+                value = frame[1] if frame[2] is _LIST else self._finish( frame )
+                if not stack :
+                    return value[0]
+                stack[-1][1].append( value )
+
+    def _start ( self, data, stack ) :
+        r"""Begin converting the object record ``data`` for ``_iterate``: objects that can be
+        made at once are returned, otherwise a frame is pushed for the parts that must be
+        converted first and ``_PENDING`` returned."""
+        if hasattr( data, 'columns' ) :
+            return self._block( data )
+        if hasattr( data, 'attribute' ) :
+            stack.append( ( iter( ( data.instance, ) ), [], _METHOD, data, None ) )
+            return _PENDING
+        if data.type in self.kinds :
+            kind = self.kinds[data.type]
+        else :
+            kind = self.resolve_type( data.type )
+            self.kinds[data.type] = kind
+        if not hasattr( data, 'items' ) and not hasattr( data, 'fields' ) :
+            obj = kind # raw type (or function, or module), which has no constructor
+        else :
+            if kind not in self.mutability :
+                self.mutability[kind] = self._constructor( kind )
+            if self.mutability[kind] and hasattr( data, 'items' ) :
+                stack.append( ( iter( ( data.items, ) ), [], _IMMUTABLE, data, kind ) )
+                return _PENDING
+            obj = kind.__new__( kind )
+            if not hasattr( data, 'oid' ) :
+                stack.append( ( iter( self._parts( data ) ), [], _POPULATE, data, obj ) )
+                return _PENDING
+            self.to_populate.append( ( obj, data ) )
+        if hasattr( data, 'oid' ) :
+            self.objects[int(data.oid)] = obj
+        return obj
+
+    def _finish ( self, frame ) :
+        parts, results, kind, data, obj = frame
+        if kind is _DICT :
+            return dict( izip( results[1::2], results[::2] ) )
+        if kind is _METHOD :
+            obj = getattr( results[0], data.attribute )
+        elif kind is _IMMUTABLE :
+            obj = self.mutability[obj]( obj, results[0] )
+        else :
+            obj = self._fill( obj, data, results )
+        if hasattr( data, 'oid' ) :
+            self.objects[int(data.oid)] = obj
+        return obj
+
+    def _parts ( self, data ) :
+        r"""The marshalled parts of an object record: its items (if any) followed by the
+        values of its fields, in the order ``_fill`` expects them."""
+        parts = [ data.items ] if hasattr( data, 'items' ) else []
+        if hasattr( data, 'fields' ) :
+            parts.extend( data.fields.itervalues() )
+        return parts
+
+    def _fill ( self, obj, data, values ) :
+        r"""``populate_object`` given the already converted ``_parts`` of ``data``."""
+        values = iter( values )
+        builder, direct = self.plans.get( obj.__class__ ) or self._plan( obj.__class__ )
+        if hasattr( data, 'items' ) :
+            items = values.next()
+            if builder :
+                builder( obj, items )
+        if hasattr( data, 'fields' ) :
+            if direct :
+                obj.__dict__.update( izip( data.fields.iterkeys(), values ) )
+            else :  # __slots__ or descriptor based
+                for key, value in izip( data.fields.iterkeys(), values ) :
+                    setattr( obj, key, value )
+        return obj
+
     def resolve_type ( self, kind ) :
         modname, kind = kind.split( '/' ) if '/' in kind else ( kind, '' )
         if modname not in sys.modules :
@@ -13,8 +13,11 @@
 #
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
-import unittest
+import sys, unittest
+from array import array
 from collections import defaultdict, deque
+from decimal import Decimal
+import datetime, uuid
 
 import genosha
 
@@ -168,6 +171,30 @@ class GenoshaTests( DefaultTestCase ) :
         data.present = "yes it is"
         self._perform( data )
 
+    def testInheritedSlots ( self ) :
+        """Test marshalling objects whose slots are declared by a base class, with and without an object dict"""
+        child = SlottedChild()
+        child.present = "inherited"
+        child.extra = "own"
+        mixed = SlottedDict()
+        mixed.present = "slot"
+        mixed.other = "dict"
+        self._perform( [ child, mixed ] )
+
+    def testInstanceRun ( self ) :
+        """Test a run of instances of one class referring to one another and to their container."""
+        data = [ Test_A() for i in range( 5 ) ]
+        for i, obj in enumerate( data ) :
+            obj.data = i
+        data[1].data = data[3]
+        data[3].data = data
+        data[4].extra = data[0]
+        data.append( ( data[2], ) )
+        result = self.unmarshal( self.marshal( data ) )
+        assert( result[1].data is result[3] and result[3].data is result and result[4].extra is result[0] and result[5][0] is result[2] )
+        assert( [ obj.id for obj in result[:5] ] == [ obj.id for obj in data[:5] ] )
+        assert( [ result[i].data for i in ( 0, 2, 4 ) ] == [ 0, 2, 4 ] )
+
     def testModule ( self ) :
         """Test marshalling a reference to a module."""
         self._perform( unittest )
@@ -180,6 +207,36 @@ class GenoshaTests( DefaultTestCase ) :
         data = complex( 20, 0.3 )
         self._perform( data )
 
+    def testArray ( self ) :
+        """Test arrays of each typecode."""
+        data = [ array( code, range( 5 ) ) for code in 'bBhHiIlLfd' ] + [ array( 'c', 'abc' ), array( 'u', u'ab\u1234' ), array( 'd' ) ]
+        self._perform( data )
+
+    def testByteArray ( self ) :
+        data = bytearray( "a\x00b\xff" )
+        self._perform( data )
+
+    def testNumpyArrays ( self ) :
+        """Test numpy arrays of several dtypes and layouts (if numpy is installed)."""
+        if not genosha.numpy :
+            return
+        numpy = genosha.numpy
+        record = numpy.zeros( 2, dtype = [ ( 'a', '<f8' ), ( 'b', '|S3', ( 2, ) ) ] )
+        record['a'] = [ 1.5, -2 ]
+        objects = numpy.empty( ( 2, 2 ), object )
+        objects[0, 0] = objects[1, 1] = [ 1 ]
+        data = [ numpy.arange( 10 ), numpy.arange( 6.0 ).reshape( 2, 3 ).T, numpy.arange( 10 )[::3], record
+            , objects, numpy.array( 5.0 ), numpy.array( [ True, False ] ), numpy.array( [ 'ab', 'c' ] ), numpy.zeros( ( 0, 3 ) ) ]
+        result = self._perform( data )
+        assert( result[1].strides == data[1].strides and result[4][1, 1] is result[4][0, 0] and result[0].flags.writeable )
+
+    def testPrimitiveLists ( self ) :
+        """Test lists of ints, floats or bools only, and their identity."""
+        data = [ range( -5, 5 ), [ i / 4.0 for i in range( 10 ) ], [ 2 ** 40 + i for i in range( 10 ) ], [ 1, 2.0 ] * 5 ]
+        data.append( data[1] )
+        result = self._perform( data )
+        assert( result[4] is result[1] )
+
     def testDescriptors ( self ) :
         data = Test_Descriptee()
         self._perform( data )
@@ -235,6 +292,67 @@ class GenoshaTests( DefaultTestCase ) :
         data = Test_Outer.Test_Inner()
         self._perform( data )
 
+    def testDeepNesting ( self ) :
+        """Test graphs nested far deeper than the interpreter's recursion limit."""
+        depth = sys.getrecursionlimit() + 100
+        data = None
+        for i in range( depth ) :
+            data = ( i, data, [ i ] )
+        result = self.unmarshal( self.marshal( data ) )
+        for i in reversed( range( depth ) ) :
+            assert( type( result ) == tuple and result[0] == i and result[2] == [ i ] )
+            result = result[1]
+        assert( result is None )
+
+    def testRepeatedStrings ( self ) :
+        """Test strings that recur, long and short, as values and keys."""
+        data = [ "a longer string", "short", "<looks like a reference>", "a longer string", { "a longer string" : "short" } ]
+        data = data + data + [ ( "a longer string", "<looks like a reference>" ) ]
+        assert( self.unmarshal( self.marshal( data ) ) == data )
+
+    def testEqualValues ( self ) :
+        """Test equal immutables, some of different types, kept apart where they differ."""
+        # built from parts, as the compiler makes equal constant tuples one.
+        one, two = 1, 2
+        data = [ ( one, two ), ( one, two ), ( 1.0, two ), ( True, two ), frozenset( [ 1, 2 ] ), frozenset( [ 2, 1 ] ), complex( 1, 2 ), complex( 1, 2 )
+                , ( one * 0.0, ), ( one * -0.0, ), ( ( one, two ), [ 3 ] ), ( ( one, two ), [ 3 ] ) ]
+        result = self.unmarshal( self.marshal( data ) )
+        assert( result == data and [ type( value[0] ) for value in result[:4] ] == [ int, int, float, bool ] )
+        assert( result[10][1] is not result[11][1] )
+
+    def testReducedValues ( self ) :
+        """Test values marshalled by their state, registered or by the protocol."""
+        data = [ datetime.datetime( 2009, 5, 1, 12, 30, 15, 250 ), datetime.date( 2009, 5, 1 ), datetime.time( 12, 30 ), datetime.timedelta( 3, 5, 7 )
+                , Decimal( "-1.50" ), uuid.UUID( "12345678-1234-5678-1234-567812345678" ), Test_Money( Decimal( "2.25" ), "USD" ), Test_Money( 1, "EUR" ) ]
+        data.append( ( data[0], data[6] ) )
+        result = self.unmarshal( self.marshal( data ) )
+        assert( result == data and [ type( value ) for value in result ] == [ type( value ) for value in data ] )
+        assert( result[8][0] is result[0] and result[8][1] is result[6] and str( result[4] ) == "-1.50" )
+
+    def testProjectedFields ( self ) :
+        """Test that only the fields a class's projection includes are marshalled."""
+        data = [ Test_Projected( 1 ), Test_Included( 2 ) ]
+        result = self.unmarshal( self.marshal( data ) )
+        assert( result[0].value == 1 and not hasattr( result[0], 'cache' ) )
+        assert( result[1].value == 2 and result[1].slot == 3 and not hasattr( result[1], 'spare' ) and not hasattr( result[1], 'derived' ) )
+
+class GenoshaInternedTests( GenoshaTests ) :
+    r"""Tests for marshalling with the ``interned`` option."""
+    def testInternedStrings ( self ) :
+        """Test that the strings in the string table are loaded as one object apiece."""
+        data = [ "a longer string" ] * 3 + [ "a longer string" + str( i ) for i in range( 3 ) ] * 3
+        result = self.unmarshal( self.marshal( data ) )
+        assert( result == data and result[1] is result[2] and result[7] is result[10] )
+
+class GenoshaPackedTests( GenoshaTests ) :
+    r"""Tests for marshalling with the ``packed`` option, which keeps values exactly
+    whatever the serialization does with primitives."""
+    def testPackedValues ( self ) :
+        """Test that packed lists keep their values exactly."""
+        data = [ [ i / 3.0 for i in range( 10 ) ] + [ -0.0, 1e300 ], [ True, False ] * 5, [ -sys.maxint - 1, sys.maxint ] * 4 ]
+        result = self._perform( data )
+        assert( type( result[1][0] ) is bool )
+
 i=1
 
 def module_function( input ) :
@@ -245,6 +363,31 @@ class Slotted( object ) :
     def __repr__ ( self ) :
         return "<Slotted: " + self.present + ">"
 
+class SlottedChild( Slotted ) :
+    __slots__ = "extra"
+    def __repr__ ( self ) :
+        return "<SlottedChild: " + self.present + ", " + self.extra + ">"
+
+class SlottedDict( Slotted ) :
+    def __repr__ ( self ) :
+        return "<SlottedDict: " + self.present + ", " + self.other + ">"
+
+class Test_Projected ( object ) :
+    __genosha_exclude__ = ( 'cache', )
+    __genosha_defaults__ = { 'cache' : dict }
+    def __init__ ( self, value ) :
+        self.value = value
+        self.cache = { 'squared' : value * value }
+
+class Test_Included ( object ) :
+    __slots__ = ( 'slot', 'spare', '__dict__' )
+    __genosha_fields__ = ( 'value', 'slot' )
+    def __init__ ( self, value ) :
+        self.value = value
+        self.slot = value + 1
+        self.spare = value + 2
+        self.derived = [ value ] * 3
+
 class OldStyle() :
     def __init__ ( self, arg ) :
         global i
@@ -331,6 +474,20 @@ class Test_Descriptee ( object ) :
         self.id = self.id + 1
         return "<TestDescriptee:%d>" % self.offset
 
+class Test_Money ( object ) :
+    r"""A value marshalled by the reduce/restore protocol."""
+    __slots__ = ( "amount", "currency" )
+    def __init__ ( self, amount, currency ) :
+        self.amount = amount
+        self.currency = currency
+    def __eq__ ( self, other ) :
+        return type( other ) is type( self ) and ( self.amount, self.currency ) == ( other.amount, other.currency )
+    def __genosha_reduce__ ( self ) :
+        return [ self.amount, self.currency ]
+    @classmethod
+    def __genosha_restore__ ( cls, state ) :
+        return cls( *state )
+
 class Test_Outer ( object ) :
     class Test_Inner ( object ) :
         def __repr__ ( self ) :
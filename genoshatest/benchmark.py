@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+#    genoshatest/benchmark.py - rough timings for Genosha
+#    Copyright (C) 2009 Shawn Sulma <genosha@470th.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+r"""Rough timings of genosha operations.  These are not tests; they are here to make it
+easy to see where time goes and whether a change helps.
+
+    python -m genoshatest.benchmark [-n size] [name ...]
+
+runs the named benchmarks (all of them by default) with graphs of roughly ``size`` nodes."""
+import sys, gc, timeit
+
+import genosha
+
+__version__ = "0.1"
+__author__ = "Shawn Sulma <genosha@470th.org>"
+
+def best ( f, repeat = 3 ) :
+    r"""The fastest of ``repeat`` calls to ``f``, in seconds."""
+    timer = timeit.default_timer
+    times = []
+    for i in range( repeat ) :
+        start = timer()
+        f()
+        times.append( timer() - start )
+    return min( times )
+
+def report ( name, seconds, count, unit = "node" ) :
+    print "%-36s %9.4fs %9.3fus/%s" % ( name, seconds, seconds * 1e6 / count, unit )
+
+def sizeof ( obj ) :
+    r"""The bytes taken by ``obj`` and everything it refers to (each object counted once,
+    classes and modules not at all)."""
+    seen = set()
+    pending = [ obj ]
+    size = 0
+    while pending :
+        obj = pending.pop()
+        if id( obj ) in seen or isinstance( obj, ( type, type( sys ) ) ) :
+            continue
+        seen.add( id( obj ) )
+        size += sys.getsizeof( obj )
+        pending.extend( gc.get_referents( obj ) )
+    return size
+
+class Node ( object ) :
+    def __init__ ( self, value, next ) :
+        self.value = value
+        self.next = next
+
+class Point ( object ) :
+    __slots__ = ( "x", "y" )
+    def __init__ ( self, x, y ) :
+        self.x = x
+        self.y = y
+
+class Point3 ( Point ) :
+    __slots__ = ( "z", )
+    def __init__ ( self, x, y, z ) :
+        Point.__init__( self, x, y )
+        self.z = z
+
+def bench_depth ( size ) :
+    """per-node marshal cost of deep versus wide graphs"""
+    deep = None
+    for i in xrange( size ) :
+        deep = ( i, deep )
+    wide = [ ( i, None ) for i in xrange( size ) ]
+    chain = None
+    for i in xrange( size ) :
+        chain = Node( i, chain )
+    flat = [ Node( i, None ) for i in xrange( size ) ]
+    report( "marshal nested tuples", best( lambda : genosha.marshal( deep ) ), size )
+    report( "marshal list of tuples", best( lambda : genosha.marshal( wide ) ), size )
+    report( "marshal linked instances", best( lambda : genosha.marshal( chain ) ), size )
+    report( "marshal list of instances", best( lambda : genosha.marshal( flat ) ), size )
+
+def bench_fields ( size ) :
+    """per-instance cost of finding the fields of small instances"""
+    encoder = genosha.GenoshaEncoder()
+    plain = [ Node( i, None ) for i in xrange( size ) ]
+    slotted = [ Point3( i, i, i ) for i in xrange( size ) ]
+    for name, data in ( ( "dict-based", plain ), ( "slotted", slotted ) ) :
+        report( "fields of %s instances" % name, best( lambda : [ encoder._fields( obj, None ) for obj in data ] ), size, "instance" )
+        report( "marshal %s instances" % name, best( lambda : genosha.marshal( data ) ), size, "instance" )
+
+def bench_columnar ( size ) :
+    """JSON time and size for a list of record-like instances, one object apiece versus columnar"""
+    import genosha.JSON
+    data = [ Node( i, "record %d" % i ) for i in xrange( size ) ]
+    for name, options in ( ( "rows", {} ), ( "columnar", { 'columnar' : True } ) ) :
+        text = genosha.JSON.dumps( data, **options )
+        report( "dumps %s (%d bytes)" % ( name, len( text ) ), best( lambda : genosha.JSON.dumps( data, **options ) ), size, "instance" )
+        report( "loads %s" % name, best( lambda : genosha.JSON.loads( text ) ), size, "instance" )
+
+def bench_packed ( size ) :
+    """JSON time and size for numeric payloads, element by element versus packed and numpy arrays"""
+    import genosha.JSON
+    from array import array
+    floats = [ i / 7.0 for i in xrange( size ) ]
+    ints = range( size )
+    cases = [ ( "floats", floats, {} ), ( "packed floats", floats, { 'packed' : True } )
+            , ( "ints", ints, {} ), ( "packed ints", ints, { 'packed' : True } ), ( "array('d')", array( 'd', floats ), {} ) ]
+    if genosha.numpy :
+        cases.append( ( "numpy float64", genosha.numpy.array( floats ), {} ) )
+    for name, data, options in cases :
+        text = genosha.JSON.dumps( data, **options )
+        report( "dumps %s (%d bytes)" % ( name, len( text ) ), best( lambda : genosha.JSON.dumps( data, **options ) ), size, "value" )
+        report( "loads %s" % name, best( lambda : genosha.JSON.loads( text ) ), size, "value" )
+
+def bench_strings ( size ) :
+    """JSON time and size for records whose string values recur, as they are versus interned"""
+    import genosha.JSON
+    data = [ { 'status' : "status %d" % ( i % 5 ), 'owner' : "owner%d@example.com" % ( i % 50 ), 'id' : i } for i in xrange( size ) ]
+    for name, options in ( ( "strings", {} ), ( "interned strings", { 'interned' : True } ) ) :
+        text = genosha.JSON.dumps( data, **options )
+        report( "dumps %s (%d bytes)" % ( name, len( text ) ), best( lambda : genosha.JSON.dumps( data, **options ) ), size, "record" )
+        report( "loads %s" % name, best( lambda : genosha.JSON.loads( text ) ), size, "record" )
+
+def bench_merged ( size ) :
+    """JSON time and size for equal tuples made separately, each its own object versus merged"""
+    import genosha.JSON
+    currencies = [ "USD", "EUR", "JPY" ]
+    data = [ ( currencies[i % 3], ( i % 4, ) ) for i in xrange( size ) ]
+    for name, options in ( ( "tuples", {} ), ( "merged tuples", { 'merged' : True } ) ) :
+        text = genosha.JSON.dumps( data, **options )
+        report( "dumps %s (%d bytes)" % ( name, len( text ) ), best( lambda : genosha.JSON.dumps( data, **options ) ), size, "tuple" )
+        report( "loads %s" % name, best( lambda : genosha.JSON.loads( text ) ), size, "tuple" )
+
+def bench_delta ( size ) :
+    """checkpoints of a list of instances with 1% of them changed, whole versus as deltas"""
+    import genosha.JSON
+    data = [ Node( i, "record %d" % i ) for i in xrange( size ) ]
+    encoder, decoder = genosha.GenoshaEncoder(), genosha.GenoshaDecoder()
+    decoder.apply_delta( encoder.marshal_delta( data ) )
+    def change () :
+        for node in data[::100] :
+            node.value += 1
+    def delta () :
+        change()
+        return encoder.marshal_delta( data, encoder.snapshot )
+    report( "marshal whole", best( lambda : genosha.marshal( data ) ), size, "instance" )
+    report( "marshal_delta (%d records)" % len( delta()[1] ), best( delta ), size, "instance" )
+    report( "JSON dumps whole", best( lambda : genosha.JSON.dumps( data ) ), size, "instance" )
+    changes = delta()
+    report( "apply_delta", best( lambda : decoder.apply_delta( changes ) ), size, "instance" )
+
+def bench_memory ( size ) :
+    """memory held by the marshalled records of a list of instances, as a list versus a GenoshaTable"""
+    data = [ Node( i, "record %d" % i ) for i in xrange( size ) ]
+    print "%-36s %9.1f bytes/instance" % ( "the graph itself", float( sizeof( data ) ) / size )
+    for name, options in ( ( "list", {} ), ( "table", { 'compact' : True } ) ) :
+        records = genosha.marshal( data, **options )[1]
+        print "%-36s %9.1f bytes/instance" % ( "records as a %s" % name, float( sizeof( records ) ) / size )
+        marshalled = genosha.marshal( data, **options )
+        report( "marshal to a %s" % name, best( lambda : genosha.marshal( data, **options ) ), size, "instance" )
+        report( "unmarshal from a %s" % name, best( lambda : genosha.unmarshal( marshalled ) ), size, "instance" )
+
+def bench_estimate ( size ) :
+    """estimating the size of the JSON and XML of a list of instances and tuples, versus producing it"""
+    import genosha.JSON, genosha.XML
+    data = [ ( Node( i, "record %d" % i ), ( i, i / 7.0 ) ) for i in xrange( size ) ]
+    for name, module in ( ( "json", genosha.JSON ), ( "xml", genosha.XML ) ) :
+        report( "estimate %s (%d bytes)" % ( name, genosha.estimate( data, name ).size ), best( lambda : genosha.estimate( data, name ) ), size, "item" )
+        report( "%s dumps (%d bytes)" % ( name, len( module.dumps( data ) ) ), best( lambda : module.dumps( data ) ), size, "item" )
+
+def bench_small ( size ) :
+    """per-message latency of small messages, each with a new encoder and decoder"""
+    import genosha.JSON, genosha.XML
+    count = max( size // 20, 1 )
+    message = { 'id' : 7, 'point' : Point( 1, 2 ), 'path' : [ Node( i, None ) for i in range( 3 ) ], 'tags' : ( 'a', 'b' ) }
+    marshalled, text, xml = genosha.marshal( message ), genosha.JSON.dumps( message ), genosha.XML.dumps( message )
+    for name, f in ( ( "marshal", lambda : genosha.marshal( message ) ), ( "unmarshal", lambda : genosha.unmarshal( marshalled ) )
+            , ( "JSON dumps", lambda : genosha.JSON.dumps( message ) ), ( "JSON loads", lambda : genosha.JSON.loads( text ) )
+            , ( "XML dumps", lambda : genosha.XML.dumps( message ) ), ( "XML loads", lambda : genosha.XML.loads( xml ) ) ) :
+        report( "%s small message" % name, best( lambda : [ f() for i in xrange( count ) ] ), count, "message" )
+
+def bench_names ( size ) :
+    """cost of finding the scoped names of classes in a module of size/10 classes, each with one nested"""
+    import types
+    count = max( size // 10, 1 )
+    module = types.ModuleType( "genoshatest_generated" )
+    sys.modules[module.__name__] = module
+    try :
+        for i in xrange( count ) :
+            inner = type( "Inner%d" % i, ( object, ), { '__module__' : module.__name__ } )
+            outer = type( "Outer%d" % i, ( object, ), { '__module__' : module.__name__, inner.__name__ : inner } )
+            setattr( module, outer.__name__, outer )
+        outers = [ getattr( module, "Outer%d" % i ) for i in xrange( count ) ]
+        inners = [ getattr( outer, "Inner%d" % i ) for i, outer in enumerate( outers ) ]
+        for name, classes in ( ( "module-level", outers ), ( "nested", inners ) ) :
+            def find () :
+                genosha.clear_caches()
+                encoder = genosha.GenoshaEncoder()
+                for kind in classes :
+                    encoder.find_scoped_name( kind )
+            report( "find names of %s classes" % name, best( find ), count, "class" )
+    finally :
+        del sys.modules[module.__name__]
+
+def bench_decode ( size ) :
+    """per-level unmarshal cost of deeply nested versus flat input"""
+    deep = None
+    for i in xrange( size ) :
+        deep = [ i, deep, { 'k' : [ i, i, i ] } ]
+    flat = [ [ i, None, { 'k' : [ i, i, i ] } ] for i in xrange( size ) ]
+    deep, flat = [ genosha.SENTINEL, [], deep ], [ genosha.SENTINEL, [], flat ]
+    report( "unmarshal nested lists", best( lambda : genosha.unmarshal( deep ) ), size, "level" )
+    report( "unmarshal list of lists", best( lambda : genosha.unmarshal( flat ) ), size, "level" )
+    objects = genosha.marshal( [ Node( i, ( i, ) ) for i in xrange( size ) ] )
+    report( "unmarshal list of instances", best( lambda : genosha.unmarshal( objects ) ), size )
+
+class Tagged ( list ) :
+    def __init__ ( self, items, tag ) :
+        list.__init__( self, items )
+        self.tag = tag
+
+def bench_populate ( size ) :
+    """populating many instances of one class: with a __dict__, with slots and with items, from a list of records and from a table"""
+    for name, data in ( ( "__dict__", [ Node( i, "record %d" % i ) for i in xrange( size ) ] )
+            , ( "slots", [ Point3( i, i, i ) for i in xrange( size ) ] )
+            , ( "items", [ Tagged( ( i, ), "tag" ) for i in xrange( size ) ] ) ) :
+        for form, options in ( ( "list", {} ), ( "table", { 'compact' : True } ) ) :
+            marshalled = genosha.marshal( data, **options )
+            report( "unmarshal (%s, from a %s)" % ( name, form ), best( lambda : genosha.unmarshal( marshalled ) ), size, "instance" )
+
+def bench_lazy ( size ) :
+    """unmarshalling a snapshot of instances, each holding a list and a dict, whole versus lazily with 1% of them used"""
+    data = [ Node( i, [ "item %d" % i, { 'count' : i, 'tags' : [ 'a', 'b' ] } ] ) for i in xrange( size ) ]
+    marshalled = genosha.marshal( data )
+    def lazy () :
+        result = genosha.unmarshal( marshalled, lazy = True )
+        return [ node.value for node in result[::100] ]
+    report( "unmarshal whole", best( lambda : genosha.unmarshal( marshalled ) ), size, "instance" )
+    report( "unmarshal lazily, 1% used", best( lazy ), size, "instance" )
+
+def bench_clone ( size ) :
+    """copying a graph of instances, each holding a list and a dict: clone, copy.deepcopy and a round trip through JSON"""
+    import copy
+    from genosha.JSON import dumps, loads
+    data = [ Node( i, [ "item %d" % i, { 'count' : i, 'tags' : [ 'a', 'b' ] } ] ) for i in xrange( size ) ]
+    report( "clone", best( lambda : genosha.clone( data ) ), size, "instance" )
+    report( "copy.deepcopy", best( lambda : copy.deepcopy( data ) ), size, "instance" )
+    report( "JSON loads( dumps() )", best( lambda : loads( dumps( data ) ) ), size, "instance" )
+
+def peak ( f, make ) :
+    r"""The growth of the peak resident size (in KiB, on Linux) while ``f`` is called with
+    what ``make`` returns, in a child process so that earlier peaks do not hide it; the
+    data is made there too, so that none of it is copied on write and counted."""
+    import os, resource
+    read, write = os.pipe()
+    pid = os.fork()
+    if not pid :
+        data = make()
+        start = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+        f( data )
+        os.write( write, str( resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss - start ) )
+        os._exit( 0 )
+    os.close( write )
+    os.waitpid( pid, 0 )
+    return int( os.read( read, 64 ) or 0 )
+
+def bench_json ( size ) :
+    """writing JSON to a file: records written directly a batch at a time, each through the default hook, and marshal() followed by json.dump()"""
+    import genosha.JSON, json
+    make = lambda : [ Node( i, [ "item %d" % i, { 'count' : i } ] ) for i in xrange( size ) ]
+    count = 3 * size + 1
+    null = open( "/dev/null", "w" )
+    writers = ( ( "dump", lambda data : genosha.JSON.dump( data, null ) )
+            , ( "dump, default hook", lambda data : genosha.JSON.dump( data, null, cls = json.JSONEncoder ) )
+            , ( "marshal + json.dump", lambda data : json.dump( genosha.JSON.marshal( data ), null, default = genosha.JSON._genosha_to_json ) ) )
+    # the peaks first, while this process holds no data of its own.
+    peaks = [ peak( f, make ) for name, f in writers ]
+    data = make()
+    for ( name, f ), kib in zip( writers, peaks ) :
+        report( name, best( lambda : f( data ), 1 ), count, "object" )
+        print "%-36s %9dKiB peak" % ( "", kib )
+    null.close()
+
+def main ( args ) :
+    size = 100000
+    if args[:1] == [ "-n" ] :
+        size, args = int( args[1] ), args[2:]
+    names = args or sorted( name[6:] for name in globals() if name.startswith( "bench_" ) )
+    for name in names :
+        f = globals()[ "bench_" + name ]
+        print "%s (%s, size %d)" % ( name, f.__doc__, size )
+        f( size )
+
+if __name__ == "__main__":
+    main( sys.argv[1:] )
@@ -0,0 +1,689 @@
+#!/usr/bin/env python
+#    genoshatest/coretest.py - test cases for the core Genosha marshaller
+#    Copyright (C) 2009 Shawn Sulma <genosha@470th.org>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import array, gc, os, sys, shutil, tempfile, threading, types, unittest, weakref
+
+import genosha
+from genosha import GenoshaEncoder, GenoshaDecoder, GenoshaEstimator
+import genoshatest
+
+__version__ = "0.1"
+__author__ = "Shawn Sulma <genosha@470th.org>"
+
+class Celsius ( float ) :
+    pass
+
+class Label ( str ) :
+    pass
+
+class Point ( object ) :
+    # reduced to a new tuple each time.
+    def __init__ ( self, x, y ) :
+        self.x, self.y = x, y
+    def __genosha_reduce__ ( self ) :
+        return [ ( self.x, self.y ) ]
+    @classmethod
+    def __genosha_restore__ ( cls, state ) :
+        return cls( *state[0] )
+
+class Wide ( object ) :
+    __slots__ = [ 'a%d' % i for i in range( 300 ) ]
+    def __init__ ( self ) :
+        for name in self.__slots__ :
+            setattr( self, name, name )
+
+class Flaky ( object ) :
+    # refuses its fields while ``failing``.
+    __slots__ = ( 'x', )
+    failing = False
+    def __setattr__ ( self, name, value ) :
+        if Flaky.failing :
+            raise RuntimeError, name
+        object.__setattr__( self, name, value )
+
+class GenoshaCoreTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = genosha.marshal
+        self.unmarshal = genosha.unmarshal
+        self.long = long
+        self.unicode = unicode
+
+    def testNestingIndependentOutput ( self ) :
+        """Ensure the explicit stack produces the same structure as direct nesting does."""
+        shared = genoshatest.Test_A()
+        data = [ ( 1, ( 2, [ 3, ( 4, shared ) ] ), frozenset( [ ( 5, 6 ) ] ) ), { 'k' : ( shared, ( 7, ) ) }, shared.__repr__ ]
+        data.append( data )
+        direct = GenoshaEncoder()
+        stacked = GenoshaEncoder()
+        stacked.max_nesting = 0
+        assert( repr( direct.marshal( data ) ) == repr( stacked.marshal( data ) ) )
+
+    def testMarshalIter ( self ) :
+        """Ensure marshal_iter produces what marshal does, handing out objects as they are completed."""
+        data = [ genoshatest.Test_A(), ( 1, [ 2 ] ), { 'k' : set( [ 3 ] ) } ]
+        records = genosha.marshal_iter( data )
+        payload = records.next()
+        assert( repr( [ genosha.SENTINEL, list( records ), payload ] ) == repr( genosha.marshal( data ) ) )
+        data = None
+        for i in range( 100 ) :
+            data = [ i, data ]
+        encoder = GenoshaEncoder()
+        records = encoder.marshal_iter( data )
+        records.next()
+        records.next()
+        assert( len( encoder.python_ids ) < 100 )
+
+    def testNestingIndependentInput ( self ) :
+        """Ensure the explicit stack reconstructs the same graph as direct nesting does."""
+        shared = genoshatest.Test_A()
+        data = [ ( 1, ( 2, [ 3, ( 4, shared ) ] ), frozenset( [ ( 5, 6 ) ] ) ), { 'k' : ( shared, ( 7, ) ) }, shared.__repr__ ]
+        data.append( data )
+        marshalled = genosha.marshal( data )
+        direct = GenoshaDecoder()
+        stacked = GenoshaDecoder()
+        stacked.max_nesting = 0
+        assert( repr( genosha.marshal( direct.unmarshal( marshalled ) ) ) == repr( genosha.marshal( stacked.unmarshal( marshalled ) ) ) )
+
+    def testDeepInput ( self ) :
+        """Test input nested far deeper than the interpreter's recursion limit."""
+        depth = sys.getrecursionlimit() + 100
+        data = None
+        for i in range( depth ) :
+            immediate = genosha.GenoshaObject( type = "__builtin__/tuple", items = [ i ] )
+            data = [ i, { 'next' : data }, immediate ]
+        result = self.unmarshal( [ genosha.SENTINEL, [], data ] )
+        for i in reversed( range( depth ) ) :
+            assert( type( result ) == list and result[0] == i and result[2] == ( i, ) )
+            result = result[1]['next']
+        assert( result is None )
+
+    def testSideFiles ( self ) :
+        """Ensure large numpy arrays are saved to side files and memory-mapped when read."""
+        if not genosha.numpy :
+            return
+        directory = tempfile.mkdtemp()
+        try :
+            encoder = GenoshaEncoder( sidefiles = directory )
+            encoder.min_sidefile = 64
+            data = [ genosha.numpy.arange( 100.0 ), genosha.numpy.arange( 4.0 ) ]
+            result = self.unmarshal( encoder.marshal( data ) )
+            assert( len( os.listdir( directory ) ) == 1 )
+            assert( isinstance( result[0], genosha.numpy.memmap ) and not isinstance( result[1], genosha.numpy.memmap ) )
+            assert( ( result[0] == data[0] ).all() and ( result[1] == data[1] ).all() )
+            del result
+        finally :
+            shutil.rmtree( directory )
+
+    def testSideFileDeltas ( self ) :
+        """Ensure arrays in side files are in a delta only if their contents changed, and are saved only then."""
+        if not genosha.numpy :
+            return
+        directory = tempfile.mkdtemp()
+        try :
+            encoder = GenoshaEncoder( sidefiles = directory )
+            encoder.min_sidefile = 64
+            data = [ genosha.numpy.arange( 100.0 ), genosha.numpy.arange( 200.0 ) ]
+            decoder = GenoshaDecoder()
+            result = decoder.apply_delta( encoder.marshal_delta( data ) )
+            delta = encoder.marshal_delta( data, encoder.snapshot )
+            assert( delta[1] == [] and len( os.listdir( directory ) ) == 2 )
+            data[1][0] = -1.0
+            delta = encoder.marshal_delta( data, encoder.snapshot )
+            assert( len( delta[1] ) == 1 and len( os.listdir( directory ) ) == 3 )
+            result = decoder.apply_delta( delta )
+            assert( result[1][0] == -1.0 and ( result[0] == data[0] ).all() )
+            del result, decoder
+        finally :
+            shutil.rmtree( directory )
+
+    def testObjectArrays ( self ) :
+        """Ensure numpy arrays of objects of different shapes in one graph keep their own shapes."""
+        if not genosha.numpy :
+            return
+        shapes = [ ( 2, 3 ), ( 3, 2 ), ( 1, 6 ), ( 3, ), ( 2, ) ] * 20
+        data = [ genosha.numpy.empty( shape, object ) for shape in shapes ]
+        for array in data :
+            array.fill( "x" )
+        result = self.unmarshal( self.marshal( data ) )
+        assert( [ array.shape for array in result ] == shapes and all( ( array == "x" ).all() for array in result ) )
+
+    def testSharedCaches ( self ) :
+        """Ensure what one encoder or decoder works out is shared with the next, until cleared."""
+        data = [ genoshatest.Test_A(), genoshatest.Slotted() ]
+        data[1].present = "here"
+        marshalled = genosha.marshal( data )
+        encoder, decoder = GenoshaEncoder(), GenoshaDecoder()
+        assert( genoshatest.Test_A in encoder.scoped_names and genoshatest.Test_A in encoder.dispatch and genoshatest.Slotted in encoder.plans )
+        genosha.unmarshal( marshalled )
+        assert( decoder.kinds[ encoder.scoped_names[genoshatest.Test_A] ] is genoshatest.Test_A )
+        genosha.clear_caches()
+        assert( genoshatest.Test_A in encoder.scoped_names )
+        assert( genoshatest.Test_A not in GenoshaEncoder().scoped_names and not GenoshaDecoder().kinds )
+        assert( repr( genosha.unmarshal( genosha.marshal( data ) ) ) == repr( data ) )
+
+    def testStringHooks ( self ) :
+        """Ensure a string_hook affects only the encoder or decoder it is given to."""
+        hooked = GenoshaEncoder( string_hook = lambda s : s.upper() )
+        assert( hooked.marshal( "a" )[2] == "A" and GenoshaEncoder().marshal( "a" )[2] == "a" )
+        hooked = GenoshaDecoder( string_hook = lambda self, s : s.upper() )
+        assert( hooked.unmarshal( [ genosha.SENTINEL, [], "a" ] ) == "A" and GenoshaDecoder().unmarshal( [ genosha.SENTINEL, [], "a" ] ) == "a" )
+
+    def testScopeIndex ( self ) :
+        """Ensure nested names are found through the module's index, which follows changes to the module."""
+        module = types.ModuleType( "genoshatest_scopes" )
+        sys.modules[module.__name__] = module
+        try :
+            def nested ( outer ) :
+                inner = type( "Inner", ( object, ), { '__module__' : module.__name__ } )
+                module.__dict__[outer] = type( outer, ( object, ), { '__module__' : module.__name__, 'Inner' : inner } )
+                return inner
+            first, second = nested( "First" ), nested( "Second" )
+            encoder = GenoshaEncoder()
+            assert( encoder.find_scoped_name( first ) == "genoshatest_scopes/First.Inner" )
+            assert( encoder.find_scoped_name( second ) == "genoshatest_scopes/Second.Inner" )
+            replaced = nested( "First" )
+            assert( encoder.find_scoped_name( replaced ) == "genoshatest_scopes/First.Inner" )
+            sys.modules[module.__name__] = module = types.ModuleType( module.__name__ )
+            third = nested( "Third" )
+            assert( encoder.find_scoped_name( third ) == "genoshatest_scopes/Third.Inner" )
+            self.assertRaises( TypeError, encoder.find_scoped_name, type( "Inner", ( object, ), { '__module__' : module.__name__ } ) )
+        finally :
+            del sys.modules[module.__name__]
+
+    def testDelta ( self ) :
+        """Ensure deltas hold only what changed, and patch the graph loaded earlier in place."""
+        model = { 'records' : [ genoshatest.Test_A() for i in range( 20 ) ], 'slotted' : genoshatest.Slotted(), 'codes' : array.array( 'i', range( 5 ) ) }
+        model['slotted'].present = "here"
+        model['pair'] = ( model['records'][0], [ 1 ] )
+        encoder, decoder = GenoshaEncoder(), GenoshaDecoder()
+        loaded = decoder.apply_delta( encoder.marshal_delta( model ) )
+        assert( repr( loaded ) == repr( model ) )
+        records, slotted, codes, pair = loaded['records'], loaded['slotted'], loaded['codes'], loaded['pair']
+        model['records'][3].id = "changed"
+        model['records'][4].extra = model['pair']
+        del model['records'][5:]
+        del model['records'][2].id
+        model['slotted'].notpresent, model['slotted'].present = "now", "there"
+        model['codes'][0] = 7
+        model['pair'][1].append( 2 )
+        delta = encoder.marshal_delta( model, encoder.snapshot )
+        # the list of records, three of them, the slotted instance, the array and the list in the pair; the
+        # objects of the fifteen records removed, each with its data list and dict.
+        assert( len( delta[1] ) == 7 and len( delta[3] ) == 15 * 3 )
+        assert( decoder.apply_delta( delta ) is loaded and repr( loaded ) == repr( model ) )
+        assert( loaded['records'] is records and loaded['records'][4].extra is pair and loaded['slotted'] is slotted and loaded['codes'] is codes )
+        assert( not hasattr( records[2], 'id' ) and len( decoder.objects ) == len( encoder.snapshot.fingerprints ) )
+        assert( encoder.marshal_delta( model, encoder.snapshot )[1] == [] )
+        self.assertRaises( ValueError, decoder.apply_delta, genosha.marshal( model ) )
+
+    def testDeltaInterleaved ( self ) :
+        """Ensure marshalling a delta leaves the encoder as it was for anything else."""
+        data = [ genoshatest.Test_A() for i in range( 5 ) ]
+        encoder = GenoshaEncoder( columnar = True )
+        expected = repr( GenoshaEncoder( columnar = True ).marshal( data ) )
+        encoder.marshal_delta( data )
+        records = encoder.marshal_iter( data )
+        records.next()
+        delta = encoder.marshal_delta( data[:2], encoder.snapshot )
+        # only the new list; the old one and the three instances left out, each with its data list and dict, are gone.
+        assert( len( delta[1] ) == 1 and not hasattr( delta[1][0], 'columns' ) and len( delta[3] ) == 1 + 3 * 3 )
+        assert( repr( encoder.marshal( data ) ) == expected and encoder.columnar )
+        assert( encoder.previous is None and encoder.current is None )
+
+    def testReducers ( self ) :
+        """Ensure reduced values are compact, and that registering a reducer takes effect for new encoders."""
+        marshalled = genosha.marshal( [ genoshatest.datetime.date( 2009, 5, 1 ), genoshatest.Test_Money( 1, "EUR" ) ] )
+        assert( [ ( out.items, hasattr( out, 'fields' ) ) for out in marshalled[1][1:] ] == [ ( [ 2009, 5, 1 ], False ), ( [ 1, "EUR" ], False ) ] )
+        try :
+            encoder = GenoshaEncoder()
+            genosha.register( Celsius, lambda obj : repr( float( obj ) ), lambda kind, state : kind( state ) )
+            assert( Celsius not in encoder.dispatch and Celsius in GenoshaEncoder().dispatch )
+            marshalled = genosha.marshal( Celsius( 21.5 ) )
+            assert( marshalled[1][0].items == "21.5" )
+            result = genosha.unmarshal( marshalled )
+            assert( type( result ) is Celsius and result == 21.5 )
+        finally :
+            del genosha._reducers[Celsius]
+            genosha.clear_caches()
+
+    def testReducedStates ( self ) :
+        """Ensure states made by reducers (and what they hold) stay apart, however many there are."""
+        result = genosha.unmarshal( genosha.marshal( [ Point( i, -i ) for i in range( 200 ) ] ) )
+        assert( [ ( point.x, point.y ) for point in result ] == [ ( i, -i ) for i in range( 200 ) ] )
+        try :
+            genosha.register( Celsius, lambda obj : genoshatest.Test_Money( float( obj ), "C" ), lambda kind, state : kind( state.amount ) )
+            result = genosha.unmarshal( genosha.marshal( [ Celsius( i ) for i in range( 200 ) ] ) )
+            assert( result == range( 200 ) and type( result[199] ) is Celsius )
+        finally :
+            del genosha._reducers[Celsius]
+            genosha.clear_caches()
+
+    def testProjection ( self ) :
+        """Ensure projected classes lose the fields left out, which the decoder can fill in again."""
+        data = [ genoshatest.Test_Projected( 3 ), genoshatest.Test_Projected( 4 ) ]
+        for columnar in ( False, True ) :
+            result = genosha.unmarshal( genosha.marshal( data, columnar = columnar ), defaults = True )
+            assert( [ obj.cache for obj in result ] == [ {}, {} ] and result[0].cache is not result[1].cache )
+        try :
+            genosha.project( genoshatest.Test_A, include = [ 'id' ], defaults = { 'data' : 0 } )
+            result = genosha.unmarshal( genosha.marshal( [ genoshatest.Test_A(), genoshatest.Test_B() ] ), defaults = True )
+            assert( result[0].data == 0 and 'data' not in genosha.marshal( genoshatest.Test_A() )[1][0].fields )
+            genosha.project( genoshatest.Test_A, exclude = [ 'id' ] )
+            assert( genosha.marshal( genoshatest.Test_A() )[1][0].fields.keys() == [ 'data' ] )
+        finally :
+            del genosha._projections[genoshatest.Test_A]
+            genosha.clear_caches()
+        assert( 'id' in genosha.marshal( genoshatest.Test_A() )[1][0].fields )
+
+    def testPartial ( self ) :
+        """Ensure a path or an oid picks out the part of the graph to make, and nothing else is made."""
+        data = { 'config' : genoshatest.Test_B(), 'rest' : [ genoshatest.Test_A() for i in range( 100 ) ] }
+        for options in ( {}, { 'compact' : True }, { 'columnar' : True } ) :
+            marshalled = genosha.marshal( data, **options )
+            for lazy in ( False, True ) :
+                decoder = GenoshaDecoder( lazy = lazy )
+                a = decoder.unmarshal( marshalled, 'config.a' )
+                assert( a.id == data['config'].a.id and a.data == data['config'].a.data and len( decoder.objects ) < 5 )
+            assert( genosha.unmarshal( marshalled, path = [ 'config', 'a', 'data', 1, 'z' ] ) == '000' )
+            assert( genosha.unmarshal( marshalled, path = 'rest.99' ).id == data['rest'][99].id )
+            self.assertRaises( ValueError, genosha.unmarshal, marshalled, path = 'config.missing' )
+            self.assertRaises( ValueError, genosha.unmarshal, marshalled, path = 'rest.100' )
+        marshalled = genosha.marshal( data )
+        oid = [ out.oid for out in marshalled[1] if out.type == 'genoshatest/Test_B' ][0]
+        assert( genosha.unmarshal( marshalled, path = oid ).foo == 'bar' )
+
+    def testFingerprint ( self ) :
+        """Ensure fingerprints depend on content alone, through cycles and whatever order dicts and sets are in."""
+        first, second = genoshatest.Test_A(), genoshatest.Test_A()
+        second.id = first.id
+        first.next, second.next = [ first, set( range( 100 ) ) ], [ second, set( range( 99, -1, -1 ) ) ]
+        keys = [ "key %d" % i for i in range( 50 ) ]
+        first.data, second.data = dict( ( key, 1 ) for key in keys ), dict( ( key, 1 ) for key in reversed( keys ) )
+        assert( list( first.data ) != list( second.data ) and genosha.fingerprint( first ) == genosha.fingerprint( second ) )
+        whole, hashes = genosha.fingerprint( ( first, [ 1, 2 ] ), oids = True )
+        second.next[1].add( 100 )
+        changed, changes = genosha.fingerprint( ( second, [ 1, 2 ] ), oids = True )
+        assert( whole != changed and len( hashes ) == len( changes ) )
+        # only the dict and the list of ints lead to nothing that changed.
+        assert( len( [ oid for oid in hashes if hashes[oid] == changes[oid] ] ) == 2 )
+        assert( genosha.fingerprint( [ 1, 2L ] ) != genosha.fingerprint( [ 1, 2 ] ) != genosha.fingerprint( [ 2, 1 ] ) )
+
+    def testStats ( self ) :
+        """Ensure statistics count the values of each type, and are handed to a callable given for them."""
+        data = [ genoshatest.Test_A(), genoshatest.Test_A(), ( 1, 2 ) ]
+        reported = []
+        encoder = GenoshaEncoder( stats = reported.append )
+        marshalled = encoder.marshal( data )
+        assert( repr( marshalled ) == repr( genosha.marshal( data ) ) and reported == [ encoder.stats ] )
+        counts = encoder.stats.counts
+        assert( counts['genoshatest/Test_A'] == 2 and counts['__builtin__/tuple'] == 1 and counts['__builtin__/list'] == 3 )
+        assert( encoder.stats.lookups >= 2 and encoder.stats.max_deferred >= 1 and encoder.stats.elapsed > 0 )
+        assert( 'genoshatest/Test_A' in encoder.stats.summary() )
+        for compact in ( False, True ) :
+            decoder = GenoshaDecoder( stats = True )
+            result = decoder.unmarshal( genosha.marshal( data, compact = compact ) )
+            assert( [ obj.id for obj in result[:2] ] == [ obj.id for obj in data[:2] ] )
+            assert( decoder.stats.counts['genoshatest/Test_A'] == 2 and decoder.stats.counts['__builtin__/tuple'] == 1 )
+            assert( decoder.stats.times['genoshatest/Test_A'] > 0 )
+
+    def testEstimate ( self ) :
+        """Ensure estimates count what marshalling produces, and reject what it rejects."""
+        shared = genoshatest.Test_A()
+        data = [ shared, shared, ( 1, "two" ), genoshatest.datetime.date( 2009, 5, 1 ), shared.__repr__, genoshatest.Test_B ]
+        estimate = genosha.estimate( data )
+        assert( estimate.objects == len( genosha.marshal( data )[1] ) and estimate.references == estimate.objects + 2 )
+        assert( estimate.counts['genoshatest/Test_A'] == 3 and estimate.counts['__builtin__/instancemethod'] == 1 )
+        assert( estimate.size == sum( estimate.sizes.values() ) + GenoshaEstimator.costs['json']['document'] )
+        assert( genosha.estimate( data, 'xml' ).size > estimate.size )
+        for unsupported in ( lambda : 1, ( i for i in data ), genoshatest.OldStyle( 1 ) ) :
+            self.assertRaises( TypeError, genosha.estimate, [ 1, unsupported ] )
+        self.assertRaises( ValueError, genosha.estimate, data, 'yaml' )
+        # subclasses of primitives, met for the first time, are counted as values.
+        subclassed = [ Celsius( 1.5 ), Label( "abc" ), Label( "d" ) ] + ( [ genosha.numpy.float64( 1.5 ) ] if genosha.numpy else [] )
+        estimate = genosha.estimate( subclassed )
+        assert( estimate.values == len( subclassed ) and estimate.counts['genoshatest.coretest/Label'] == 2 )
+
+    def testBudgets ( self ) :
+        """Ensure budgets abandon marshalling as soon as they are exceeded, saying where."""
+        head = genoshatest.Test_A()
+        node = head
+        for i in range( 20 ) :
+            node.next = genoshatest.Test_A()
+            node = node.next
+        try :
+            genosha.marshal( [ head ], max_depth = 5 )
+            assert( False )
+        except genosha.GenoshaBudgetExceeded, e :
+            assert( e.budget == 'max_depth' and e.limit == 5 and len( e.path ) == 6 )
+            assert( e.path[:5] == [ '__builtin__/list' ] + [ 'genoshatest/Test_A' ] * 4 and 'max_depth of 5' in str( e ) )
+        data = [ genoshatest.Test_A() for i in range( 10 ) ]
+        self.assertRaises( genosha.GenoshaBudgetExceeded, genosha.marshal, data, max_objects = 3 )
+        try :
+            genosha.marshal( [ 1, { 'k' : "x" * 1000 } ], max_bytes = 500 )
+            assert( False )
+        except genosha.GenoshaBudgetExceeded, e :
+            assert( e.budget == 'max_bytes' and e.kind == '__builtin__/str' and e.path == [ '__builtin__/list', '__builtin__/dict' ] )
+        self.assertRaises( genosha.GenoshaBudgetExceeded, genosha.marshal, range( 1000 ), deadline = 0 )
+        packed = [ array.array( 'd', [ 1.0 ] * 1000 ), bytearray( 10000 ), [ 1.5 ] * 1000 ] + ( [ genosha.numpy.zeros( 1000 ) ] if genosha.numpy else [] )
+        for value in packed :
+            options = { 'packed' : True } if type( value ) is list else {}
+            try :
+                genosha.marshal( [ value ], max_bytes = 1000, **options )
+                assert( False )
+            except genosha.GenoshaBudgetExceeded, e :
+                assert( e.budget == 'max_bytes' and e.path == [ '__builtin__/list' ] )
+            genosha.marshal( [ value ], max_bytes = 20000, **options )
+        nested = None
+        for i in range( 100 ) :
+            nested = ( i, nested )
+        self.assertRaises( genosha.GenoshaBudgetExceeded, genosha.marshal, nested, max_depth = 90 )
+        for data in ( [ head ], nested ) :
+            expected = repr( genosha.marshal( data ) )
+            assert( repr( genosha.marshal( data, max_objects = 1000, max_bytes = 1 << 20, max_depth = 1000, deadline = 60 ) ) == expected )
+            assert( repr( genosha.marshal( data, max_depth = 1000, stats = True ) ) == expected )
+
+    def testThreads ( self ) :
+        """Ensure encoders and decoders in several threads, sharing caches as they are cleared, agree."""
+        data = [ genoshatest.Test_A(), genoshatest.Test_B(), genoshatest.Test_C1(), genoshatest.Test_Outer.Test_Inner() ]
+        expected = repr( genosha.unmarshal( genosha.marshal( data ) ) )
+        results = []
+        def run () :
+            for i in range( 50 ) :
+                results.append( repr( genosha.unmarshal( genosha.marshal( data ) ) ) )
+                if i % 10 == 0 :
+                    genosha.clear_caches()
+        threads = [ threading.Thread( target = run ) for i in range( 4 ) ]
+        for thread in threads :
+            thread.start()
+        for thread in threads :
+            thread.join()
+        assert( results == [ expected ] * 200 )
+
+class GenoshaStackedTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = genosha.marshal
+        self.unmarshal = self._unmarshal
+        self.long = long
+        self.unicode = unicode
+
+    def _unmarshal ( self, marshalled ) :
+        # every record converted on the explicit stack, functions and modules included.
+        decoder = GenoshaDecoder()
+        decoder.max_nesting = 0
+        return decoder.unmarshal( marshalled )
+
+class GenoshaColumnarTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : genosha.marshal( o, columnar = True )
+        self.unmarshal = genosha.unmarshal
+        self.long = long
+        self.unicode = unicode
+
+    def testBlocks ( self ) :
+        """Ensure runs of instances with the same fields are gathered into columnar blocks."""
+        data = [ genoshatest.Test_A() for i in range( 5 ) ]
+        data[4].extra = data[0]
+        marshalled = self.marshal( data )
+        assert( [ out.oid for out in marshalled[1] if out.type.endswith( 'Test_A' ) ] == [ [ 1, 2, 3, 4 ], 5 ] )
+        assert( [ obj.id for obj in self.unmarshal( marshalled ) ] == [ obj.id for obj in data ] )
+
+class GenoshaBudgetTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : genosha.marshal( o, max_objects = 1 << 20, max_bytes = 1 << 30, max_depth = 1 << 20, deadline = 600 )
+        self.unmarshal = genosha.unmarshal
+        self.long = long
+        self.unicode = unicode
+
+class GenoshaLazyTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = genosha.marshal
+        self.unmarshal = lambda o : genosha.unmarshal( o, lazy = True )
+        self.long = long
+        self.unicode = unicode
+
+    def testLazy ( self ) :
+        """Ensure objects are made and populated only once they are used, keeping identity and cycles."""
+        head = genoshatest.Test_A()
+        node = head
+        for i in range( 100 ) :
+            node.next = genoshatest.Test_A()
+            node = node.next
+        node.next = head
+        data = [ head, genoshatest.Test_B(), ( head, ) ]
+        for marshalled in ( genosha.marshal( data ), genosha.marshal( data, compact = True ), genosha.marshal( data, columnar = True ) ) :
+            decoder = GenoshaDecoder( lazy = True )
+            result = decoder.unmarshal( marshalled )
+            assert( len( decoder.objects ) < 10 and len( decoder.waiting ) == 2 and type( result[0] ) is not genoshatest.Test_A )
+            assert( isinstance( result[0], genoshatest.Test_A ) and result[2][0] is result[0] )
+            assert( result[0].id == head.id and type( result[0] ) is genoshatest.Test_A and len( decoder.waiting ) == 2 )
+            node = result[0]
+            for i in range( 101 ) :
+                node = node.next
+            assert( node is result[0] and len( decoder.waiting ) == 1 )
+            result[1].foo = 'baz'
+            assert( result[1].foo == 'baz' and result[1].a.id == data[1].a.id and not decoder.waiting )
+        self.assertRaises( ValueError, decoder.apply_delta, GenoshaEncoder().marshal_delta( data ) )
+
+    def testLazyThreads ( self ) :
+        """Ensure instances used by several threads at once are seen only once populated."""
+        errors = []
+        def use ( objs ) :
+            for obj in objs :
+                try :
+                    assert( obj.a299 == 'a299' and obj.a0 == 'a0' )
+                except Exception, e :
+                    errors.append( e )
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval( 1 )
+        try :
+            for attempt in range( 5 ) :
+                decoder = GenoshaDecoder( lazy = True )
+                objs = decoder.unmarshal( genosha.marshal( [ Wide() for i in range( 30 ) ] ) )
+                threads = [ threading.Thread( target = use, args = ( objs, ) ) for i in range( 8 ) ]
+                for thread in threads :
+                    thread.start()
+                for thread in threads :
+                    thread.join()
+                assert( not decoder.waiting and all( type( obj ) is Wide for obj in objs ) )
+        finally :
+            sys.setcheckinterval( interval )
+        assert( not errors )
+
+    def testLazyFailed ( self ) :
+        """Ensure an instance whose populating fails is populated again when next used."""
+        obj = Flaky()
+        obj.x = 1
+        decoder = GenoshaDecoder( lazy = True )
+        result = decoder.unmarshal( genosha.marshal( [ obj ] ) )
+        Flaky.failing = True
+        try :
+            self.assertRaises( RuntimeError, getattr, result[0], 'x' )
+        finally :
+            Flaky.failing = False
+        assert( len( decoder.waiting ) == 1 and result[0].x == 1 and type( result[0] ) is Flaky and not decoder.waiting )
+
+    def testLazyReleased ( self ) :
+        """Ensure marshalling what a lazy decoder made again does not keep the decoder alive."""
+        decoder = GenoshaDecoder( lazy = True )
+        result = decoder.unmarshal( genosha.marshal( [ genoshatest.Test_A(), genoshatest.Test_B() ] ) )
+        assert( type( result[1] ) is not genoshatest.Test_B )
+        assert( repr( genosha.unmarshal( genosha.marshal( result ) ) ) == repr( result ) )
+        released = weakref.ref( decoder )
+        del decoder, result
+        gc.collect()
+        assert( released() is None )
+
+class GenoshaUnorderedTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = genosha.marshal
+        # the records are read last first, every reference among them pointing forward.
+        self.unmarshal = lambda m : genosha.unmarshal( [ m[0], m[1][::-1] ] + m[2:], ordered = False )
+        self.long = long
+        self.unicode = unicode
+
+    def testUnordered ( self ) :
+        """Ensure records in any order are accepted only when asked for, immutables made after what they refer to."""
+        head = genoshatest.Test_A()
+        head.next = ( head, frozenset( [ ( 1, head ) ] ) )
+        marshalled = genosha.marshal( [ head, head.next ] )
+        self.assertRaises( ValueError, genosha.unmarshal, [ marshalled[0], marshalled[1][::-1] ] + marshalled[2:] )
+        for records in ( marshalled[1][::-1], marshalled[1][1:] + marshalled[1][:1] ) :
+            result = genosha.unmarshal( [ marshalled[0], records ] + marshalled[2:], ordered = False )
+            assert( result[0].next is result[1] and result[1][0] is result[0] and list( result[1][1] )[0][1] is result[0] )
+
+class GenoshaCloneTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        # nothing is marshalled apart; clone does both at once.
+        self.marshal = lambda o : o
+        self.unmarshal = genosha.clone
+        self.long = long
+        self.unicode = unicode
+
+    def testClone ( self ) :
+        """Ensure a clone is a copy of the whole graph, sharing only what marshalling would."""
+        head = genoshatest.Test_A()
+        head.next = [ head, ( head, genoshatest.Test_A ), "x" * 20, "x" * 20 ]
+        for options in ( {}, { 'columnar' : True }, { 'interned' : True, 'merged' : True } ) :
+            copy = genosha.clone( head, **options )
+            assert( copy is not head and copy.next is not head.next and copy.id == head.id )
+            assert( copy.next[0] is copy and copy.next[1][0] is copy and copy.next[1][1] is genoshatest.Test_A and copy.next[3] == "x" * 20 )
+        self.assertRaises( ValueError, genosha.clone, head, max_objects = 10 )
+
+    def testCloneRules ( self ) :
+        """Ensure a clone is made by the rules of marshalling and unmarshalling, without records."""
+        pair = ( 1, ( 2.5, u"x" ) )
+        data = [ pair, ( 1, ( 2.5, u"x" ) ), Point( 3, 4 ), Celsius( 1.5 ), 2 + 3j, array.array( 'i', [ 1, 2 ] ), self.clone_deep( 2000 ) ]
+        class Recorded ( genosha.GenoshaObject ) :
+            made = 0
+            def __init__ ( self, **kwargs ) :
+                Recorded.made += 1
+                genosha.GenoshaObject.__init__( self, **kwargs )
+        copy = genosha.GenoshaCloner( object_hook = Recorded ).clone( data )
+        assert( Recorded.made == 0 and copy[0] == pair and copy[0] is not pair and copy[1] is not copy[0] )
+        assert( ( copy[2].x, copy[2].y ) == ( 3, 4 ) and type( copy[3] ) is Celsius and copy[4] == 2 + 3j and copy[5] == data[5] )
+        node, depth = copy[6], 0
+        while node :
+            node, depth = node[0], depth + 1
+        assert( depth == 2000 )
+        merged = genosha.clone( data, merged = True )
+        assert( merged[1] is merged[0] and merged[0] == pair )
+        projected = genoshatest.Test_A()
+        projected.cache = 'stale'
+        genosha.project( genoshatest.Test_A, exclude = [ 'cache' ], defaults = { 'cache' : None } )
+        try :
+            assert( not hasattr( genosha.clone( projected ), 'cache' ) and genosha.clone( projected, defaults = True ).cache is None )
+        finally :
+            del genosha._projections[genoshatest.Test_A]
+            genosha.clear_caches()
+
+    def clone_deep ( self, depth ) :
+        nested = ()
+        for i in range( depth ) :
+            nested = ( nested, i )
+        return nested
+
+class GenoshaCompactTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : genosha.marshal( o, compact = True )
+        self.unmarshal = genosha.unmarshal
+        self.long = long
+        self.unicode = unicode
+
+    def testTable ( self ) :
+        """Ensure a table holds the same records as the list of them, whatever their shape."""
+        data = [ genoshatest.Test_A() for i in range( 3 ) ] + [ ( 1, [ 2 ] ), { 'k' : set( [ 3 ] ) }, genoshatest.Test_A().__repr__, genoshatest, genoshatest.Test_A ]
+        marshalled = self.marshal( data )
+        assert( type( marshalled[1] ) is genosha.GenoshaTable )
+        assert( repr( list( marshalled[1] ) ) == repr( genosha.marshal( data )[1] ) )
+        blocks = genosha.marshal( data, compact = True, columnar = True )
+        assert( repr( list( blocks[1] ) ) == repr( genosha.marshal( data, columnar = True )[1] ) )
+        for marshalled in ( marshalled, blocks ) :
+            copy = self.unmarshal( marshalled )
+            assert( [ obj.id for obj in copy[:3] ] == [ obj.id for obj in data[:3] ] and copy[3:5] == data[3:5] and copy[6:] == data[6:] )
+        encoder, decoder = GenoshaEncoder( compact = True ), GenoshaDecoder()
+        copy = decoder.apply_delta( encoder.marshal_delta( data ) )
+        data[0].id = -1
+        changes = encoder.marshal_delta( data, encoder.snapshot )
+        assert( len( changes[1] ) == 1 and decoder.apply_delta( changes )[0].id == -1 )
+
+class GenoshaInternedTests ( genoshatest.GenoshaInternedTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : genosha.marshal( o, interned = True )
+        self.unmarshal = genosha.unmarshal
+        self.long = long
+        self.unicode = unicode
+
+    def testStringTable ( self ) :
+        """Ensure only long enough strings that recur are put in the string table, each once."""
+        data = [ "a longer string", "short", "short", u"a longer string", "a longer string", "a longer string", "once only string" ]
+        marshalled = self.marshal( data )
+        assert( marshalled[3] == [ "a longer string" ] and type( marshalled[3][0] ) is str )
+        assert( [ type( item ).__name__ for item in marshalled[1][0].items ] == [ 'str', 'str', 'str', 'unicode', 'GenoshaInterned', 'GenoshaInterned', 'str' ] )
+        assert( len( genosha.marshal( data ) ) == 3 )
+
+class GenoshaMergedTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : genosha.marshal( o, merged = True )
+        self.unmarshal = genosha.unmarshal
+        self.long = long
+        self.unicode = unicode
+
+    def testMerging ( self ) :
+        """Ensure equal immutables of the same types all the way down are marshalled, and loaded, as one."""
+        # built from parts, as the compiler makes equal constant tuples one.
+        one, a, ua, zero = 1, "a", u"a", 0.0
+        data = [ ( one, ( a, 2.0 ) ), ( one, ( a, 2.0 ) ), ( one, ( ua, 2.0 ) ), ( 1L, ( a, 2.0 ) ), ( one, ( a, 2 ) )
+                , frozenset( [ ( one, 2 ), 3 ] ), frozenset( [ 3, ( one, 2 ) ] ), complex( 1, 2 ), complex( 1, 2 ), ( [], ), ( [], ), ( zero, ), ( -zero, ) ]
+        marshalled = self.marshal( data )
+        # one list, seven tuples (the fourth shares the first's inner tuple), two frozensets, a complex, two tuples
+        # and two lists, and the two zeros.
+        assert( len( marshalled[1] ) == 1 + 7 + 2 + 1 + 2 * 2 + 2 )
+        result = self.unmarshal( marshalled )
+        assert( result == data and result[0] is result[1] and result[5] is result[6] and result[7] is result[8] )
+        assert( len( set( id( value ) for value in result[:5] ) ) == 4 and result[9] is not result[10] and str( result[12][0] ) == "-0.0" )
+        assert( repr( genosha.unmarshal( genosha.marshal( data ) ) ) == repr( result ) )
+
+    def testDeepValues ( self ) :
+        """Ensure equal immutables nested far deeper than the recursion limit are merged."""
+        def nested () :
+            data = None
+            for i in range( sys.getrecursionlimit() + 100 ) :
+                data = ( i, data )
+            return data
+        first, second = self.unmarshal( self.marshal( [ nested(), nested() ] ) )
+        assert( first is second )
+        for i in reversed( range( sys.getrecursionlimit() + 100 ) ) :
+            assert( first[0] == i )
+            first = first[1]
+        assert( first is None )
+
+class GenoshaPackedTests ( genoshatest.GenoshaPackedTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : genosha.marshal( o, packed = True )
+        self.unmarshal = genosha.unmarshal
+        self.long = long
+        self.unicode = unicode
+
+    def testPacking ( self ) :
+        """Ensure only long enough lists of a single primitive type are packed."""
+        data = [ range( 8 ), range( 7 ), [ 1.0 ] * 8, [ 1, 1.0 ] * 4, [ 1, 2L ] * 4, [ 2 ** 31 ] * 8, [ True ] * 8, [ 'a' ] * 8 ]
+        marshalled = self.marshal( data )
+        items = [ out.items for out in marshalled[1][1:] ]
+        assert( [ getattr( packed, 'format', None ) for packed in items ] == [ '<i4', None, '<f8', None, None, '<i8', '<b1', None ] )
+        assert( self.unmarshal( marshalled ) == data )
+
+if __name__ == "__main__":
+    unittest.main()
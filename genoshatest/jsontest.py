@@ -14,10 +14,10 @@
 #
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
-import time, sys, unittest
+import array, decimal, time, sys, unittest, uuid
 
 import genosha
-from genosha.JSON import dumps, loads
+from genosha.JSON import dumps, loads, marshal
 import genoshatest
 
 __version__ = "0.1"
@@ -30,5 +30,155 @@ class GenoshaJSONTests ( genoshatest.GenoshaTests ) :
         self.long = int
         self.unicode = str
 
+class GenoshaJSONColumnarTests ( genoshatest.DefaultTestCase ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : dumps( o, columnar = True )
+        self.unmarshal = loads
+        self.long = int
+        self.unicode = str
+
+    testInstanceRun = genoshatest.GenoshaTests.__dict__['testInstanceRun']
+
+class GenoshaJSONInternedTests ( genoshatest.DefaultTestCase ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : dumps( o, interned = True )
+        self.unmarshal = loads
+        self.long = int
+        self.unicode = str
+
+    testInternedStrings = genoshatest.GenoshaInternedTests.__dict__['testInternedStrings']
+    testRepeatedStrings = genoshatest.GenoshaTests.__dict__['testRepeatedStrings']
+    testInstanceRun = genoshatest.GenoshaTests.__dict__['testInstanceRun']
+
+class GenoshaJSONStoredTests ( unittest.TestCase ) :
+    # a document written before Decimal and UUID were registered, with them as ordinary records.
+    stored = '["@genosha:1@", [{"@f": {}, "@i": ["<@1@>", "<@2@>", "<@3@>"], "@id": 0, "@t": "__builtin__/list"}, ' \
+        '{"@f": {"_sign": 0, "_exp": -2, "_int": "314", "_is_special": false}, "@id": 1, "@t": "decimal/Decimal"}, ' \
+        '{"@f": {"int": 24197857161011715162171839636988778104}, "@id": 2, "@t": "uuid/UUID"}, ' \
+        '{"@f": {"_sign": 1, "_exp": -1, "_int": "5", "_is_special": false}, "@id": 3, "@t": "decimal/Decimal"}], "<@0@>"]'
+
+    def testStored ( self ) :
+        """Ensure documents written with Decimal and UUID as ordinary records still load."""
+        expected = [ decimal.Decimal( '3.14' ), uuid.UUID( '12345678123456781234567812345678' ), decimal.Decimal( '-0.5' ) ]
+        for options in ( {}, { 'compact' : True }, { 'lazy' : True }, { 'ordered' : False } ) :
+            result = loads( self.stored, **options )
+            assert( result == expected and [ type( obj ) for obj in result ] == [ type( obj ) for obj in expected ] )
+        decoder = genosha.GenoshaDecoder( string_hook = genosha.JSON._json_unescape_string )
+        decoder.max_nesting = 0
+        assert( decoder.unmarshal( genosha.JSON.json.loads( self.stored, object_hook = genosha.JSON._json_to_genosha ) ) == expected )
+        assert( loads( dumps( expected ) ) == expected )
+
+class GenoshaJSONStatsTests ( unittest.TestCase ) :
+    def testSizes ( self ) :
+        """Ensure the sizes of the records' text are gathered with the statistics."""
+        reported = []
+        text = dumps( [ genoshatest.Test_A(), ( 1, 2 ) ], stats = reported.append )
+        sizes = reported[0].sizes
+        assert( sizes['genoshatest/Test_A'] > 0 and sizes['__builtin__/tuple'] > 0 and sum( sizes.values() ) < len( text ) )
+
+class GenoshaJSONBudgetTests ( unittest.TestCase ) :
+    def testBudgets ( self ) :
+        """Ensure budgets given to dumps are applied, and abandon it when exceeded."""
+        data = [ genoshatest.Test_A() for i in range( 10 ) ]
+        assert( dumps( data, max_objects = 100 ) == dumps( data ) )
+        self.assertRaises( genosha.GenoshaBudgetExceeded, dumps, data, max_objects = 5 )
+
+class GenoshaJSONProjectionTests ( unittest.TestCase ) :
+    def testDefaults ( self ) :
+        """Ensure the fields a projection leaves out are filled in by loads when asked."""
+        text = dumps( [ genoshatest.Test_Projected( 5 ) ] )
+        assert( 'squared' not in text and not hasattr( loads( text )[0], 'cache' ) and loads( text, defaults = True )[0].cache == {} )
+
+class GenoshaJSONLazyTests ( genoshatest.DefaultTestCase ) :
+    def setUp ( self ) :
+        self.marshal = dumps
+        self.unmarshal = lambda s : loads( s, lazy = True )
+        self.long = int
+        self.unicode = str
+
+    testObjectWithCycle = genoshatest.GenoshaTests.__dict__['testObjectWithCycle']
+    testInstanceRun = genoshatest.GenoshaTests.__dict__['testInstanceRun']
+    testDeepNesting = genoshatest.GenoshaTests.__dict__['testDeepNesting']
+
+    def testCompact ( self ) :
+        """Ensure a table read by loads is unmarshalled lazily as well."""
+        self.unmarshal = lambda s : loads( s, compact = True, lazy = True )
+        self.testInstanceRun()
+        self.testDeepNesting()
+
+class GenoshaJSONPartialTests ( unittest.TestCase ) :
+    def testPath ( self ) :
+        """Ensure loads converts only the part of the graph at the path given."""
+        text = dumps( { 'config' : genoshatest.Test_B(), '@rest' : [ genoshatest.Test_A(), "@1@" ] } )
+        for compact in ( False, True ) :
+            assert( loads( text, compact = compact, path = 'config.a.data.1.z' ) == '000' )
+            assert( loads( text, compact = compact, path = [ '@rest', 1 ] ) == "@1@" )
+            assert( isinstance( loads( text, compact = compact, path = '@rest.0' ), genoshatest.Test_A ) )
+
+class GenoshaJSONUnorderedTests ( unittest.TestCase ) :
+    def testUnordered ( self ) :
+        """Ensure loads accepts records written in any order when they are not ordered."""
+        data = [ genoshatest.Test_B(), genoshatest.Test_A() ]
+        data[1].next = ( data[0], data[1] )
+        marshalled = genosha.JSON.json.loads( dumps( data ) )
+        text = genosha.JSON.json.dumps( [ marshalled[0], marshalled[1][::-1] ] + marshalled[2:] )
+        result = loads( text, ordered = False )
+        assert( result[1].next[1] is result[1] and result[1].next[0] is result[0] and result[0].a.id == data[0].a.id )
+
+class GenoshaJSONDirectTests ( unittest.TestCase ) :
+    def testDirect ( self ) :
+        """Ensure records written directly, a batch at a time, are the text the default hook gives."""
+        data = [ genoshatest.Test_A() for i in range( 600 ) ] + [ genoshatest.Test_B(), array.array( 'd', [ 1.5 ] ), "<text" ]
+        hooked = genosha.JSON.json.JSONEncoder
+        for options in ( {}, { 'columnar' : True }, { 'interned' : True, 'packed' : True }, { 'separators' : ( ',', ':' ) } ) :
+            text = dumps( data, **options )
+            assert( text == dumps( data, cls = hooked, **options ) )
+            assert( loads( text )[600].foo == 'bar' )
+        assert( genosha.JSON._BATCH < 600 ) # more than one batch
+
+    def testIndent ( self ) :
+        """Ensure indented documents are laid out as a whole, as :mod:`json` lays them out."""
+        data = [ genoshatest.Test_A(), genoshatest.Test_B(), array.array( 'd', [ 1.5 ] ), "<text" ]
+        for options in ( {}, { 'interned' : True } ) :
+            text = dumps( data, indent = 2, **options )
+            assert( text == genosha.JSON.json.dumps( marshal( data, **options ), indent = 2, default = genosha.JSON._genosha_to_json ) )
+            assert( loads( text )[1].foo == 'bar' )
+
+class GenoshaJSONEstimateTests ( unittest.TestCase ) :
+    def testEstimate ( self ) :
+        """Ensure the estimated size of the JSON text is close to the real one."""
+        data = [ genoshatest.Test_A() for i in range( 50 ) ] + [ { 'k' : ( i, i / 3.0 ) } for i in range( 50 ) ]
+        assert( abs( genosha.estimate( data, 'json' ).size - len( dumps( data ) ) ) < len( dumps( data ) ) * 0.1 )
+
+class GenoshaJSONCompactTests ( genoshatest.DefaultTestCase ) :
+    def setUp ( self ) :
+        self.marshal = dumps
+        self.unmarshal = lambda s : loads( s, compact = True )
+        self.long = int
+        self.unicode = str
+
+    testObjectWithCycle = genoshatest.GenoshaTests.__dict__['testObjectWithCycle']
+    testInstanceRun = genoshatest.GenoshaTests.__dict__['testInstanceRun']
+    testModule = genoshatest.GenoshaTests.__dict__['testModule']
+
+    def testColumnar ( self ) :
+        """Ensure columnar blocks are read into the table as well."""
+        self.marshal = lambda o : dumps( o, columnar = True )
+        self.testInstanceRun()
+
+    def testMisplacedObjects ( self ) :
+        """Ensure objects outside the list of them are refused."""
+        self.assertRaises( ValueError, loads, '["@genosha:1@", [], {"@t": "genoshatest/Test_A", "@id": 0}]', compact = True )
+
+class GenoshaJSONPackedTests ( genoshatest.DefaultTestCase ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : dumps( o, packed = True )
+        self.unmarshal = loads
+        self.long = int
+        self.unicode = str
+
+    testPackedValues = genoshatest.GenoshaPackedTests.__dict__['testPackedValues']
+    testPrimitiveLists = genoshatest.GenoshaTests.__dict__['testPrimitiveLists']
+
 if __name__ == "__main__":
     unittest.main()
@@ -37,5 +37,31 @@ class GenoshaSQLTests ( genoshatest.GenoshaTests ) :
         if self.conn :
             self.conn.close()
 
+    def testPath ( self ) :
+        """Test that only the part of the graph at the path given is loaded."""
+        i = self.marshal( { 'config' : genoshatest.Test_B(), 'rest' : [ genoshatest.Test_A() ] } )
+        assert( loadc( i, self.conn, path = 'config.a.data.1.z' ) == '000' )
+        assert( isinstance( loadc( i, self.conn, compact = True, path = 'rest.0' ), genoshatest.Test_A ) )
+
+    def testColumnar ( self ) :
+        """Test that the columnar option is refused before anything is stored."""
+        self.assertRaises( ValueError, dumpc, [ genoshatest.Test_A(), genoshatest.Test_A() ], self.conn, columnar = True )
+        assert( self.conn.execute( 'SELECT COUNT(*) FROM ITEM' ).fetchone()[0] == 0 )
+
+class GenoshaSQLPackedTests ( GenoshaSQLTests, genoshatest.GenoshaPackedTests ) :
+    def setUp ( self ) :
+        GenoshaSQLTests.setUp( self )
+        self.marshal = lambda o : dumpc( o, self.conn, packed = True )
+
+class GenoshaSQLInternedTests ( GenoshaSQLTests, genoshatest.GenoshaInternedTests ) :
+    def setUp ( self ) :
+        GenoshaSQLTests.setUp( self )
+        self.marshal = lambda o : dumpc( o, self.conn, interned = True )
+
+class GenoshaSQLCompactTests ( GenoshaSQLTests ) :
+    def setUp ( self ) :
+        GenoshaSQLTests.setUp( self )
+        self.unmarshal = lambda o : loadc( o, self.conn, compact = True )
+
 if __name__ == "__main__":
     unittest.main()
@@ -16,6 +16,8 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import time, sys, unittest
 
+import genosha
+
 from genosha.XML import dumps, loads
 import genoshatest
 
@@ -29,5 +31,54 @@ class GenoshaXMLTests ( genoshatest.GenoshaTests ) :
         self.long = long
         self.unicode = unicode
 
+class GenoshaXMLColumnarTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : dumps( o, columnar = True )
+        self.unmarshal = loads
+        self.long = long
+        self.unicode = unicode
+
+class GenoshaXMLLazyTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = dumps
+        self.unmarshal = lambda s : loads( s, lazy = True )
+        self.long = long
+        self.unicode = unicode
+
+class GenoshaXMLPartialTests ( unittest.TestCase ) :
+    def testPath ( self ) :
+        """Ensure loads converts only the part of the graph at the path given."""
+        text = dumps( { 'config' : genoshatest.Test_B(), 'rest' : [ genoshatest.Test_A() ] } )
+        for compact in ( False, True ) :
+            assert( loads( text, compact = compact, path = 'config.a.data.1.z' ) == '000' )
+            assert( isinstance( loads( text, compact = compact, path = 'rest.0' ), genoshatest.Test_A ) )
+
+class GenoshaXMLEstimateTests ( unittest.TestCase ) :
+    def testEstimate ( self ) :
+        """Ensure the estimated size of the XML text is close to the real one."""
+        data = [ genoshatest.Test_A() for i in range( 50 ) ] + [ { 'k' : ( i, i / 3.0 ) } for i in range( 50 ) ]
+        assert( abs( genosha.estimate( data, 'xml' ).size - len( dumps( data ) ) ) < len( dumps( data ) ) * 0.1 )
+
+class GenoshaXMLCompactTests ( genoshatest.GenoshaTests ) :
+    def setUp ( self ) :
+        self.marshal = dumps
+        self.unmarshal = lambda s : loads( s, compact = True )
+        self.long = long
+        self.unicode = unicode
+
+class GenoshaXMLInternedTests ( genoshatest.GenoshaInternedTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : dumps( o, interned = True )
+        self.unmarshal = loads
+        self.long = long
+        self.unicode = unicode
+
+class GenoshaXMLPackedTests ( genoshatest.GenoshaPackedTests ) :
+    def setUp ( self ) :
+        self.marshal = lambda o : dumps( o, packed = True )
+        self.unmarshal = loads
+        self.long = long
+        self.unicode = unicode
+
 if __name__ == "__main__":
     unittest.main()